@@ -11,7 +11,7 @@ Environment:
     GOOGLE_API_KEY  - Google AI Studio API key
     DEAD_DROP_URL   - Dead drop MCP server URL (default: http://localhost:9400/mcp)
     AGENT_NAME      - Agent name to register as (default: gemini)
-    POLL_INTERVAL   - Inbox check interval in seconds (default: 10)
+    WAIT_TIMEOUT    - Longest a wait_for_messages call stays open, in seconds (default: 60)
 """
 
 import asyncio
@@ -33,7 +33,7 @@ DEAD_DROP_URL = os.environ.get("DEAD_DROP_URL", "http://localhost:9400/mcp")
 AGENT_NAME = os.environ.get("AGENT_NAME", "gemini")
 AGENT_ROLE = "researcher"
 AGENT_DESC = "Gemini agent connected via dead-drop MCP"
-POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "10"))
+WAIT_TIMEOUT = int(os.environ.get("WAIT_TIMEOUT", "60"))
 MODEL = "gemini-2.5-flash"
 
 SYSTEM_PROMPT = """You are {name}, a Gemini-powered agent in a multi-agent team.
@@ -80,18 +80,20 @@ async def manual_register(session):
     return result
 
 
-async def manual_check_inbox(session):
-    """Check inbox via direct MCP tool call. Returns list of messages."""
-    result = await session.call_tool("check_inbox", {
+async def manual_wait_for_messages(session):
+    """Long-poll the inbox via direct MCP tool call. Returns list of messages
+    (one page) as soon as any arrive, or an empty list after WAIT_TIMEOUT."""
+    result = await session.call_tool("wait_for_messages", {
         "agent_name": AGENT_NAME,
+        "timeout": WAIT_TIMEOUT,
     })
     # Parse the result text content
     if result.content:
         for block in result.content:
             if hasattr(block, "text"):
                 try:
-                    return json.loads(block.text)
-                except (json.JSONDecodeError, TypeError):
+                    return json.loads(block.text)["messages"]
+                except (json.JSONDecodeError, TypeError, KeyError):
                     return block.text
     return []
 
@@ -167,7 +169,7 @@ async def handle_message_with_gemini(client, session, message):
 # =============================================================================
 
 async def run_agent():
-    """Main agent loop: register, poll inbox, handle messages with Gemini."""
+    """Main agent loop: register, long-poll the inbox, handle messages with Gemini."""
 
     # Validate API key
     api_key = os.environ.get("GOOGLE_API_KEY")
@@ -193,17 +195,17 @@ async def run_agent():
             log("Registered as '{}' (role: {})".format(AGENT_NAME, AGENT_ROLE))
 
             # Set status
-            await manual_set_status(session, "online, polling every {}s".format(POLL_INTERVAL))
+            await manual_set_status(session, "online, waiting for messages")
 
-            log("Entering main loop (poll every {}s)...".format(POLL_INTERVAL))
+            log("Entering main loop (long-poll, {}s per wait)...".format(WAIT_TIMEOUT))
 
             consecutive_errors = 0
             max_consecutive_errors = 5
 
             while True:
                 try:
-                    # Check inbox
-                    messages = await manual_check_inbox(session)
+                    # Parks server-side until mail arrives or WAIT_TIMEOUT passes
+                    messages = await manual_wait_for_messages(session)
 
                     if isinstance(messages, list) and len(messages) > 0:
                         log("{} new message(s)".format(len(messages)))
@@ -212,7 +214,7 @@ async def run_agent():
                         for msg in messages:
                             await handle_message_with_gemini(client, session, msg)
 
-                        await manual_set_status(session, "online, polling every {}s".format(POLL_INTERVAL))
+                        await manual_set_status(session, "online, waiting for messages")
 
                     consecutive_errors = 0
 
@@ -227,10 +229,7 @@ async def run_agent():
                         break
 
                     # Back off on errors
-                    await asyncio.sleep(min(POLL_INTERVAL * consecutive_errors, 60))
-                    continue
-
-                await asyncio.sleep(POLL_INTERVAL)
+                    await asyncio.sleep(min(10 * consecutive_errors, 60))
 
 
 # =============================================================================
@@ -242,7 +241,7 @@ def main():
     log("  Model: {}".format(MODEL))
     log("  Dead Drop: {}".format(DEAD_DROP_URL))
     log("  Agent: {} ({})".format(AGENT_NAME, AGENT_ROLE))
-    log("  Poll interval: {}s".format(POLL_INTERVAL))
+    log("  Wait timeout: {}s".format(WAIT_TIMEOUT))
 
     try:
         asyncio.run(run_agent())
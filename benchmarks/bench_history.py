@@ -0,0 +1,133 @@
+"""get_history latency against room size.
+
+Builds rooms of each size with the current schema — mail between 20
+agents, a third of it on tasks, with occasional CCs and broadcasts — and
+times get_history's access patterns: the latest page, a page deep in the
+past (before_id) and forward from the middle (after_id), one participant,
+one task thread, and time ranges. The old queries — ORDER BY timestamp
+over the messages view, with the same filters — are timed for comparison.
+Each figure is the median of --repeat calls.
+
+Usage:
+    python benchmarks/bench_history.py [--sizes 100000,1000000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+logging.disable(logging.WARNING)
+_tmp = tempfile.mkdtemp(prefix="dead-drop-bench-")
+os.environ["DEAD_DROP_DB_PATH"] = os.path.join(_tmp, "messages.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dead_drop import server  # noqa: E402
+from dead_drop.db import ConnectionPool, DBExecutor  # noqa: E402
+from dead_drop.migrations import migrate  # noqa: E402
+
+AGENTS = 20
+START = datetime.datetime(2026, 1, 1)
+
+
+def _timestamp(i):
+    return (START + datetime.timedelta(seconds=i)).isoformat()
+
+
+def _build(path, messages):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrate(conn)
+    conn.executemany("INSERT INTO agents (name, registered_at, last_seen) VALUES (?, ?, ?)",
+                     [(f"agent-{a}", _timestamp(0), _timestamp(0)) for a in range(AGENTS)])
+    bodies, deliveries = [], []
+    delivery_id = 0
+    for i in range(messages):
+        sender = f"agent-{i % AGENTS}"
+        task = f"TASK-{i // 30 % 3000:04d}" if i % 3 == 0 else None
+        if delivery_id >= messages:
+            break
+        bodies.append((i + 1, sender, f"message {i} " + "lorem ipsum " * 10, _timestamp(i), task))
+        recipients = ["all"] if i % 500 == 0 else [f"agent-{(i * 7 + 1) % AGENTS}"]
+        if i % 10 == 0:
+            recipients.append(f"agent-{(i * 7 + 2) % AGENTS}")
+        for to in recipients:
+            delivery_id += 1
+            deliveries.append((delivery_id, i + 1, sender, to))
+    conn.executemany("INSERT INTO message_bodies (id, from_agent, content, timestamp, task_id) VALUES (?, ?, ?, ?, ?)", bodies)
+    conn.executemany("INSERT INTO deliveries (id, body_id, from_agent, to_agent, read_flag) VALUES (?, ?, ?, ?, 1)", deliveries)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return len(bodies)
+
+
+async def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100000,1000000")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    print(f"db dir: {_tmp}  page: 20 messages  median of {args.repeat}")
+    header = f"{'query':<28}" + "".join(f"{n:>14,}" for n in sizes)
+    print(header)
+    results = {}
+    for n in sizes:
+        path = os.path.join(_tmp, f"history-{n}.db")
+        bodies = _build(path, n)
+        server._pool = ConnectionPool(path, readers=1)
+        server._db = DBExecutor(server._pool, inline=True)
+        mid = n // 2
+        window = (_timestamp(bodies // 3), _timestamp(bodies // 3 + 600))
+
+        def call(**kwargs):
+            return lambda: server.get_history(count=20, **kwargs)
+
+        def old(sql, *params):
+            async def run():
+                with server._pool.reader() as conn:
+                    conn.execute(sql, params).fetchall()
+            return run
+
+        cases = [
+            ("old: latest", old("SELECT * FROM messages ORDER BY timestamp DESC LIMIT 20")),
+            ("old: agent", old("SELECT * FROM messages WHERE from_agent = ? OR to_agent = ? "
+                               "ORDER BY timestamp DESC LIMIT 20", "agent-3", "agent-3")),
+            ("old: since", old("SELECT * FROM messages WHERE timestamp >= ? ORDER BY timestamp DESC LIMIT 20", window[0])),
+            ("latest", call()),
+            ("before_id (middle)", call(before_id=mid)),
+            ("after_id (middle)", call(after_id=mid)),
+            ("agent", call(agent="agent-3")),
+            ("agent + before_id", call(agent="agent-3", before_id=mid)),
+            ("task_id", call(task_id="TASK-1500")),
+            ("since", call(since=window[0])),
+            ("until", call(until=window[1])),
+            ("since/until (10 min)", call(since=window[0], until=window[1])),
+        ]
+        for name, fn in cases:
+            results.setdefault(name, []).append(asyncio.run(_median_ms(fn, args.repeat)))
+        server._db.shutdown()
+        server._pool.close()
+
+    for name, timings in results.items():
+        print(f"{name:<28}" + "".join(f"{ms:>11.2f} ms" for ms in timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""send() throughput with and without group commit.
+
+Drives N agents sending to one sink agent as fast as the server accepts
+them, once with every write committed on its own (batch_max=1) and once
+with the writer grouping writes into shared transactions. Reports sends/sec
+and sends per CPU-second — the number that matters in a room container
+capped at a fraction of a core.
+
+Usage:
+    python benchmarks/bench_send_throughput.py [--seconds 5] [--agents 16]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+logging.disable(logging.WARNING)
+_tmp = tempfile.mkdtemp(prefix="dead-drop-bench-")
+os.environ["DEAD_DROP_DB_PATH"] = os.path.join(_tmp, "messages.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dead_drop import server  # noqa: E402
+from dead_drop.db import ConnectionPool, DBExecutor  # noqa: E402
+
+
+class _Session:
+    async def send_tool_list_changed(self):
+        pass
+
+    async def send_log_message(self, **kwargs):
+        pass
+
+
+class _Ctx:
+    def __init__(self):
+        self.session = _Session()
+
+
+async def _run(seconds, agents):
+    await server.register("bench-sink", _Ctx(), role="coder")
+    sent = 0
+    deadline = time.perf_counter() + seconds
+
+    async def sender(i):
+        nonlocal sent
+        name, ctx = f"bench-s{i}", _Ctx()
+        await server.register(name, ctx, role="coder")
+        while time.perf_counter() < deadline:
+            result = await server.send(name, "bench-sink", "bench", ctx)
+            if result.startswith("Message sent"):
+                sent += 1
+
+    await asyncio.gather(*(sender(i) for i in range(agents)))
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--agents", type=int, default=16)
+    parser.add_argument("--window-ms", type=float, default=server.WRITE_BATCH_MS)
+    args = parser.parse_args()
+
+    print(f"db dir: {_tmp}  agents: {args.agents}  window: {args.window_ms}ms")
+    print(f"{'mode':<14} {'sends':>8} {'sends/s':>9} {'sends/cpu-s':>12} {'avg batch':>10}")
+    for mode, batch_max in (("commit-each", 1), ("group-commit", server.WRITE_BATCH_MAX)):
+        # Fresh database per mode so both start from the same table sizes.
+        server._pool = ConnectionPool(os.path.join(_tmp, f"{mode}.db"), readers=server.DB_READERS)
+        server.init_db()
+        server._db = DBExecutor(server._pool, batch_window_ms=args.window_ms, batch_max=batch_max)
+        wall, cpu = time.perf_counter(), time.process_time()
+        sent = asyncio.run(_run(args.seconds, args.agents))
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        stats = server._db.stats()
+        server._db.shutdown()
+        print(f"{mode:<14} {sent:>8} {sent / wall:>9.0f} {sent / cpu:>12.0f} {stats['avg_batch']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Schema-migration cost at startup on a large room database.
+
+Builds a database with N messages, then times migrate() twice:
+    legacy    first start on an unversioned (user_version 0) database —
+              runs every migration, including building the indexes
+    current   a restart on an up-to-date database: one pragma read
+and shows how the unread-count query in send() performs with the indexes.
+
+Usage:
+    python benchmarks/bench_startup.py [--messages 1000000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dead_drop.migrations import MIGRATIONS, migrate  # noqa: E402
+
+
+def _build(path, messages, agents=20):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    MIGRATIONS[0](conn.cursor())  # base tables only, as an old server left them
+    rows = (
+        (f"agent-{i % agents}", "all" if i % 50 == 0 else f"agent-{(i + 1) % agents}",
+         f"message {i}", f"2026-01-01T00:00:{i % 60:02d}.{i:09d}", 1 if i < messages - 100 else 0)
+        for i in range(messages)
+    )
+    conn.executemany(
+        "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def _time(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="dead-drop-bench-"), "messages.db")
+    print(f"building {args.messages:,} messages in {path} ...")
+    _build(path, args.messages)
+
+    unread = "SELECT COUNT(*) FROM messages WHERE to_agent IN (?, ?) AND read_flag = 0"
+    conn = sqlite3.connect(path)
+    ms, _ = _time(lambda: conn.execute(unread, ("agent-3", "t/agent-3")).fetchone())
+    print(f"unread count, no indexes:   {ms:9.2f} ms")
+
+    ms, applied = _time(lambda: migrate(conn))
+    print(f"migrate, legacy database:   {ms:9.2f} ms  (applied {applied})")
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    ms, applied = _time(lambda: migrate(conn))
+    print(f"migrate, current database:  {ms:9.2f} ms  (applied {applied})")
+    ms, _ = _time(lambda: conn.execute(unread, ("agent-3", "t/agent-3")).fetchone())
+    print(f"unread count, indexed:      {ms:9.2f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
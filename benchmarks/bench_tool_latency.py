@@ -0,0 +1,150 @@
+"""Tool-call latency under write-lock contention: blocking vs off-loop SQLite.
+
+Starts the room server module against a scratch database, then drives a mix
+of concurrent agents (ping/send writers, who/get_history readers) while an
+outside connection keeps grabbing the write lock with BEGIN IMMEDIATE — the
+same thing a second process or a long migration does to a live room.
+
+Two modes are compared by swapping server._db:
+    inline    DBExecutor(inline=True): SQLite runs on the event loop (before)
+    threaded  DBExecutor(): SQLite runs on worker threads (after)
+
+Each client issues calls on a fixed schedule and latency is measured from
+the scheduled time, so calls delayed by a stalled loop count against it.
+Besides per-tool p50/p99, a heartbeat task measures event-loop stall: how
+late a 10ms sleep wakes up. With inline SQLite one blocked writer stalls
+every session; threaded, only the writers queue behind the lock.
+
+Usage:
+    python benchmarks/bench_tool_latency.py [--seconds 5] [--agents 8]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+logging.disable(logging.WARNING)
+_tmp = tempfile.mkdtemp(prefix="dead-drop-bench-")
+os.environ["DEAD_DROP_DB_PATH"] = os.path.join(_tmp, "messages.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dead_drop import server  # noqa: E402
+from dead_drop.db import DBExecutor  # noqa: E402
+
+
+class _Session:
+    async def send_tool_list_changed(self):
+        pass
+
+    async def send_log_message(self, **kwargs):
+        pass
+
+
+class _Ctx:
+    def __init__(self):
+        self.session = _Session()
+
+
+def _lock_holder(db_path, stop, hold_s, every_s):
+    """Periodically hold the SQLite write lock from outside the server."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    while not stop.is_set():
+        time.sleep(every_s)
+        conn.execute("BEGIN IMMEDIATE")
+        time.sleep(hold_s)
+        conn.execute("COMMIT")
+    conn.close()
+
+
+def _pct(samples, p):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def _run(seconds, agents, interval):
+    latencies = {"ping": [], "send": [], "who": [], "get_history": []}
+    stalls = []
+    deadline = time.perf_counter() + seconds
+
+    async def heartbeat():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stalls.append((time.perf_counter() - started - 0.01) * 1000)
+
+    async def paced(calls):
+        # Open loop: each call is due at a fixed time and its latency counts
+        # from then, so time spent queued behind a stalled loop is included.
+        due = time.perf_counter()
+        while due < deadline:
+            for name, make in calls:
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                await make()
+                latencies[name].append((time.perf_counter() - due) * 1000)
+                due += interval
+
+    async def writer(i):
+        name, ctx = f"bench-w{i}", _Ctx()
+        peer = f"bench-w{(i + 1) % agents}"
+        await server.register(name, ctx, role="coder")
+
+        async def send():
+            await server.check_inbox(name, ctx)
+            await server.send(name, peer, "bench", ctx)
+
+        await paced([("ping", lambda: server.ping(name, ctx)), ("send", send)])
+
+    async def reader():
+        await paced([("who", server.who), ("get_history", lambda: server.get_history(count=20))])
+
+    await asyncio.gather(
+        heartbeat(),
+        *(writer(i) for i in range(agents)),
+        *(reader() for _ in range(agents)),
+    )
+    return latencies, stalls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--agents", type=int, default=8)
+    parser.add_argument("--interval-ms", type=float, default=20.0, help="gap between each client's calls")
+    parser.add_argument("--hold-ms", type=float, default=200.0, help="how long the outside lock is held")
+    parser.add_argument("--every-ms", type=float, default=500.0, help="gap between outside lock grabs")
+    args = parser.parse_args()
+
+    print(f"db: {server.DB_PATH}  agents: {args.agents}  lock: {args.hold_ms:.0f}ms every {args.every_ms:.0f}ms")
+    for mode, executor in (("inline", DBExecutor(server._pool, inline=True)),
+                           ("threaded", DBExecutor(server._pool))):
+        server._db = executor
+        stop = threading.Event()
+        holder = threading.Thread(
+            target=_lock_holder,
+            args=(server.DB_PATH, stop, args.hold_ms / 1000, args.every_ms / 1000),
+            daemon=True,
+        )
+        holder.start()
+        latencies, stalls = asyncio.run(_run(args.seconds, args.agents, args.interval_ms / 1000))
+        stop.set()
+        holder.join()
+        executor.shutdown()
+
+        print(f"\n== {mode} ==")
+        print(f"{'tool':<12} {'calls':>7} {'p50 ms':>9} {'p99 ms':>9}")
+        for tool, samples in latencies.items():
+            print(f"{tool:<12} {len(samples):>7} {statistics.median(samples) if samples else 0:>9.2f} {_pct(samples, 0.99):>9.2f}")
+        print(f"{'loop stall':<12} {len(stalls):>7} {statistics.median(stalls):>9.2f} {_pct(stalls, 0.99):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
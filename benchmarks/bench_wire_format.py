@@ -0,0 +1,123 @@
+"""Response size and encoder CPU per listing tool, pretty vs compact.
+
+Builds the same room three times — agents, tasks, contracts and a backlog
+of messages with auto-CC to the lead — and calls check_inbox, get_history,
+who, list_tasks and list_contracts in each wire mode:
+    pretty          indent=2, every field (the old format)
+    compact         no whitespace, null fields dropped
+    compact+fields  compact, plus a typical fields= projection
+Reports bytes per response and encoder CPU time from dead_drop.wire.stats().
+
+Usage:
+    python benchmarks/bench_wire_format.py [--messages 2000] [--calls 20]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+
+logging.disable(logging.WARNING)
+_tmp = tempfile.mkdtemp(prefix="dead-drop-bench-")
+os.environ["DEAD_DROP_DB_PATH"] = os.path.join(_tmp, "messages.db")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dead_drop import server, wire  # noqa: E402
+from dead_drop.db import ConnectionPool, DBExecutor  # noqa: E402
+
+TOOLS = ["check_inbox", "get_history", "who", "list_tasks", "list_contracts"]
+
+FIELDS = {
+    "check_inbox": "id,from_agent,content",
+    "get_history": "id,from_agent,to_agent,content",
+    "who": "name,role,status,health",
+    "list_tasks": "id,title,status,assigned_to",
+    "list_contracts": "name,type,owner,version",
+}
+
+
+class _Session:
+    async def send_tool_list_changed(self):
+        pass
+
+    async def send_log_message(self, **kwargs):
+        pass
+
+
+class _Ctx:
+    def __init__(self):
+        self.session = _Session()
+
+
+async def _populate(messages):
+    ctx = _Ctx()
+    await server.register("lead", ctx, role="lead", description="runs the room")
+    for i in range(12):
+        await server.register(f"agent-{i}", ctx, role="coder", description=f"worker {i}")
+    for i in range(40):
+        await server.create_task("lead", f"task {i}", ctx, description="do the thing " * 8,
+                                 assigned_to=f"agent-{i % 12}", project="bench")
+    for i in range(15):
+        await server.declare_contract(f"agent-{i % 12}", f"api-{i}", "api_endpoint", "GET /thing -> {id, name}", ctx)
+    # Clear the task notices so the backlog below is all plain mail.
+    for i in range(12):
+        while json.loads(await server.check_inbox(f"agent-{i}", ctx, limit=500))["has_more"]:
+            pass
+    await server.check_inbox("sink", ctx, limit=1)  # registers the session
+    for i in range(messages):
+        await server.send(f"agent-{i % 12}", "sink", f"status update {i}: " + "progress " * 20, ctx)
+
+
+async def _calls(mode, calls):
+    ctx = _Ctx()
+    for _ in range(calls):
+        for tool in TOOLS:
+            fields = FIELDS[tool] if mode == "compact+fields" else ""
+            if tool == "check_inbox":
+                await server.check_inbox("sink", ctx, fields=fields)
+            elif tool == "get_history":
+                await server.get_history(count=50, fields=fields)
+            else:
+                await getattr(server, tool)(fields=fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("pretty", "compact", "compact+fields"):
+        server._pool = ConnectionPool(os.path.join(_tmp, f"{mode}.db"), readers=server.DB_READERS)
+        server.init_db()
+        server._db = DBExecutor(server._pool, inline=True)
+        wire.COMPACT = True
+        asyncio.run(_populate(args.messages))
+        wire.COMPACT = mode != "pretty"
+        before = wire.stats()["tools"]
+        asyncio.run(_calls(mode, args.calls))
+        after = wire.stats()["tools"]
+        results[mode] = {
+            tool: (
+                (after[tool]["bytes"] - before.get(tool, {}).get("bytes", 0)) / args.calls,
+                after[tool]["encode_cpu_ms"] - before.get(tool, {}).get("encode_cpu_ms", 0),
+            )
+            for tool in TOOLS
+        }
+        server._db.shutdown()
+
+    print(f"db dir: {_tmp}  messages: {args.messages}  calls per tool: {args.calls}")
+    print(f"{'tool':<16} {'mode':<16} {'bytes/resp':>11} {'vs pretty':>10} {'encode cpu ms':>14}")
+    for tool in TOOLS:
+        base = results["pretty"][tool][0]
+        for mode, per_tool in results.items():
+            size, cpu = per_tool[tool]
+            print(f"{tool:<16} {mode:<16} {size:>11.0f} {size / base:>9.0%} {cpu:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
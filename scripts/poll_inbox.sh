@@ -11,7 +11,7 @@ echo "Polling inbox for $AGENT_NAME every ${INTERVAL}s..."
 
 while true; do
     DIRECT=$(sqlite3 "$DB_PATH" "SELECT COUNT(*) FROM messages WHERE to_agent = '$AGENT_NAME' AND read_flag = 0;")
-    BROADCAST=$(sqlite3 "$DB_PATH" "SELECT COUNT(*) FROM messages WHERE to_agent = 'all' AND from_agent != '$AGENT_NAME' AND id NOT IN (SELECT message_id FROM broadcast_reads WHERE agent_name = '$AGENT_NAME');")
+    BROADCAST=$(sqlite3 "$DB_PATH" "SELECT COUNT(*) FROM messages WHERE to_agent = 'all' AND from_agent != '$AGENT_NAME' AND id > COALESCE((SELECT last_read_id FROM broadcast_watermarks WHERE agent_name = '$AGENT_NAME'), 0);")
     TOTAL=$((DIRECT + BROADCAST))
 
     if [ "$TOTAL" -gt 0 ]; then
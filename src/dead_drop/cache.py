@@ -0,0 +1,103 @@
+"""Bounded in-process caches for the room server.
+
+Hot read paths (the unread alert pushed after every message, the unread
+banner injected into every tools/list) look agents up far more often than
+the underlying rows change, so the server keeps the answers in memory and
+invalidates them when a write touches the rows they were built from.
+
+Loads race with invalidations: a reader can fetch a value, lose the CPU
+while a writer commits and invalidates, then store its now-stale value.
+lookup() hands out a token on a miss, and put() refuses the value if the
+key was invalidated after that token was issued.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class _Invalidated:
+    """Placeholder left behind by invalidate(); remembers when it happened."""
+
+    __slots__ = ("version",)
+
+    def __init__(self, version):
+        self.version = version
+
+
+class LRUCache:
+    """Thread-safe LRU map with hit/miss counters and race-free loading.
+
+    Usage:
+        hit, value = cache.lookup(key)
+        if not hit:
+            token = value
+            value = load(key)
+            cache.put(key, value, token)
+
+    Holds at most maxsize keys; the least recently used are evicted first.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = max(1, maxsize)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        # Highest invalidation whose placeholder was evicted: tokens older
+        # than this can't be checked against their key any more.
+        self._floor = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "stale_puts": 0}
+
+    def lookup(self, key):
+        """(True, value) on a hit; (False, token) on a miss — pass the token to put()."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not isinstance(entry, _Invalidated):
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, entry
+            self._stats["misses"] += 1
+            return False, self._version
+
+    def put(self, key, value, token=None):
+        """Store value unless key was invalidated since token was issued. Returns whether it was stored."""
+        with self._lock:
+            if token is not None:
+                entry = self._data.get(key)
+                if token < self._floor or (isinstance(entry, _Invalidated) and entry.version > token):
+                    self._stats["stale_puts"] += 1
+                    return False
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._trim()
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._version += 1
+            self._data[key] = _Invalidated(self._version)
+            self._data.move_to_end(key)
+            self._stats["invalidations"] += 1
+            self._trim()
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._floor = self._version
+            self._data.clear()
+
+    def _trim(self):
+        while len(self._data) > self.maxsize:
+            _, entry = self._data.popitem(last=False)
+            if isinstance(entry, _Invalidated):
+                self._floor = max(self._floor, entry.version)
+            else:
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result["size"] = len(self._data)
+        result["maxsize"] = self.maxsize
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = round(result["hits"] / lookups, 3) if lookups else 0.0
+        return result
@@ -0,0 +1,100 @@
+"""Consistency check for the trigger-maintained inbox_counters table.
+
+send's unread gate and the unread alerts read inbox_counters instead of
+counting messages. Triggers keep it current (see migrations v4); this
+module recomputes the same numbers from messages, agents and
+broadcast_watermarks, reports any drift, and can rewrite the table.
+
+Usage:
+    python -m dead_drop.counters ~/.dead-drop/messages.db [--repair]
+
+The room server exposes the same check as the check_inbox_counters tool.
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+
+
+def recompute(conn):
+    """Counters from scratch: {(agent_name, from_agent): (direct_unread, broadcast_unread)}."""
+    expected = {}
+    rows = conn.execute("""
+        SELECT to_agent, from_agent, COUNT(*) FROM messages
+        WHERE to_agent != 'all' AND read_flag = 0
+        GROUP BY to_agent, from_agent
+    """)
+    for agent, sender, n in rows:
+        expected[(agent, sender)] = (n, 0)
+    rows = conn.execute("""
+        SELECT a.name, m.from_agent, COUNT(*) FROM agents a
+        JOIN messages m ON m.to_agent = 'all' AND m.from_agent != a.name
+            AND m.id > COALESCE((SELECT last_read_id FROM broadcast_watermarks w WHERE w.agent_name = a.name), 0)
+        GROUP BY a.name, m.from_agent
+    """)
+    for agent, sender, n in rows:
+        direct, _ = expected.get((agent, sender), (0, 0))
+        expected[(agent, sender)] = (direct, n)
+    return expected
+
+
+def stored(conn):
+    """Non-zero rows of inbox_counters, in the same shape as recompute()."""
+    rows = conn.execute("""
+        SELECT agent_name, from_agent, direct_unread, broadcast_unread FROM inbox_counters
+        WHERE direct_unread != 0 OR broadcast_unread != 0
+    """)
+    return {(agent, sender): (direct, broadcast) for agent, sender, direct, broadcast in rows}
+
+
+def check(conn, repair=False):
+    """Compare inbox_counters with a full recount.
+
+    Returns a list of mismatches, one dict per (agent_name, from_agent) pair.
+    With repair=True the table is rewritten from the recount in the
+    caller's transaction; the caller commits.
+    """
+    expected = recompute(conn)
+    actual = stored(conn)
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        want = expected.get(key, (0, 0))
+        have = actual.get(key, (0, 0))
+        if want != have:
+            mismatches.append({
+                "agent_name": key[0],
+                "from_agent": key[1],
+                "expected": {"direct_unread": want[0], "broadcast_unread": want[1]},
+                "stored": {"direct_unread": have[0], "broadcast_unread": have[1]},
+            })
+
+    if repair:
+        conn.execute("DELETE FROM inbox_counters")
+        conn.executemany(
+            "INSERT INTO inbox_counters (agent_name, from_agent, direct_unread, broadcast_unread) VALUES (?, ?, ?, ?)",
+            [(agent, sender, direct, broadcast) for (agent, sender), (direct, broadcast) in expected.items()],
+        )
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check (and optionally repair) a room's inbox_counters table.")
+    parser.add_argument("db_path")
+    parser.add_argument("--repair", action="store_true", help="rewrite the table from a full recount")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    conn.execute("PRAGMA busy_timeout=5000")
+    if args.repair:
+        conn.execute("BEGIN IMMEDIATE")
+    mismatches = check(conn, repair=args.repair)
+    conn.commit()
+    conn.close()
+
+    print(json.dumps({"mismatches": mismatches, "repaired": args.repair}, indent=2))
+    sys.exit(1 if mismatches and not args.repair else 0)
+
+
+if __name__ == "__main__":
+    main()
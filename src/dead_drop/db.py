@@ -0,0 +1,374 @@
+"""SQLite connection management for the Dead Drop room server.
+
+Connections are opened and configured once, then reused across tool calls.
+There is a single writer connection (SQLite only ever admits one writer) and
+a small pool of read-only connections that WAL lets run alongside it.
+
+DBExecutor runs that work on worker threads, so a query waiting on a lock
+never stalls the asyncio event loop that serves every agent's session. All
+writes funnel through its one writer thread, which commits them in groups.
+"""
+
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """Long-lived reader/writer connections to one SQLite database.
+
+    Usage:
+        pool = ConnectionPool("/data/messages.db", readers=4)
+        with pool.reader() as conn:
+            conn.execute("SELECT ...")
+        with pool.writer() as conn:
+            conn.execute("INSERT ...")
+            conn.commit()
+
+    A connection checked out of the pool is returned on exit. Any transaction
+    left open (an early return before commit, or an exception) is rolled back,
+    matching the old behaviour of closing a connection without committing.
+
+    attach maps schema names to further database files that every connection
+    ATTACHes when it opens, e.g. {"cold": "/data/messages.cold.db"}.
+    """
+
+    def __init__(self, db_path, readers=4, busy_timeout_ms=5000, attach=None):
+        self.db_path = db_path
+        self.attached = dict(attach or {})
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_readers = max(1, readers)
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._release_hooks = []
+        self._open_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "connections_opened": 0,
+            "reader_checkouts": 0,
+            "writer_checkouts": 0,
+            "reader_waits": 0,
+            "writer_waits": 0,
+            "reader_wait_ms": 0.0,
+            "writer_wait_ms": 0.0,
+        }
+
+    # =========================================================================
+    # Connections
+    # =========================================================================
+
+    def _connect(self, readonly=False):
+        """Open and configure a connection. Called once per pooled connection."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        for schema, path in [("main", None)] + list(self.attached.items()):
+            if path is not None:
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+            if not readonly:
+                # Takes effect only on a new, empty file: lets retention hand
+                # freed pages back with incremental_vacuum. Must precede WAL.
+                conn.execute(f"PRAGMA {schema}.auto_vacuum=INCREMENTAL")
+            conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+        with self._stats_lock:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _count(self, kind, waited, wait_ms):
+        with self._stats_lock:
+            self._stats[f"{kind}_checkouts"] += 1
+            if waited:
+                self._stats[f"{kind}_waits"] += 1
+                self._stats[f"{kind}_wait_ms"] += wait_ms
+
+    @contextmanager
+    def reader(self):
+        """Check out a read-only connection, opening one if the pool has room."""
+        conn = None
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._open_lock:
+                if self._reader_count < self.max_readers:
+                    self._reader_count += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    conn = self._connect(readonly=True)
+                except Exception:
+                    with self._open_lock:
+                        self._reader_count -= 1
+                    raise
+
+        if conn is None:
+            started = time.perf_counter()
+            conn = self._readers.get()
+            self._count("reader", True, (time.perf_counter() - started) * 1000)
+        else:
+            self._count("reader", False, 0.0)
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Check out the single writer connection. Blocks while another caller holds it."""
+        if self._writer_lock.acquire(blocking=False):
+            self._count("writer", False, 0.0)
+        else:
+            started = time.perf_counter()
+            self._writer_lock.acquire()
+            self._count("writer", True, (time.perf_counter() - started) * 1000)
+
+        try:
+            if self._writer is None:
+                self._writer = self._connect()
+            conn = self._writer
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                for hook in self._release_hooks:
+                    hook()
+        finally:
+            self._writer_lock.release()
+
+    def on_writer_release(self, hook):
+        """Call hook() each time the writer is returned, once its transaction has
+        committed or rolled back — e.g. to invalidate caches of what it changed."""
+        if hook not in self._release_hooks:
+            self._release_hooks.append(hook)
+
+    # =========================================================================
+    # Introspection / Shutdown
+    # =========================================================================
+
+    def stats(self):
+        """Checkout and wait counters. Frequent waits mean the pool is too small."""
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["reader_wait_ms"] = round(result["reader_wait_ms"], 3)
+        result["writer_wait_ms"] = round(result["writer_wait_ms"], 3)
+        result["max_readers"] = self.max_readers
+        result["readers_open"] = self._reader_count
+        result["readers_idle"] = self._readers.qsize()
+        return result
+
+    def close(self):
+        """Close every idle connection. Checked-out connections are left alone."""
+        while True:
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._open_lock:
+                self._reader_count -= 1
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+class _Job:
+    """One queued write: the function, its args, and where to send the result."""
+
+    __slots__ = ("fn", "args", "loop", "future")
+
+    def __init__(self, fn, args, loop, future):
+        self.fn = fn
+        self.args = args
+        self.loop = loop
+        self.future = future
+
+
+def _resolve(future, result, error):
+    """Settle an asyncio future from the writer thread (via call_soon_threadsafe)."""
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class DBExecutor:
+    """Runs pooled SQLite work off the event loop.
+
+    Usage:
+        db = DBExecutor(pool)
+        rows = await db.read(lambda conn: conn.execute("SELECT ...").fetchall())
+        result = await db.write(fn, arg1, arg2)   # fn(conn, arg1, arg2)
+
+    Reads run on a thread pool sized to the reader pool.
+
+    Writes go through a queue drained by one writer thread, which commits them
+    in groups: it takes every write that arrives within batch_window_ms of the
+    first (up to batch_max), runs them in a single BEGIN IMMEDIATE transaction,
+    and commits once. Each write runs inside its own SAVEPOINT, so a write that
+    raises is rolled back alone and its caller gets the exception while the
+    rest of the group still commits. fn itself must not commit.
+
+    batch_max=1 commits every write on its own. inline=True runs everything
+    directly on the calling thread — the old blocking behaviour, kept for
+    benchmarks and scripts without a loop.
+    """
+
+    def __init__(self, pool, inline=False, batch_window_ms=2.0, batch_max=64):
+        self.pool = pool
+        self.inline = inline
+        self.batch_window = max(0.0, batch_window_ms) / 1000
+        self.batch_max = max(1, batch_max)
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=pool.max_readers, thread_name_prefix="dead-drop-read")
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "writes": 0,
+            "write_errors": 0,
+            "batches": 0,
+            "batch_failures": 0,
+            "max_batch": 0,
+        }
+        self._writer_thread = None
+        if not inline:
+            self._writer_thread = threading.Thread(
+                target=self._writer_loop, name="dead-drop-write", daemon=True)
+            self._writer_thread.start()
+
+    # =========================================================================
+    # Reads
+    # =========================================================================
+
+    def _run_read(self, fn, args):
+        with self.pool.reader() as conn:
+            return fn(conn, *args)
+
+    async def read(self, fn, *args):
+        """Run fn(conn, *args) on a read-only connection and return its result."""
+        if self.inline:
+            return self._run_read(fn, args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, fn, args)
+
+    # =========================================================================
+    # Writes
+    # =========================================================================
+
+    async def write(self, fn, *args):
+        """Run fn(conn, *args) in a write transaction and return its result."""
+        if self.inline:
+            outcome = self._commit_batch([_Job(fn, args, None, None)])[0]
+            if outcome[1] is not None:
+                raise outcome[1]
+            return outcome[0]
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(_Job(fn, args, loop, future))
+        return await future
+
+    def _next_batch(self):
+        """Block for one write, then gather whatever else arrives in the window."""
+        job = self._queue.get()
+        if job is None:
+            return None
+        batch = [job]
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.batch_max:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)  # let the loop see the shutdown after this batch
+                break
+            batch.append(job)
+        return batch
+
+    def _writer_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            outcomes = self._commit_batch(batch)
+            for job, (result, error) in zip(batch, outcomes):
+                try:
+                    job.loop.call_soon_threadsafe(_resolve, job.future, result, error)
+                except RuntimeError:
+                    pass  # caller's loop is gone; nobody is waiting
+
+    def _commit_batch(self, batch):
+        """Run a group of writes in one transaction. Returns [(result, error)] per job."""
+        outcomes = []
+        try:
+            with self.pool.writer() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for i, job in enumerate(batch):
+                    conn.execute(f"SAVEPOINT w{i}")
+                    try:
+                        result = job.fn(conn, *job.args)
+                    except Exception as e:
+                        if not conn.in_transaction:
+                            # SQLite aborted the whole transaction (e.g. disk
+                            # full); nothing earlier in the group survived.
+                            raise
+                        conn.execute(f"ROLLBACK TO w{i}")
+                        conn.execute(f"RELEASE w{i}")
+                        outcomes.append((None, e))
+                    else:
+                        conn.execute(f"RELEASE w{i}")
+                        outcomes.append((result, None))
+                conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed (lock timeout, I/O error): every write in
+            # the group was rolled back, so every caller gets the error.
+            outcomes = [(None, e)] * len(batch)
+            batch_failed = True
+        else:
+            batch_failed = False
+
+        errors = sum(1 for _, error in outcomes if error is not None)
+        with self._stats_lock:
+            self._stats["writes"] += len(batch)
+            self._stats["write_errors"] += errors
+            self._stats["batches"] += 1
+            self._stats["batch_failures"] += batch_failed
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+        return outcomes
+
+    # =========================================================================
+    # Introspection / Shutdown
+    # =========================================================================
+
+    def stats(self):
+        """Write and group-commit counters. writes/batches is the average group size."""
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["avg_batch"] = round(result["writes"] / result["batches"], 2) if result["batches"] else 0.0
+        result["queued"] = self._queue.qsize()
+        result["batch_window_ms"] = self.batch_window * 1000
+        result["batch_max"] = self.batch_max
+        return result
+
+    def shutdown(self):
+        """Wait for queued work to finish, then stop the worker threads."""
+        self._read_executor.shutdown(wait=True)
+        if self._writer_thread is not None:
+            self._queue.put(None)
+            self._writer_thread.join()
@@ -26,6 +26,7 @@ import sys
 import uuid
 import logging
 
+from dead_drop import wire
 from dead_drop.spawner import Spawner
 
 logger = logging.getLogger("dead-drop-hub")
@@ -184,7 +185,7 @@ async def list_teams() -> str:
             team["active_rooms"] = cursor.fetchone()[0]
             teams.append(team)
 
-        return json.dumps(teams, indent=2)
+        return wire.encode("list_teams", teams)
     except Exception as e:
         return f"Error listing teams: {e}"
     finally:
@@ -240,7 +241,7 @@ async def create_room(creator: str, name: str, teams: str, project: str = "") ->
             )
             conn.commit()
 
-            return json.dumps({
+            return wire.encode("create_room", {
                 "room_name": name,
                 "port": port,
                 "token": token,
@@ -249,7 +250,7 @@ async def create_room(creator: str, name: str, teams: str, project: str = "") ->
                 "teams": team_list,
                 "project": project,
                 "message": f"Room '{name}' created. Connect to http://localhost:{port}/mcp with token '{token}'.",
-            }, indent=2)
+            })
 
         except Exception as e:
             cursor.execute("UPDATE rooms SET status = 'destroyed' WHERE name = ?", (name,))
@@ -263,8 +264,8 @@ async def create_room(creator: str, name: str, teams: str, project: str = "") ->
 
 
 @mcp.tool()
-async def list_rooms(status: str = "active") -> str:
-    """List rooms with container health. Filter by status: 'active', 'archived', 'destroyed', or '' for all."""
+async def list_rooms(status: str = "active", fields: str = "") -> str:
+    """List rooms with container health. Filter by status: 'active', 'archived', 'destroyed', or '' for all. Optional fields: comma-separated room fields to return (e.g. "name,status,port")."""
     conn = get_db()
     cursor = conn.cursor()
     try:
@@ -284,7 +285,7 @@ async def list_rooms(status: str = "active") -> str:
 
             rooms.append(room)
 
-        return json.dumps(rooms, indent=2)
+        return wire.encode("list_rooms", wire.rows(rooms, fields))
     except Exception as e:
         return f"Error listing rooms: {e}"
     finally:
@@ -313,13 +314,13 @@ async def join_room(team_name: str, room_name: str) -> str:
         # Parse current teams and add new one
         team_list = json.loads(room["teams"])
         if team_name in team_list:
-            return json.dumps({
+            return wire.encode("join_room", {
                 "room_name": room_name,
                 "port": room["port"],
                 "token": room["token"],
                 "url": f"http://localhost:{room['port']}/mcp",
                 "message": f"Team '{team_name}' is already in room '{room_name}'.",
-            }, indent=2)
+            })
 
         team_list.append(team_name)
         cursor.execute(
@@ -328,14 +329,14 @@ async def join_room(team_name: str, room_name: str) -> str:
         )
         conn.commit()
 
-        return json.dumps({
+        return wire.encode("join_room", {
             "room_name": room_name,
             "port": room["port"],
             "token": room["token"],
             "url": f"http://localhost:{room['port']}/mcp",
             "teams": team_list,
             "message": f"Team '{team_name}' joined room '{room_name}'. Connect to http://localhost:{room['port']}/mcp with token '{room['token']}'.",
-        }, indent=2)
+        })
 
     except Exception as e:
         return f"Error joining room: {e}"
@@ -468,7 +469,7 @@ async def room_status(room_name: str) -> str:
         if room["status"] == "active":
             room["container"] = spawner.get_room_health(room_name)
 
-        return json.dumps(room, indent=2)
+        return wire.encode("room_status", room)
     except Exception as e:
         return f"Error getting room status: {e}"
     finally:
@@ -500,7 +501,7 @@ async def get_my_rooms(team_name: str) -> str:
                     "created_at": room["created_at"],
                 })
 
-        return json.dumps(my_rooms, indent=2)
+        return wire.encode("get_my_rooms", my_rooms)
     except Exception as e:
         return f"Error getting rooms: {e}"
     finally:
@@ -589,7 +590,7 @@ async def create_workspace(creator: str, name: str, teams: str, project: str = "
             host = os.getenv("DD_HUB_HOST", "192.168.2.142")
             ssh_cmd = f"ssh root@{host} -p {port}"
 
-            return json.dumps({
+            return wire.encode("create_workspace", {
                 "workspace": name,
                 "port": port,
                 "password": password,
@@ -599,7 +600,7 @@ async def create_workspace(creator: str, name: str, teams: str, project: str = "
                 "teams": team_list,
                 "project": project,
                 "message": f"Workspace '{name}' ready. Connect: {ssh_cmd} (password: {password}). Files go in /workspace/",
-            }, indent=2)
+            })
 
         except Exception as e:
             cursor.execute("UPDATE workspaces SET status = 'destroyed' WHERE name = ?", (name,))
@@ -633,7 +634,7 @@ async def list_workspaces(status: str = "active") -> str:
 
             workspaces.append(ws)
 
-        return json.dumps(workspaces, indent=2)
+        return wire.encode("list_workspaces", workspaces)
     except Exception as e:
         return f"Error listing workspaces: {e}"
     finally:
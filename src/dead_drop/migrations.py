@@ -0,0 +1,1016 @@
+"""Versioned schema migrations for a room's SQLite database.
+
+PRAGMA user_version records the last migration applied, so starting the
+server against an up-to-date database costs one pragma read no matter how
+many messages it holds.
+
+Each migration takes a cursor and moves the schema forward one version. To
+change the schema, append a function to MIGRATIONS. Never edit one that has
+shipped: databases that already ran it will not run it again.
+"""
+
+
+def _v1_base_schema(cursor):
+    """Tables plus the column and CHECK upgrades that predate user_version.
+
+    Databases created before versioning sit at user_version 0 in any of
+    their historical shapes, so every step here checks before it changes.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agents (
+            name TEXT PRIMARY KEY,
+            registered_at TEXT,
+            last_seen TEXT,
+            last_inbox_check TEXT,
+            role TEXT DEFAULT NULL,
+            description TEXT DEFAULT NULL,
+            status TEXT DEFAULT 'offline'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_agent TEXT,
+            to_agent TEXT,
+            content TEXT,
+            timestamp TEXT,
+            read_flag INTEGER DEFAULT 0,
+            is_cc INTEGER DEFAULT 0,
+            cc_original_to TEXT DEFAULT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_reads (
+            agent_name TEXT,
+            message_id INTEGER,
+            PRIMARY KEY (agent_name, message_id)
+        )
+    ''')
+    # Phase 1: Tasks
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT PRIMARY KEY,
+            project TEXT DEFAULT '',
+            title TEXT NOT NULL,
+            description TEXT DEFAULT '',
+            assigned_to TEXT,
+            created_by TEXT NOT NULL,
+            status TEXT DEFAULT 'pending'
+                CHECK(status IN ('pending','assigned','in_progress','review','completed','failed','verified')),
+            result TEXT DEFAULT '',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            completed_at TEXT,
+            role_hat TEXT DEFAULT NULL,
+            goal_id TEXT DEFAULT '',
+            verified_by TEXT DEFAULT '',
+            verified_at TEXT DEFAULT NULL,
+            approved_by TEXT DEFAULT ''
+        )
+    ''')
+    # Phase 7: Goals
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            goal_id TEXT UNIQUE NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT DEFAULT '',
+            project TEXT DEFAULT '',
+            creator TEXT NOT NULL,
+            status TEXT DEFAULT 'open'
+                CHECK(status IN ('open','active','pending_verify','verified','failed')),
+            verified_by TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            verified_at TIMESTAMP DEFAULT NULL
+        )
+    ''')
+    # Phase 2: Handshakes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS handshakes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            initiated_by TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT DEFAULT 'pending'
+                CHECK(status IN ('pending','completed'))
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS handshake_acks (
+            handshake_id INTEGER,
+            agent_name TEXT,
+            acked_at TEXT NOT NULL,
+            PRIMARY KEY (handshake_id, agent_name)
+        )
+    ''')
+    # Phase 5: Interface contracts
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS contracts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project TEXT DEFAULT '',
+            name TEXT NOT NULL,
+            type TEXT NOT NULL
+                CHECK(type IN ('function','dom_id','css_class','file_path','api_endpoint','event','other')),
+            owner TEXT NOT NULL,
+            spec TEXT DEFAULT '',
+            version INTEGER DEFAULT 1,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            UNIQUE(project, name, type)
+        )
+    ''')
+
+    # Phase 6: Minion spawn policy
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spawn_policy (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL UNIQUE,
+            enabled BOOLEAN DEFAULT 1,
+            max_minions INTEGER DEFAULT 3,
+            set_by TEXT NOT NULL,
+            set_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS minion_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            pilot TEXT NOT NULL,
+            task_description TEXT NOT NULL,
+            status TEXT DEFAULT "spawned",
+            spawned_at TEXT NOT NULL,
+            completed_at TEXT,
+            result TEXT
+        )
+    ''')
+
+    # Migrations — agents
+    cursor.execute("PRAGMA table_info(agents)")
+    cols = [c[1] for c in cursor.fetchall()]
+    if 'last_inbox_check' not in cols:
+        cursor.execute("ALTER TABLE agents ADD COLUMN last_inbox_check TEXT")
+    if 'role' not in cols:
+        cursor.execute("ALTER TABLE agents ADD COLUMN role TEXT DEFAULT NULL")
+    if 'description' not in cols:
+        cursor.execute("ALTER TABLE agents ADD COLUMN description TEXT DEFAULT NULL")
+    if 'status' not in cols:
+        cursor.execute("ALTER TABLE agents ADD COLUMN status TEXT DEFAULT 'offline'")
+    if 'heartbeat_at' not in cols:
+        cursor.execute("ALTER TABLE agents ADD COLUMN heartbeat_at TEXT DEFAULT NULL")
+    if 'team' not in cols:
+        cursor.execute("ALTER TABLE agents ADD COLUMN team TEXT DEFAULT ''")
+
+    # Migrations — messages
+    cursor.execute("PRAGMA table_info(messages)")
+    mcols = [c[1] for c in cursor.fetchall()]
+    if 'is_cc' not in mcols:
+        cursor.execute("ALTER TABLE messages ADD COLUMN is_cc INTEGER DEFAULT 0")
+    if 'cc_original_to' not in mcols:
+        cursor.execute("ALTER TABLE messages ADD COLUMN cc_original_to TEXT DEFAULT NULL")
+    if 'task_id' not in mcols:
+        cursor.execute("ALTER TABLE messages ADD COLUMN task_id TEXT DEFAULT NULL")
+    if 'reply_to' not in mcols:
+        cursor.execute("ALTER TABLE messages ADD COLUMN reply_to INTEGER DEFAULT NULL")
+
+    # Migrations — tasks: check if CHECK constraint needs 'verified'
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='tasks'")
+    schema_row = cursor.fetchone()
+    if schema_row and "'verified'" not in (schema_row[0] or ''):
+        # Rebuild table with updated CHECK constraint
+        cursor.execute("PRAGMA table_info(tasks)")
+        existing_cols = [c[1] for c in cursor.fetchall()]
+        cursor.execute('''
+            CREATE TABLE tasks_rebuild (
+                id TEXT PRIMARY KEY,
+                project TEXT DEFAULT '',
+                title TEXT NOT NULL,
+                description TEXT DEFAULT '',
+                assigned_to TEXT,
+                created_by TEXT NOT NULL,
+                status TEXT DEFAULT 'pending'
+                    CHECK(status IN ('pending','assigned','in_progress','review','completed','failed','verified')),
+                result TEXT DEFAULT '',
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                completed_at TEXT,
+                role_hat TEXT DEFAULT NULL,
+                goal_id TEXT DEFAULT '',
+                verified_by TEXT DEFAULT '',
+                verified_at TEXT DEFAULT NULL,
+                approved_by TEXT DEFAULT ''
+            )
+        ''')
+        # Copy existing data using only columns that exist
+        base_cols = ['id','project','title','description','assigned_to','created_by','status','result','created_at','updated_at','completed_at']
+        copy_cols = [c for c in base_cols if c in existing_cols]
+        if 'role_hat' in existing_cols:
+            copy_cols.append('role_hat')
+        cols_str = ', '.join(copy_cols)
+        cursor.execute(f'INSERT INTO tasks_rebuild ({cols_str}) SELECT {cols_str} FROM tasks')
+        cursor.execute("DROP TABLE tasks")
+        cursor.execute("ALTER TABLE tasks_rebuild RENAME TO tasks")
+    else:
+        # Table already has 'verified' — just add new columns if missing
+        cursor.execute("PRAGMA table_info(tasks)")
+        tcols = [c[1] for c in cursor.fetchall()]
+        if 'role_hat' not in tcols:
+            cursor.execute("ALTER TABLE tasks ADD COLUMN role_hat TEXT DEFAULT NULL")
+        if 'goal_id' not in tcols:
+            cursor.execute("ALTER TABLE tasks ADD COLUMN goal_id TEXT DEFAULT ''")
+        if 'verified_by' not in tcols:
+            cursor.execute("ALTER TABLE tasks ADD COLUMN verified_by TEXT DEFAULT ''")
+        if 'verified_at' not in tcols:
+            cursor.execute("ALTER TABLE tasks ADD COLUMN verified_at TEXT DEFAULT NULL")
+        if 'approved_by' not in tcols:
+            cursor.execute("ALTER TABLE tasks ADD COLUMN approved_by TEXT DEFAULT ''")
+
+
+def _v2_hot_path_indexes(cursor):
+    """Indexes for the queries every tool call runs.
+
+    Unread lookups (send's gate, check_inbox, the unread alert) filter
+    messages on to_agent and read_flag = 0. idx_messages_inbox answers them
+    and, since it carries from_agent, counts and names senders without
+    touching the table. Broadcasts (to_agent = 'all') use its prefix.
+    broadcast_reads lookups already use its primary key.
+    """
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_inbox ON messages(to_agent, read_flag, from_agent)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_task ON messages(task_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assigned ON tasks(assigned_to, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project ON tasks(project, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_goal ON tasks(goal_id)")
+
+
+def _v3_broadcast_watermarks(cursor):
+    """One broadcast read position per agent instead of a row per broadcast read.
+
+    check_inbox has always marked every broadcast present at that moment as
+    read, so an agent's broadcast_reads rows are exactly the broadcasts up to
+    its highest one. That id becomes its watermark; nothing read turns unread
+    and nothing unread turns read.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_watermarks (
+            agent_name TEXT PRIMARY KEY,
+            last_read_id INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO broadcast_watermarks (agent_name, last_read_id)
+        SELECT agent_name, MAX(message_id) FROM broadcast_reads GROUP BY agent_name
+    ''')
+    cursor.execute("DROP TABLE broadcast_reads")
+    # Broadcasts above a watermark: a range scan on (to_agent = 'all', id).
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_to_id ON messages(to_agent, id)")
+
+
+def _v4_inbox_counters(cursor):
+    """Unread counts per (recipient, sender), kept current by triggers.
+
+    direct_unread counts unread direct mail keyed by to_agent exactly as
+    stored (short or team-qualified name). broadcast_unread counts
+    broadcasts from others above the recipient's watermark and is kept only
+    for registered agents. dead_drop.counters recomputes both from scratch
+    to check them.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS inbox_counters (
+            agent_name TEXT NOT NULL,
+            from_agent TEXT NOT NULL,
+            direct_unread INTEGER NOT NULL DEFAULT 0,
+            broadcast_unread INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (agent_name, from_agent)
+        ) WITHOUT ROWID
+    ''')
+
+    # Direct mail: +1 on unread insert, -1 when read or deleted unread.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_direct_insert
+        AFTER INSERT ON messages WHEN NEW.to_agent != 'all' AND NEW.read_flag = 0
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, direct_unread)
+            VALUES (NEW.to_agent, NEW.from_agent, 1)
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET direct_unread = direct_unread + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_direct_read
+        AFTER UPDATE OF read_flag ON messages
+        WHEN NEW.to_agent != 'all' AND (OLD.read_flag = 0) != (NEW.read_flag = 0)
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, direct_unread)
+            VALUES (NEW.to_agent, NEW.from_agent, CASE WHEN NEW.read_flag = 0 THEN 1 ELSE -1 END)
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET direct_unread = direct_unread + excluded.direct_unread;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_direct_delete
+        AFTER DELETE ON messages WHEN OLD.to_agent != 'all' AND OLD.read_flag = 0
+        BEGIN
+            UPDATE inbox_counters SET direct_unread = direct_unread - 1
+            WHERE agent_name = OLD.to_agent AND from_agent = OLD.from_agent;
+        END
+    ''')
+
+    # Broadcasts: +1 for every other registered agent on insert (a new id is
+    # above every watermark); -1 on delete for those who hadn't read it yet.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_broadcast_insert
+        AFTER INSERT ON messages WHEN NEW.to_agent = 'all'
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, broadcast_unread)
+            SELECT name, NEW.from_agent, 1 FROM agents WHERE name != NEW.from_agent
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET broadcast_unread = broadcast_unread + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_broadcast_delete
+        AFTER DELETE ON messages WHEN OLD.to_agent = 'all'
+        BEGIN
+            UPDATE inbox_counters SET broadcast_unread = broadcast_unread - 1
+            WHERE from_agent = OLD.from_agent AND agent_name != OLD.from_agent
+            AND agent_name IN (SELECT name FROM agents)
+            AND OLD.id > COALESCE((SELECT last_read_id FROM broadcast_watermarks w
+                                   WHERE w.agent_name = inbox_counters.agent_name), 0);
+        END
+    ''')
+
+    # Watermark advance: subtract the broadcasts it just passed, per sender.
+    for event, old_mark in (("INSERT", "0"), ("UPDATE OF last_read_id", "OLD.last_read_id")):
+        name = "inbox_counters_watermark_" + event.split()[0].lower()
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}
+            AFTER {event} ON broadcast_watermarks
+            WHEN NEW.last_read_id > {old_mark} AND EXISTS (SELECT 1 FROM agents WHERE name = NEW.agent_name)
+            BEGIN
+                UPDATE inbox_counters SET broadcast_unread = broadcast_unread - (
+                    SELECT COUNT(*) FROM messages
+                    WHERE to_agent = 'all' AND from_agent = inbox_counters.from_agent
+                    AND id > {old_mark} AND id <= NEW.last_read_id
+                )
+                WHERE agent_name = NEW.agent_name AND from_agent != NEW.agent_name;
+            END
+        ''')
+
+    # Registering adds the agent's unread broadcasts; deregistering drops them.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_agent_insert
+        AFTER INSERT ON agents
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, broadcast_unread)
+            SELECT NEW.name, from_agent, COUNT(*) FROM messages
+            WHERE to_agent = 'all' AND from_agent != NEW.name
+            AND id > COALESCE((SELECT last_read_id FROM broadcast_watermarks WHERE agent_name = NEW.name), 0)
+            GROUP BY from_agent
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET broadcast_unread = broadcast_unread + excluded.broadcast_unread;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_agent_delete
+        AFTER DELETE ON agents
+        BEGIN
+            UPDATE inbox_counters SET broadcast_unread = 0 WHERE agent_name = OLD.name;
+        END
+    ''')
+
+    # Backfill from the current messages.
+    cursor.execute('''
+        INSERT INTO inbox_counters (agent_name, from_agent, direct_unread)
+        SELECT to_agent, from_agent, COUNT(*) FROM messages
+        WHERE to_agent != 'all' AND read_flag = 0
+        GROUP BY to_agent, from_agent
+    ''')
+    cursor.execute('''
+        INSERT INTO inbox_counters (agent_name, from_agent, broadcast_unread)
+        SELECT a.name, m.from_agent, COUNT(*) FROM agents a
+        JOIN messages m ON m.to_agent = 'all' AND m.from_agent != a.name
+            AND m.id > COALESCE((SELECT last_read_id FROM broadcast_watermarks w WHERE w.agent_name = a.name), 0)
+        WHERE true
+        GROUP BY a.name, m.from_agent
+        ON CONFLICT(agent_name, from_agent) DO UPDATE SET broadcast_unread = excluded.broadcast_unread
+    ''')
+
+
+def _v5_message_bodies(cursor):
+    """Store each message body once, with a delivery row per recipient.
+
+    A send CC'd to every lead, a handshake or a task notice used to copy the
+    whole content into one messages row per recipient. message_bodies holds
+    the content once; deliveries holds who it went to and whether they have
+    read it. Rows that differ only in recipient collapse into one body.
+
+    Delivery ids are the old message ids, so ids agents already hold (reply_to,
+    handshake message_id, broadcast watermarks) keep pointing at the same
+    messages. A read-only messages view joins the two tables back into the
+    old row shape for every query that reads it.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_bodies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_agent TEXT,
+            content TEXT,
+            timestamp TEXT,
+            task_id TEXT DEFAULT NULL,
+            reply_to INTEGER DEFAULT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            body_id INTEGER NOT NULL REFERENCES message_bodies(id),
+            to_agent TEXT,
+            read_flag INTEGER DEFAULT 0,
+            is_cc INTEGER DEFAULT 0,
+            cc_original_to TEXT DEFAULT NULL
+        )
+    ''')
+
+    # Each group of identical rows becomes one body, numbered by its first row.
+    cursor.execute('''
+        CREATE TEMP TABLE message_body_map AS
+        SELECT id, MIN(id) OVER (PARTITION BY from_agent, content, timestamp, task_id, reply_to) AS body_id
+        FROM messages
+    ''')
+    cursor.execute('''
+        INSERT INTO message_bodies (id, from_agent, content, timestamp, task_id, reply_to)
+        SELECT m.id, m.from_agent, m.content, m.timestamp, m.task_id, m.reply_to
+        FROM messages m JOIN message_body_map map ON map.id = m.id
+        WHERE map.body_id = m.id
+    ''')
+    cursor.execute('''
+        INSERT INTO deliveries (id, body_id, to_agent, read_flag, is_cc, cc_original_to)
+        SELECT m.id, map.body_id, m.to_agent, m.read_flag, m.is_cc, m.cc_original_to
+        FROM messages m JOIN message_body_map map ON map.id = m.id
+    ''')
+    cursor.execute("DROP TABLE message_body_map")
+
+    # New deliveries continue the old id sequence, even past deleted rows.
+    seq = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'messages'").fetchone()
+    if seq is not None:
+        cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'deliveries'")
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('deliveries', ?)", (seq[0],))
+
+    # Dropping the table drops its indexes and its inbox_counters triggers;
+    # the triggers on broadcast_watermarks and agents read the view instead.
+    cursor.execute("DROP TABLE messages")
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS messages AS
+        SELECT d.id, b.from_agent, d.to_agent, b.content, b.timestamp,
+               d.read_flag, d.is_cc, d.cc_original_to, b.task_id, b.reply_to
+        FROM deliveries d JOIN message_bodies b ON b.id = d.body_id
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_inbox ON deliveries(to_agent, read_flag)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_to_id ON deliveries(to_agent, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_body ON deliveries(body_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_bodies_task ON message_bodies(task_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_bodies_timestamp ON message_bodies(timestamp)")
+
+    # The v4 counter triggers, moved to deliveries. The sender lives on the body,
+    # which is always inserted before its deliveries and deleted after them.
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_direct_insert
+        AFTER INSERT ON deliveries WHEN NEW.to_agent != 'all' AND NEW.read_flag = 0
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, direct_unread)
+            SELECT NEW.to_agent, from_agent, 1 FROM message_bodies WHERE id = NEW.body_id
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET direct_unread = direct_unread + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_direct_read
+        AFTER UPDATE OF read_flag ON deliveries
+        WHEN NEW.to_agent != 'all' AND (OLD.read_flag = 0) != (NEW.read_flag = 0)
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, direct_unread)
+            SELECT NEW.to_agent, from_agent, CASE WHEN NEW.read_flag = 0 THEN 1 ELSE -1 END
+            FROM message_bodies WHERE id = NEW.body_id
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET direct_unread = direct_unread + excluded.direct_unread;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_direct_delete
+        AFTER DELETE ON deliveries WHEN OLD.to_agent != 'all' AND OLD.read_flag = 0
+        BEGIN
+            UPDATE inbox_counters SET direct_unread = direct_unread - 1
+            WHERE agent_name = OLD.to_agent
+            AND from_agent = (SELECT from_agent FROM message_bodies WHERE id = OLD.body_id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_broadcast_insert
+        AFTER INSERT ON deliveries WHEN NEW.to_agent = 'all'
+        BEGIN
+            INSERT INTO inbox_counters (agent_name, from_agent, broadcast_unread)
+            SELECT a.name, b.from_agent, 1 FROM agents a JOIN message_bodies b ON b.id = NEW.body_id
+            WHERE a.name != b.from_agent
+            ON CONFLICT(agent_name, from_agent) DO UPDATE SET broadcast_unread = broadcast_unread + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS inbox_counters_broadcast_delete
+        AFTER DELETE ON deliveries WHEN OLD.to_agent = 'all'
+        BEGIN
+            UPDATE inbox_counters SET broadcast_unread = broadcast_unread - 1
+            WHERE from_agent = (SELECT from_agent FROM message_bodies WHERE id = OLD.body_id)
+            AND agent_name != from_agent
+            AND agent_name IN (SELECT name FROM agents)
+            AND OLD.id > COALESCE((SELECT last_read_id FROM broadcast_watermarks w
+                                   WHERE w.agent_name = inbox_counters.agent_name), 0);
+        END
+    ''')
+
+
+def _v6_history_keys(cursor):
+    """Keys for paging history by message id.
+
+    get_history walks deliveries newest-first by id, optionally limited to
+    one participant. Recipients are already indexed with id (to_agent, id);
+    the sender lives on the body, whose ids don't sort with delivery ids, so
+    each delivery gets a copy of it to index alongside id.
+    """
+    cursor.execute("ALTER TABLE deliveries ADD COLUMN from_agent TEXT")
+    cursor.execute("UPDATE deliveries SET from_agent = (SELECT from_agent FROM message_bodies WHERE id = body_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_from_id ON deliveries(from_agent, id)")
+
+
+def _v7_search_index(cursor):
+    """FTS5 indexes behind the search tool, kept in sync by triggers.
+
+    message_bodies and contracts have integer keys, so their indexes store
+    no text of their own (external content) and are updated from OLD/NEW in
+    the triggers. tasks are keyed by a TEXT id, and VACUUM may renumber the
+    rowids of such tables, so tasks_fts keeps its own copy keyed by task_id.
+    """
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='message_bodies', content_rowid='id', tokenize='porter unicode61'
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS contracts_fts USING fts5(
+            name, spec, content='contracts', content_rowid='id', tokenize='porter unicode61'
+        )
+    ''')
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            task_id UNINDEXED, title, description, result, tokenize='porter unicode61'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON message_bodies
+        BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON message_bodies
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON message_bodies
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contracts_fts_insert AFTER INSERT ON contracts
+        BEGIN
+            INSERT INTO contracts_fts (rowid, name, spec) VALUES (NEW.id, NEW.name, NEW.spec);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contracts_fts_delete AFTER DELETE ON contracts
+        BEGIN
+            INSERT INTO contracts_fts (contracts_fts, rowid, name, spec) VALUES ('delete', OLD.id, OLD.name, OLD.spec);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS contracts_fts_update AFTER UPDATE OF name, spec ON contracts
+        BEGIN
+            INSERT INTO contracts_fts (contracts_fts, rowid, name, spec) VALUES ('delete', OLD.id, OLD.name, OLD.spec);
+            INSERT INTO contracts_fts (rowid, name, spec) VALUES (NEW.id, NEW.name, NEW.spec);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (task_id, title, description, result)
+            VALUES (NEW.id, NEW.title, NEW.description, NEW.result);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks
+        BEGIN
+            DELETE FROM tasks_fts WHERE task_id = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF id, title, description, result ON tasks
+        BEGIN
+            DELETE FROM tasks_fts WHERE task_id = OLD.id;
+            INSERT INTO tasks_fts (task_id, title, description, result)
+            VALUES (NEW.id, NEW.title, NEW.description, NEW.result);
+        END
+    ''')
+
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO contracts_fts (contracts_fts) VALUES ('rebuild')")
+    cursor.execute("INSERT INTO tasks_fts (task_id, title, description, result) SELECT id, title, description, result FROM tasks")
+
+
+def _v8_events(cursor):
+    """A log of what each agent's event stream reports, written by triggers.
+
+    GET /agents/{name}/events replays it from a Last-Event-ID, so it needs
+    one id sequence across new mail, task transitions and handshakes.
+    Rows only point at what changed (a delivery id, a task id, a handshake
+    id) plus a small JSON detail; the stream loads message bodies as it
+    sends them. agent_name is the recipient of a direct delivery and NULL
+    for what the whole room sees: broadcasts, tasks and handshakes.
+    Nothing is backfilled; retention prunes old rows.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL CHECK(kind IN ('message','task','handshake')),
+            agent_name TEXT,
+            ref TEXT NOT NULL,
+            detail TEXT,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_created ON events(created_at)")
+
+    now = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+    triggers = [
+        ("events_message", "AFTER INSERT ON deliveries",
+         "'message', NULLIF(NEW.to_agent, 'all'), NEW.id, NULL"),
+        ("events_task_insert", "AFTER INSERT ON tasks",
+         "'task', NULL, NEW.id, json_object('status', NEW.status, 'title', NEW.title, "
+         "'assigned_to', NEW.assigned_to, 'created_by', NEW.created_by)"),
+        ("events_task_status", "AFTER UPDATE OF status ON tasks WHEN NEW.status IS NOT OLD.status",
+         "'task', NULL, NEW.id, json_object('status', NEW.status, 'previous', OLD.status, "
+         "'title', NEW.title, 'assigned_to', NEW.assigned_to)"),
+        ("events_handshake_insert", "AFTER INSERT ON handshakes",
+         "'handshake', NULL, NEW.id, json_object('status', NEW.status, 'initiated_by', NEW.initiated_by, "
+         "'message_id', NEW.message_id)"),
+        ("events_handshake_status", "AFTER UPDATE OF status ON handshakes WHEN NEW.status IS NOT OLD.status",
+         "'handshake', NULL, NEW.id, json_object('status', NEW.status, 'initiated_by', NEW.initiated_by)"),
+        ("events_handshake_ack", "AFTER INSERT ON handshake_acks",
+         "'handshake', NULL, NEW.handshake_id, json_object('status', 'acked', 'agent', NEW.agent_name)"),
+    ]
+    for name, event, values in triggers:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {event}
+            BEGIN
+                INSERT INTO events (kind, agent_name, ref, detail, created_at) VALUES ({values}, {now});
+            END
+        ''')
+
+
+def _role_list(column):
+    """A comma-separated role column as a JSON array for json_each ('[]' if it can't be one)."""
+    as_json = f"""'["' || replace({column}, ',', '","') || '"]'"""
+    return f"CASE WHEN json_valid({as_json}) THEN {as_json} ELSE '[]' END"
+
+
+def _v9_agent_roles(cursor):
+    """agents.role split into one (agent, role) row per role, kept in step by triggers.
+
+    Lead checks and role lookups used to read every agent and split the
+    comma-separated string in Python; agent_roles answers "who are the
+    leads" or "the testers" from the (role, agent) index. agents.role stays
+    the source of truth: register still writes it, and the triggers rewrite
+    an agent's rows whenever it changes.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agent_roles (
+            agent TEXT NOT NULL,
+            role TEXT NOT NULL,
+            PRIMARY KEY (agent, role)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_roles_role ON agent_roles(role, agent)")
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS agent_roles_insert AFTER INSERT ON agents
+        WHEN NEW.role IS NOT NULL
+        BEGIN
+            INSERT OR IGNORE INTO agent_roles (agent, role)
+            SELECT NEW.name, trim(value) FROM json_each({_role_list("NEW.role")}) WHERE trim(value) != '';
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS agent_roles_update AFTER UPDATE OF name, role ON agents
+        WHEN NEW.role IS NOT OLD.role OR NEW.name IS NOT OLD.name
+        BEGIN
+            DELETE FROM agent_roles WHERE agent = OLD.name;
+            INSERT OR IGNORE INTO agent_roles (agent, role)
+            SELECT NEW.name, trim(value) FROM json_each({_role_list("NEW.role")}) WHERE trim(value) != '';
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS agent_roles_delete AFTER DELETE ON agents
+        BEGIN
+            DELETE FROM agent_roles WHERE agent = OLD.name;
+        END
+    ''')
+
+    cursor.execute(f"""
+        INSERT OR IGNORE INTO agent_roles (agent, role)
+        SELECT agents.name, trim(value) FROM agents, json_each({_role_list("agents.role")})
+        WHERE agents.role IS NOT NULL AND trim(value) != ''
+    """)
+
+
+def _v10_agent_names(cursor):
+    """agent_names: every registered name under its short form, kept in step by triggers.
+
+    send resolves a short recipient ("spartan") to the one agent registered
+    as "{team}/spartan"; that used to be a LIKE '%/spartan' scan of agents
+    on every message, which no index can serve. short_name is the part
+    after the first '/', or the whole name; team is the prefix of a
+    team-qualified name, else the agents.team column.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agent_names (
+            name TEXT PRIMARY KEY,
+            short_name TEXT NOT NULL,
+            team TEXT
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_agent_names_short ON agent_names(short_name, name)")
+
+    def row(agent):
+        return (f"{agent}.name, substr({agent}.name, instr({agent}.name, '/') + 1), "
+                f"COALESCE(NULLIF(substr({agent}.name, 1, instr({agent}.name, '/') - 1), ''), {agent}.team)")
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS agent_names_insert AFTER INSERT ON agents
+        BEGIN
+            INSERT OR REPLACE INTO agent_names (name, short_name, team) VALUES ({row("NEW")});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS agent_names_update AFTER UPDATE OF name, team ON agents
+        WHEN NEW.name IS NOT OLD.name OR NEW.team IS NOT OLD.team
+        BEGIN
+            DELETE FROM agent_names WHERE name = OLD.name;
+            INSERT OR REPLACE INTO agent_names (name, short_name, team) VALUES ({row("NEW")});
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS agent_names_delete AFTER DELETE ON agents
+        BEGIN
+            DELETE FROM agent_names WHERE name = OLD.name;
+        END
+    ''')
+
+    cursor.execute(f"INSERT OR REPLACE INTO agent_names (name, short_name, team) SELECT {row('agents')} FROM agents")
+
+
+def _v11_sequences(cursor):
+    """Counters behind TASK-NNN and GOAL-NNN ids, seeded from the highest id in use.
+
+    Finding the next task id used to sort every task by its numeric
+    suffix; a sequence row is one indexed read-and-bump in the same write
+    transaction as the insert that uses it.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    for name, table, column, prefix in (("task", "tasks", "id", "TASK-"), ("goal", "goals", "goal_id", "GOAL-")):
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO sequences (name, value)
+            SELECT ?, COALESCE(MAX(CAST(SUBSTR({column}, {len(prefix) + 1}) AS INTEGER)), 0)
+            FROM {table} WHERE {column} GLOB '{prefix}[0-9]*'
+        """, (name,))
+
+
+def _v12_task_pages(cursor):
+    """Task indexes that end in (created_at, id), the key list_tasks pages by.
+
+    Each filter list_tasks takes (status, assigned_to, project, or the
+    default "everything not completed") gets an index that hands its rows
+    over already in page order, so a page past a cursor is a range seek
+    rather than a sort of the whole board. The v2 indexes keep their names.
+    """
+    for name, columns in (("idx_tasks_status", "status"), ("idx_tasks_assigned", "assigned_to"),
+                          ("idx_tasks_project", "project")):
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+        cursor.execute(f"CREATE INDEX {name} ON tasks({columns}, created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_open ON tasks(created_at, id) WHERE status != 'completed'")
+
+
+# The task_rollups rows one task_events row counts toward: the room-wide
+# ('all', '') row and its agent, project and role_hat.
+_ROLLUP_DIMS = """(SELECT 'all' AS dim, '' AS key
+               UNION ALL SELECT 'agent', NEW.agent WHERE NEW.agent IS NOT NULL
+               UNION ALL SELECT 'project', NEW.project WHERE NEW.project IS NOT NULL AND NEW.project != ''
+               UNION ALL SELECT 'role_hat', NEW.role_hat WHERE NEW.role_hat IS NOT NULL)"""
+
+
+def _v13_task_events(cursor):
+    """task_events: every task status change, and task_rollups: running totals over it.
+
+    Transitions used to overwrite tasks.status in place, leaving nothing to
+    measure cycle time or review latency from. Triggers on tasks append one
+    row per change, whichever tool made it, with how long the task sat in
+    the state it left. Another trigger folds each row into task_rollups,
+    per assignee, project and role_hat plus a room-wide ('all', '') row:
+    how often each state was entered and left, the seconds spent in it,
+    and rework (sent back to in_progress from review or completed).
+    Existing tasks get one row for the state they are in now.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT NOT NULL,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            agent TEXT,
+            project TEXT,
+            role_hat TEXT,
+            at TEXT NOT NULL,
+            seconds_in_prev REAL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_events_task ON task_events(task_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_events_from ON task_events(from_status, at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_events_to ON task_events(to_status, at)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_rollups (
+            dim TEXT NOT NULL CHECK(dim IN ('all','agent','project','role_hat')),
+            key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            entered INTEGER NOT NULL DEFAULT 0,
+            exited INTEGER NOT NULL DEFAULT 0,
+            seconds REAL NOT NULL DEFAULT 0,
+            rework INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dim, key, state)
+        ) WITHOUT ROWID
+    ''')
+
+    now = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS task_events_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO task_events (task_id, from_status, to_status, agent, project, role_hat, at)
+            VALUES (NEW.id, NULL, NEW.status, NEW.assigned_to, NEW.project, NEW.role_hat, {now});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS task_events_status AFTER UPDATE OF status ON tasks
+        WHEN NEW.status IS NOT OLD.status
+        BEGIN
+            INSERT INTO task_events (task_id, from_status, to_status, agent, project, role_hat, at, seconds_in_prev)
+            VALUES (NEW.id, OLD.status, NEW.status, NEW.assigned_to, NEW.project, NEW.role_hat, {now},
+                    (julianday({now}) - julianday((SELECT at FROM task_events WHERE task_id = NEW.id ORDER BY id DESC LIMIT 1))) * 86400);
+        END
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS task_rollups_insert AFTER INSERT ON task_events
+        BEGIN
+            INSERT INTO task_rollups (dim, key, state, entered, rework)
+            SELECT dim, key, NEW.to_status, 1,
+                   COALESCE(NEW.to_status = 'in_progress' AND NEW.from_status IN ('review', 'completed'), 0)
+            FROM {_ROLLUP_DIMS} WHERE 1
+            ON CONFLICT (dim, key, state) DO UPDATE SET
+                entered = entered + 1, rework = rework + excluded.rework;
+            INSERT INTO task_rollups (dim, key, state, exited, seconds)
+            SELECT dim, key, NEW.from_status, 1, COALESCE(NEW.seconds_in_prev, 0)
+            FROM {_ROLLUP_DIMS} WHERE NEW.from_status IS NOT NULL
+            ON CONFLICT (dim, key, state) DO UPDATE SET
+                exited = exited + 1, seconds = seconds + excluded.seconds;
+        END
+    ''')
+
+    cursor.execute("""
+        INSERT INTO task_events (task_id, from_status, to_status, agent, project, role_hat, at)
+        SELECT id, NULL, status, assigned_to, project, role_hat, COALESCE(updated_at, created_at) FROM tasks
+        ORDER BY created_at, id
+    """)
+
+
+def _v14_task_event_filters(cursor):
+    """Indexes for task_metrics' filtered reads of task_events.
+
+    v13 only indexed task_events by task and by status, so any project,
+    agent, role_hat or since filter that the rollups can't answer scanned
+    the whole log. Each filter column now leads an index that ends in
+    (from_status, seconds_in_prev), the order percentiles are read in,
+    and since seeks on at.
+    """
+    for column in ("project", "agent", "role_hat"):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_task_events_{column} "
+                       f"ON task_events({column}, from_status, seconds_in_prev)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_events_at ON task_events(at)")
+
+
+def _v15_task_rollup_tasks(cursor):
+    """task_rollups.tasks: distinct tasks that entered each state.
+
+    entered counts transitions, so a task completed, sent back and
+    completed again counted twice toward completed throughput. tasks
+    counts it once per rollup row: the trigger adds 1 only when no earlier
+    task_events row took the same task into the same state under the same
+    agent, project or role_hat (a per-task seek on task_events(task_id, id)).
+    """
+    cursor.execute("ALTER TABLE task_rollups ADD COLUMN tasks INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE task_rollups SET tasks = (
+            SELECT COUNT(DISTINCT e.task_id) FROM task_events e
+            WHERE e.to_status = task_rollups.state AND CASE task_rollups.dim
+                WHEN 'agent' THEN e.agent = task_rollups.key
+                WHEN 'project' THEN e.project = task_rollups.key
+                WHEN 'role_hat' THEN e.role_hat = task_rollups.key
+                ELSE 1 END)
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS task_rollups_insert")
+    cursor.execute(f'''
+        CREATE TRIGGER task_rollups_insert AFTER INSERT ON task_events
+        BEGIN
+            INSERT INTO task_rollups (dim, key, state, entered, tasks, rework)
+            SELECT d.dim, d.key, NEW.to_status, 1,
+                   NOT EXISTS (SELECT 1 FROM task_events p
+                               WHERE p.task_id = NEW.task_id AND p.id < NEW.id AND p.to_status = NEW.to_status
+                                 AND CASE d.dim WHEN 'agent' THEN p.agent = d.key
+                                                WHEN 'project' THEN p.project = d.key
+                                                WHEN 'role_hat' THEN p.role_hat = d.key
+                                                ELSE 1 END),
+                   COALESCE(NEW.to_status = 'in_progress' AND NEW.from_status IN ('review', 'completed'), 0)
+            FROM {_ROLLUP_DIMS} AS d WHERE 1
+            ON CONFLICT (dim, key, state) DO UPDATE SET
+                entered = entered + 1, tasks = tasks + excluded.tasks, rework = rework + excluded.rework;
+            INSERT INTO task_rollups (dim, key, state, exited, seconds)
+            SELECT dim, key, NEW.from_status, 1, COALESCE(NEW.seconds_in_prev, 0)
+            FROM {_ROLLUP_DIMS} WHERE NEW.from_status IS NOT NULL
+            ON CONFLICT (dim, key, state) DO UPDATE SET
+                exited = exited + 1, seconds = seconds + excluded.seconds;
+        END
+    ''')
+
+
+MIGRATIONS = [
+    _v1_base_schema,
+    _v2_hot_path_indexes,
+    _v3_broadcast_watermarks,
+    _v4_inbox_counters,
+    _v5_message_bodies,
+    _v6_history_keys,
+    _v7_search_index,
+    _v8_events,
+    _v9_agent_roles,
+    _v10_agent_names,
+    _v11_sequences,
+    _v12_task_pages,
+    _v13_task_events,
+    _v14_task_event_filters,
+    _v15_task_rollup_tasks,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    """The last migration applied to this database (0 = never migrated)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """Bring the database up to SCHEMA_VERSION. Returns the versions applied.
+
+    Each migration commits together with its user_version bump, so an
+    upgrade interrupted halfway resumes from the last completed version.
+    """
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+
+    applied = []
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read under the write lock: another process may have migrated.
+            version = schema_version(conn)
+            if version >= SCHEMA_VERSION:
+                conn.rollback()
+                return applied
+            MIGRATIONS[version](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version + 1)
@@ -0,0 +1,145 @@
+"""Write-behind buffer for agent presence: last_seen, heartbeat_at, status, last_inbox_check.
+
+Every ping, set_status and check_inbox used to commit an UPDATE to agents
+just to move a timestamp. With each agent heartbeating once a minute, most
+write transactions in a quiet room were presence noise queued on the one
+writer ahead of real messages. These fields now land here first and reach
+SQLite in one transaction every few seconds, and once more on shutdown.
+
+Readers that show presence (who, list_tasks' dead-agent warnings) overlay
+the buffer on the rows they read, so they see the latest values whether
+or not they have been flushed yet. A crash loses at most one interval of
+timestamps, never a message or a task.
+
+Usage:
+    buffer = PresenceBuffer()
+    buffer.update("spartan", last_seen=now, heartbeat_at=now)
+    rows = buffer.overlay(rows)                 # dicts keyed by "name"
+    flusher = PresenceFlusher(pool, buffer, interval_s=5)
+    flusher.start()
+    ...
+    flusher.stop()                              # flushes what is left
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("dead-drop")
+
+FIELDS = ("last_seen", "heartbeat_at", "status", "last_inbox_check")
+
+_UPDATE = "UPDATE agents SET " + ", ".join(f"{f} = COALESCE(?, {f})" for f in FIELDS) + " WHERE name = ?"
+
+
+class PresenceBuffer:
+    """Pending presence fields per agent, newest value wins. Thread-safe."""
+
+    def __init__(self):
+        self._pending = {}               # agent_name → {field: value}
+        self._lock = threading.Lock()
+
+    def update(self, agent_name, **fields):
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"not presence fields: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self._pending.setdefault(agent_name, {}).update(fields)
+
+    def get(self, agent_name):
+        """The agent's unflushed fields ({} if none)."""
+        with self._lock:
+            return dict(self._pending.get(agent_name, ()))
+
+    def overlay(self, rows, key="name"):
+        """Apply unflushed fields to agents rows (dicts), in place. Returns rows."""
+        with self._lock:
+            for row in rows:
+                row.update(self._pending.get(row[key], ()))
+        return rows
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, conn):
+        """Write every pending agent's fields and commit. Returns how many agents were written.
+
+        Pending entries are taken out before the write; if it fails they are
+        put back under anything that arrived meanwhile, which is newer.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            conn.executemany(_UPDATE, [[fields.get(f) for f in FIELDS] + [name] for name, fields in pending.items()])
+            conn.commit()
+        except Exception:
+            with self._lock:
+                for name, fields in pending.items():
+                    self._pending[name] = {**fields, **self._pending.get(name, {})}
+            raise
+        return len(pending)
+
+
+class PresenceFlusher:
+    """Flushes a PresenceBuffer through a ConnectionPool's writer every interval_s seconds, on its own thread."""
+
+    def __init__(self, pool, buffer, interval_s=5.0):
+        self.pool = pool
+        self.buffer = buffer
+        self.interval_s = max(0.1, interval_s)
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "flushes": 0,
+            "agents_written": 0,
+            "errors": 0,
+            "last_flush_ms": 0.0,
+            "last_error": None,
+        }
+
+    def flush_once(self):
+        """Flush now. Returns how many agents were written; errors are logged and counted."""
+        if not len(self.buffer):
+            return 0
+        started = time.perf_counter()
+        written, error = 0, None
+        try:
+            with self.pool.writer() as conn:
+                written = self.buffer.flush(conn)
+        except Exception as e:
+            logger.warning(f"PRESENCE: flush failed: {e}")
+            error = str(e)
+
+        with self._stats_lock:
+            self._stats["flushes"] += 1
+            self._stats["agents_written"] += written
+            self._stats["errors"] += error is not None
+            self._stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            self._stats["last_error"] = error
+        return written
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.flush_once()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="dead-drop-presence", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the thread and flush whatever is still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush_once()
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, pending=len(self.buffer))
@@ -0,0 +1,366 @@
+"""Retention for a room's database: a cold tier for old mail, and vacuuming.
+
+Left alone a room database only grows — every message ever sent, every
+handshake — and the hot tables and indexes that inbox and history queries
+walk grow with it. Retention moves mail that nobody can still need from
+the inbox into a cold database attached to every pooled connection as
+"cold" (messages.cold.db beside messages.db by default):
+
+    a message moves once it is older than the retention age and every
+    delivery of it has been read — direct and CC deliveries by read_flag,
+    broadcasts by sitting at or below every other agent's watermark.
+
+The cold database has the same message_bodies / deliveries tables, the
+same messages view and its own messages_fts index, under the same ids, so
+get_history and search read both tiers and merge them. check_inbox and the
+unread counters never see cold mail, which is all read. Handshake records
+and event-stream log rows older than the retention age are deleted.
+
+SQLite commits a transaction that spans attached WAL databases atomically
+per database only, so each batch is copied into the cold tier and
+committed before it is deleted from the hot one. A crash in between
+leaves a batch in both tiers; the next run finds it still eligible, keeps
+the copies it already has (INSERT OR IGNORE) and deletes the hot rows.
+Readers drop the duplicate ids meanwhile.
+
+Freed pages go back to the filesystem through PRAGMA incremental_vacuum,
+which only works once auto_vacuum is INCREMENTAL. Files created by
+ConnectionPool start that way; an existing one needs a single full VACUUM to switch,
+which blocks the room while it runs, so it is left to the command line:
+
+Usage:
+    python -m dead_drop.retention ~/.dead-drop/messages.db --days 30 [--cold PATH] [--enable-vacuum]
+
+In the room server, DEAD_DROP_RETENTION_DAYS turns on a RetentionWorker
+that does the same every DEAD_DROP_RETENTION_INTERVAL seconds; its
+counters, including bytes reclaimed, are in the server_stats tool.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("dead-drop")
+
+COLD = "cold"
+BATCH = 500  # bodies moved per transaction; bounds how long the writer is held
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def cold_path(db_path):
+    """Default cold database for a room database: messages.db → messages.cold.db."""
+    return os.path.splitext(db_path)[0] + ".cold.db"
+
+
+def ensure_cold_schema(conn, schema=COLD):
+    """Create the cold tier's tables, indexes, view and search index if missing.
+
+    The same shape as the hot tables (migrations v5–v7) minus what only
+    unread mail needs: no inbox index and no counter triggers. Ids are
+    copied from the hot tier, so nothing here autoincrements.
+    """
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.message_bodies (
+            id INTEGER PRIMARY KEY,
+            from_agent TEXT,
+            content TEXT,
+            timestamp TEXT,
+            task_id TEXT DEFAULT NULL,
+            reply_to INTEGER DEFAULT NULL
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.deliveries (
+            id INTEGER PRIMARY KEY,
+            body_id INTEGER NOT NULL,
+            to_agent TEXT,
+            read_flag INTEGER DEFAULT 1,
+            is_cc INTEGER DEFAULT 0,
+            cc_original_to TEXT DEFAULT NULL,
+            from_agent TEXT
+        )
+    ''')
+    conn.execute(f'''
+        CREATE VIEW IF NOT EXISTS {schema}.messages AS
+        SELECT d.id, b.from_agent, d.to_agent, b.content, b.timestamp,
+               d.read_flag, d.is_cc, d.cc_original_to, b.task_id, b.reply_to
+        FROM deliveries d JOIN message_bodies b ON b.id = d.body_id
+    ''')
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_deliveries_to_id ON deliveries(to_agent, id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_deliveries_from_id ON deliveries(from_agent, id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_deliveries_body ON deliveries(body_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_message_bodies_task ON message_bodies(task_id, timestamp)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_message_bodies_timestamp ON message_bodies(timestamp)")
+
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.messages_fts USING fts5(
+            content, content='message_bodies', content_rowid='id', tokenize='porter unicode61'
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}.messages_fts_insert AFTER INSERT ON message_bodies
+        BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}.messages_fts_delete AFTER DELETE ON message_bodies
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+        END
+    ''')
+
+
+def cutoff_for(days, now=None):
+    """The timestamp before which mail is old enough to move, in the rooms' isoformat."""
+    now = now or datetime.datetime.now()
+    return (now - datetime.timedelta(days=days)).isoformat()
+
+
+def _placeholders(values):
+    return ",".join(["?"] * len(values))
+
+
+def move_batch(conn, cutoff, after=("", 0), batch=BATCH, schema=COLD):
+    """Move one batch of fully read mail older than cutoff into the cold tier.
+
+    Walks message_bodies in (timestamp, id) order from the `after` cursor,
+    so bodies that must stay (someone hasn't read them) are passed over
+    once per run rather than re-read by every batch. Commits twice — the
+    copy, then the delete — and must be called outside a transaction.
+
+    Returns (cursor, bodies_moved, deliveries_moved); cursor is None once
+    the walk has passed the cutoff.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("""
+            SELECT b.id, b.timestamp, NOT EXISTS (
+                SELECT 1 FROM main.deliveries d WHERE d.body_id = b.id AND (
+                    (d.to_agent != 'all' AND d.read_flag = 0)
+                    OR (d.to_agent = 'all' AND EXISTS (
+                        SELECT 1 FROM main.agents a
+                        LEFT JOIN main.broadcast_watermarks w ON w.agent_name = a.name
+                        WHERE a.name != b.from_agent AND COALESCE(w.last_read_id, 0) < d.id
+                    ))
+                )
+            ) AS done
+            FROM main.message_bodies b
+            WHERE b.timestamp < ? AND (b.timestamp, b.id) > (?, ?)
+            ORDER BY b.timestamp, b.id LIMIT ?
+        """, (cutoff, after[0], after[1], batch)).fetchall()
+        ids = [row[0] for row in rows if row[2]]
+        if ids:
+            marks = _placeholders(ids)
+            conn.execute(f"""
+                INSERT OR IGNORE INTO {schema}.message_bodies (id, from_agent, content, timestamp, task_id, reply_to)
+                SELECT id, from_agent, content, timestamp, task_id, reply_to FROM main.message_bodies WHERE id IN ({marks})
+            """, ids)
+            conn.execute(f"""
+                INSERT OR IGNORE INTO {schema}.deliveries (id, body_id, to_agent, read_flag, is_cc, cc_original_to, from_agent)
+                SELECT id, body_id, to_agent, 1, is_cc, cc_original_to, from_agent FROM main.deliveries WHERE body_id IN ({marks})
+            """, ids)
+        conn.commit()
+
+        deliveries = 0
+        if ids:
+            # Deliveries before bodies: the counter triggers on deliveries
+            # look up the sender on the body.
+            conn.execute("BEGIN IMMEDIATE")
+            deliveries = conn.execute(f"DELETE FROM main.deliveries WHERE body_id IN ({marks})", ids).rowcount
+            conn.execute(f"DELETE FROM main.message_bodies WHERE id IN ({marks})", ids)
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    cursor = (rows[-1][1], rows[-1][0]) if len(rows) == batch else None
+    return cursor, len(ids), deliveries
+
+
+def prune_handshakes(conn, cutoff):
+    """Delete handshakes (and their ACKs) created before cutoff, in the caller's transaction."""
+    conn.execute("""
+        DELETE FROM handshake_acks WHERE handshake_id IN (SELECT id FROM handshakes WHERE created_at < ?)
+    """, (cutoff,))
+    return conn.execute("DELETE FROM handshakes WHERE created_at < ?", (cutoff,)).rowcount
+
+
+def prune_events(conn, cutoff):
+    """Delete event-stream log rows created before cutoff, in the caller's transaction."""
+    return conn.execute("DELETE FROM events WHERE created_at < ?", (cutoff,)).rowcount
+
+
+def incremental_vacuum(conn, schema="main"):
+    """Return free pages to the filesystem. Returns bytes reclaimed (0 unless auto_vacuum is incremental)."""
+    if conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0] != 2:
+        return 0
+    page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    before = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    # sqlite3's execute() steps a pragma once, which frees one page;
+    # executescript() runs it to completion.
+    conn.executescript(f"PRAGMA {schema}.incremental_vacuum;")
+    after = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+    return (before - after) * page_size
+
+
+def space(conn, schema="main"):
+    """auto_vacuum mode, file size and free (reclaimable) bytes of one attached database."""
+    page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+    return {
+        "auto_vacuum": AUTO_VACUUM_MODES.get(conn.execute(f"PRAGMA {schema}.auto_vacuum").fetchone()[0], "?"),
+        "bytes": conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0] * page_size,
+        "free_bytes": conn.execute(f"PRAGMA {schema}.freelist_count").fetchone()[0] * page_size,
+    }
+
+
+def run(checkout, days, batch=BATCH, stopping=lambda: False):
+    """One full retention pass. Returns what it did.
+
+    checkout() returns a context manager yielding a connection with the
+    cold tier attached and no transaction open — ConnectionPool.writer, or
+    a nullcontext around a plain connection. It is called once per batch,
+    so other writers get the connection in between.
+    """
+    cutoff = cutoff_for(days)
+    done = {"messages_moved": 0, "deliveries_moved": 0, "handshakes_pruned": 0, "events_pruned": 0,
+            "bytes_reclaimed": 0}
+    cursor = ("", 0)
+    while cursor is not None and not stopping():
+        with checkout() as conn:
+            cursor, bodies, deliveries = move_batch(conn, cutoff, cursor, batch)
+        done["messages_moved"] += bodies
+        done["deliveries_moved"] += deliveries
+    with checkout() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        done["handshakes_pruned"] = prune_handshakes(conn, cutoff)
+        done["events_pruned"] = prune_events(conn, cutoff)
+        conn.commit()
+        done["bytes_reclaimed"] = incremental_vacuum(conn)
+    return done
+
+
+class RetentionWorker:
+    """Runs retention on a ConnectionPool every interval_s seconds, on its own thread.
+
+    Usage:
+        worker = RetentionWorker(pool, days=30, interval_s=3600)
+        worker.start()
+        worker.stats()
+
+    Each batch checks out the pool's writer, so tool writes wait at most
+    one batch. It uses the writer directly rather than through DBExecutor
+    because a batch commits twice (see move_batch), which a group-committed
+    write may not.
+    """
+
+    def __init__(self, pool, days, interval_s=3600.0, batch=BATCH):
+        self.pool = pool
+        self.days = days
+        self.interval_s = max(1.0, interval_s)
+        self.batch = batch
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "errors": 0,
+            "messages_moved": 0,
+            "deliveries_moved": 0,
+            "handshakes_pruned": 0,
+            "events_pruned": 0,
+            "bytes_reclaimed": 0,
+            "last_run_at": None,
+            "last_run_ms": 0.0,
+            "last_error": None,
+        }
+
+    def run_once(self):
+        """One retention pass. Returns what it did; errors are logged and counted."""
+        started = time.perf_counter()
+        done = {}
+        try:
+            done = run(self.pool.writer, self.days, self.batch, self._stop.is_set)
+            error = None
+        except Exception as e:
+            logger.warning(f"RETENTION: pass failed: {e}")
+            error = str(e)
+
+        with self._stats_lock:
+            self._stats["runs"] += 1
+            self._stats["errors"] += error is not None
+            for key, value in done.items():
+                self._stats[key] += value
+            self._stats["last_run_at"] = datetime.datetime.now().isoformat()
+            self._stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            self._stats["last_error"] = error
+        if done.get("messages_moved") or done.get("bytes_reclaimed"):
+            logger.info(f"RETENTION: moved {done['messages_moved']} message(s) to the cold tier, "
+                        f"reclaimed {done['bytes_reclaimed']} bytes")
+        return done
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="dead-drop-retention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        """Totals since start. space() gives each tier's current size."""
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["days"] = self.days
+        result["interval_s"] = self.interval_s
+        return result
+
+
+def enable_incremental_vacuum(conn):
+    """Switch an existing database to auto_vacuum=INCREMENTAL. Rewrites the whole file (VACUUM)."""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a room's old, read mail to its cold tier and vacuum.")
+    parser.add_argument("db_path")
+    parser.add_argument("--days", type=float, required=True, help="move read mail older than this")
+    parser.add_argument("--cold", help="cold database (default: <db>.cold.db)")
+    parser.add_argument("--enable-vacuum", action="store_true",
+                        help="switch to auto_vacuum=INCREMENTAL first (full VACUUM; stop the room server)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    conn.execute("PRAGMA busy_timeout=5000")
+    if args.enable_vacuum:
+        enable_incremental_vacuum(conn)
+    conn.execute(f"ATTACH DATABASE ? AS {COLD}", (args.cold or cold_path(args.db_path),))
+    conn.execute(f"PRAGMA {COLD}.auto_vacuum=INCREMENTAL")
+    conn.execute(f"PRAGMA {COLD}.journal_mode=WAL")
+    ensure_cold_schema(conn)
+    conn.commit()
+    result = run(lambda: contextlib.nullcontext(conn), args.days)
+    result["hot"] = space(conn)
+    result["cold"] = space(conn, COLD)
+    conn.close()
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
 from mcp.server.fastmcp import FastMCP, Context
-import sqlite3
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+import asyncio
 import datetime
 import os
 import json
 import sys
 import logging
+import math
+import sqlite3
+import threading
+import time
+
+from dead_drop import wire
+from dead_drop.cache import LRUCache
+from dead_drop.counters import check as check_counters
+from dead_drop.db import ConnectionPool, DBExecutor
+from dead_drop.migrations import migrate
+from dead_drop.presence import PresenceBuffer, PresenceFlusher
+from dead_drop.retention import COLD, RetentionWorker, cold_path, ensure_cold_schema, space as retention_space
 
 logger = logging.getLogger("dead-drop")
 
@@ -17,6 +31,28 @@ RUNTIME_DIR = os.path.dirname(DB_PATH)
 PORT = int(os.getenv("DEAD_DROP_PORT", "9400"))
 HOST = os.getenv("DEAD_DROP_HOST", "127.0.0.1")
 ROOM_TOKEN = os.getenv("DEAD_DROP_ROOM_TOKEN", "")
+DB_READERS = int(os.getenv("DEAD_DROP_DB_READERS", "4"))
+WRITE_BATCH_MS = float(os.getenv("DEAD_DROP_WRITE_BATCH_MS", "2"))
+WRITE_BATCH_MAX = int(os.getenv("DEAD_DROP_WRITE_BATCH_MAX", "64"))
+CACHE_SIZE = int(os.getenv("DEAD_DROP_CACHE_SIZE", "1024"))
+INBOX_PAGE_SIZE = int(os.getenv("DEAD_DROP_INBOX_PAGE_SIZE", "50"))
+PAGE_MAX = 500  # most rows one check_inbox / get_history call returns
+WAIT_MAX = 300  # longest wait_for_messages parks, in seconds
+PUSH_CONCURRENCY = int(os.getenv("DEAD_DROP_PUSH_CONCURRENCY", "16"))
+PUSH_TIMEOUT = float(os.getenv("DEAD_DROP_PUSH_TIMEOUT", "5"))
+PUSH_COALESCE_MS = float(os.getenv("DEAD_DROP_PUSH_COALESCE_MS", "100"))
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("DEAD_DROP_PRESENCE_FLUSH_S", "5"))
+SESSION_IDLE = float(os.getenv("DEAD_DROP_SESSION_IDLE", "86400"))
+SESSION_SWEEP_INTERVAL = 60
+METRICS_WINDOW_DAYS = float(os.getenv("DEAD_DROP_METRICS_WINDOW_DAYS", "30"))  # 0 = percentiles over all history
+EVENTS_KEEPALIVE = 15  # seconds between SSE comments on an idle stream
+EVENTS_BATCH = 100  # events read per query while a stream catches up
+EVENTS_REPLAY_HOURS = float(os.getenv("DEAD_DROP_EVENTS_REPLAY_HOURS", "24"))  # 0 = keep until retention prunes
+EVENTS_TRIM_EVERY = 256  # events inserted between trims of the replay window
+EVENTS_TRIM_MAX = 1024  # most rows one trim deletes, so a backlog drains over several
+RETENTION_DAYS = float(os.getenv("DEAD_DROP_RETENTION_DAYS", "0"))  # 0 = keep everything hot
+RETENTION_INTERVAL = float(os.getenv("DEAD_DROP_RETENTION_INTERVAL", "3600"))
+COLD_DB_PATH = os.getenv("DEAD_DROP_COLD_DB_PATH", cold_path(DB_PATH))
 
 mcp = FastMCP(
     "Dead Drop Server",
@@ -34,35 +70,137 @@ mcp = FastMCP(
 
 _agent_sessions: dict = {}       # agent_name → ServerSession
 _session_to_agent: dict = {}     # id(session) → agent_name
+_session_seen: dict = {}         # agent_name → time.monotonic() of its last tool call
+_session_stats = {"closed": 0, "evicted_dead": 0, "evicted_idle": 0}
+_last_sweep = 0.0
+
+# Agents parked in wait_for_messages: one asyncio.Event per waiting call,
+# set by _notify_agents once a write that delivered them mail has committed.
+_inbox_waiters: dict = {}        # agent_name → {asyncio.Event}
+
+# Push fan-out counters for server_stats: one fan-out per push sent out
+# (per _notify_agents call, or per coalescing window).
+_push_stats = {
+    "fanouts": 0,
+    "coalesced": 0,
+    "recipients": 0,
+    "sent": 0,
+    "failed": 0,
+    "timed_out": 0,
+    "fanout_ms_total": 0.0,
+    "fanout_ms_max": 0.0,
+    "fanout_ms_last": 0.0,
+}
+# With PUSH_COALESCE_MS > 0, agents waiting for the open window's push.
+_pending_pushes: set = set()
+_push_flush = None               # asyncio.Task closing the current window
+# Every flush task until it finishes, including ones whose window has
+# closed and are fanning out: the event loop only holds tasks weakly.
+_push_flushes: set = set()
 
 
 async def _register_session(agent_name, session):
-    """Map agent <-> session for push notifications."""
+    """Map agent <-> session for push notifications, and note the agent is active.
+
+    Cheap when the session is already registered, so tools call it on every
+    call: a client that reconnects replaces its old session at once.
+    """
+    _session_seen[agent_name] = time.monotonic()
+    await _sweep_sessions()
     old = _agent_sessions.get(agent_name)
-    if old:
+    if old is session:
+        return
+    if old and _session_to_agent.get(id(old)) == agent_name:
         _session_to_agent.pop(id(old), None)
     _agent_sessions[agent_name] = session
     _session_to_agent[id(session)] = agent_name
+    # Drop the session as soon as its transport closes, rather than waiting
+    # for a push to fail. Sessions without an exit stack (tests) rely on the sweep.
+    exit_stack = getattr(session, "_exit_stack", None)
+    if exit_stack is not None:
+        exit_stack.push_async_callback(_session_closed, session)
 
 
 async def _unregister_session(agent_name):
     """Remove an agent's session from the registry."""
     session = _agent_sessions.pop(agent_name, None)
-    if session:
+    _session_seen.pop(agent_name, None)
+    if session and _session_to_agent.get(id(session)) == agent_name:
         _session_to_agent.pop(id(session), None)
 
 
+async def _session_closed(session):
+    """Exit hook of a registered session: drop every agent still mapped to it."""
+    for agent_name in [name for name, s in _agent_sessions.items() if s is session]:
+        logger.info(f"SESSION: '{agent_name}' disconnected — unregistering")
+        _session_stats["closed"] += 1
+        await _unregister_session(agent_name)
+
+
+def _session_open(session):
+    """Whether the session's transport is still reading what we write to it."""
+    stream = getattr(session, "_write_stream", None)
+    if stream is None:
+        return True
+    stats = stream.statistics()
+    return stats.open_send_streams > 0 and stats.open_receive_streams > 0
+
+
+def _connected(agent_name):
+    session = _agent_sessions.get(agent_name)
+    return session is not None and _session_open(session)
+
+
+async def _sweep_sessions(force=False):
+    """Evict sessions whose transport is gone or that haven't called a tool in SESSION_IDLE seconds.
+
+    Runs at most every SESSION_SWEEP_INTERVAL seconds, from the tool calls
+    and fan-outs that touch the registry anyway.
+    """
+    global _last_sweep
+    now = time.monotonic()
+    if not force and now - _last_sweep < SESSION_SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    for agent_name, session in list(_agent_sessions.items()):
+        if not _session_open(session):
+            reason = "dead"
+        elif SESSION_IDLE > 0 and now - _session_seen.get(agent_name, now) > SESSION_IDLE:
+            reason = "idle"
+        else:
+            continue
+        logger.info(f"SESSION: evicting '{agent_name}' ({reason})")
+        _session_stats[f"evicted_{reason}"] += 1
+        await _unregister_session(agent_name)
+
+
+def _wake_waiters(agent_name):
+    """Wake the agent's wait_for_messages calls."""
+    # Mail to "team/agent" is in the inbox of "agent" too (see _read_inbox).
+    for name in {agent_name, agent_name.rsplit("/", 1)[-1]}:
+        for event in _inbox_waiters.get(name, ()):
+            event.set()
+
+
 async def _notify_agent(agent_name, from_agent=None):
-    """Push tools/list_changed + log message to a connected agent's session."""
+    """Push tools/list_changed + log message to a connected agent's session.
+    Returns True if sent, False if the session failed, None if there is none."""
     session = _agent_sessions.get(agent_name)
+    if session and not _session_open(session):
+        logger.info(f"PUSH: transport for '{agent_name}' is closed — unregistering")
+        await _unregister_session(agent_name)
+        session = None
     if session:
         try:
+            # Read unread info first: it warms _unread_cache for the
+            # tools/list the client sends back on list_changed.
+            count, senders = await _get_unread_info(agent_name)
+
             # 1. Push tools/list_changed (updates tool descriptions with unread alert)
             logger.info(f"PUSH: sending tools/list_changed to '{agent_name}' (session {id(session)})")
             await session.send_tool_list_changed()
 
             # 2. Push log message (surfaces directly in the client's conversation)
-            count, senders = _get_unread_info(agent_name)
             sender_str = ", ".join(senders)
             alert = f"YOU HAVE {count} UNREAD MESSAGE(S) from {sender_str}. Call check_inbox(agent_name=\"{agent_name}\") NOW."
             await session.send_log_message(
@@ -72,61 +210,264 @@ async def _notify_agent(agent_name, from_agent=None):
             )
 
             logger.info(f"PUSH: successfully sent to '{agent_name}' (tools_changed + log_message)")
+            return True
         except Exception as e:
             logger.warning(f"PUSH: failed for '{agent_name}': {e} — cleaning up session")
             # Session is dead, clean it up
             await _unregister_session(agent_name)
+            return False
     else:
         logger.info(f"PUSH: no session found for '{agent_name}' — skipping")
+        return None
 
 
 async def _notify_agents(names):
-    """Push tools/list_changed to multiple agents."""
+    """Wake waiters, then push tools/list_changed to multiple agents.
+
+    With PUSH_COALESCE_MS > 0 the push is deferred: every agent notified
+    within the window gets one push when it closes, carrying the unread
+    count and senders as they are then, instead of one per write. Waiters
+    are still woken at once.
+    """
+    global _push_flush
+    names = list(dict.fromkeys(names))
     for name in names:
-        await _notify_agent(name)
+        _wake_waiters(name)
+    if not names:
+        return
+    if PUSH_COALESCE_MS <= 0:
+        await _fan_out(names)
+        return
+
+    _push_stats["coalesced"] += sum(1 for name in names if name in _pending_pushes)
+    _pending_pushes.update(names)
+    if _push_flush is None:
+        _push_flush = asyncio.create_task(_flush_pushes())
+        _push_flushes.add(_push_flush)
+        _push_flush.add_done_callback(_push_flush_done)
+
+
+def _push_flush_done(task):
+    _push_flushes.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"PUSH: coalesced fan-out failed: {task.exception()!r}")
+
+
+async def _flush_pushes():
+    """Close the coalescing window: push once to every agent notified in it."""
+    global _push_flush
+    await asyncio.sleep(PUSH_COALESCE_MS / 1000)
+    names = list(_pending_pushes)
+    _pending_pushes.clear()
+    # Notifications from here on open a new window.
+    _push_flush = None
+    await _fan_out(names)
+
+
+async def _fan_out(names):
+    """Push to agents concurrently.
+
+    At most PUSH_CONCURRENCY pushes are in flight, and the whole fan-out
+    ends PUSH_TIMEOUT seconds after it starts: a push still pending then
+    is cancelled, so one slow or hung client can't hold up the tool call
+    that sent the mail, or the other recipients.
+    """
+    await _sweep_sessions()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + PUSH_TIMEOUT
+    slots = asyncio.Semaphore(PUSH_CONCURRENCY)
+
+    async def _push(name):
+        async with slots:
+            try:
+                return await asyncio.wait_for(_notify_agent(name), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                logger.warning(f"PUSH: '{name}' did not take the push within {PUSH_TIMEOUT}s — skipped")
+                return "timed_out"
+
+    outcomes = await asyncio.gather(*(_push(name) for name in names))
+    elapsed_ms = (loop.time() - started) * 1000
+    _push_stats["fanouts"] += 1
+    _push_stats["recipients"] += len(names)
+    _push_stats["sent"] += outcomes.count(True)
+    _push_stats["failed"] += outcomes.count(False)
+    _push_stats["timed_out"] += outcomes.count("timed_out")
+    _push_stats["fanout_ms_total"] += elapsed_ms
+    _push_stats["fanout_ms_max"] = max(_push_stats["fanout_ms_max"], elapsed_ms)
+    _push_stats["fanout_ms_last"] = elapsed_ms
+
+
+async def _get_unread_info(agent_name):
+    """Returns (count, [unique_sender_names]) for unread messages. Served from _unread_cache when possible."""
+    hit, cached = _unread_cache.lookup(agent_name)
+    if hit:
+        return cached
+
+    def _q(conn):
+        # inbox_counters is kept current by triggers (migrations v4)
+        rows = conn.execute("""
+            SELECT from_agent, direct_unread + broadcast_unread FROM inbox_counters
+            WHERE agent_name = ? AND direct_unread + broadcast_unread > 0
+        """, (agent_name,)).fetchall()
+        return sum(r[1] for r in rows), [r[0] for r in rows]
+
+    info = await _db.read(_q)
+    _unread_cache.put(agent_name, info, cached)
+    return info
 
 
-def _get_unread_info(agent_name):
-    """Returns (count, [unique_sender_names]) for unread messages."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+# ── Database ─────────────────────────────────────────────────────────
+# One long-lived writer connection plus a small pool of readers, configured
+# once at startup. Tools never touch them on the event loop: _db runs each
+# query on a worker thread, so a write stuck on busy_timeout doesn't freeze
+# every other agent's session. Writes from all tools share one writer
+# thread that group-commits them (see DBExecutor).
+#
+# With retention on (or a cold tier left from when it was), old read mail
+# lives in a second database attached to every connection as "cold"; see
+# dead_drop.retention. History and search read both tiers.
+
+_pool = ConnectionPool(DB_PATH, readers=DB_READERS,
+                       attach={COLD: COLD_DB_PATH} if RETENTION_DAYS > 0 or os.path.exists(COLD_DB_PATH) else None)
+_db = DBExecutor(_pool, batch_window_ms=WRITE_BATCH_MS, batch_max=WRITE_BATCH_MAX)
+_retention = RetentionWorker(_pool, RETENTION_DAYS, RETENTION_INTERVAL) if RETENTION_DAYS > 0 else None
+
+# last_seen / heartbeat_at / status / last_inbox_check are written behind:
+# tools update _presence, _presence_flusher commits it every few seconds
+# (see dead_drop.presence). Readers of those fields overlay _presence.
+_presence = PresenceBuffer()
+_presence_flusher = PresenceFlusher(_pool, _presence, PRESENCE_FLUSH_INTERVAL)
+
+# In-process caches: agent → (unread count, senders) for alerts and the
+# tools/list banner, agent → team/roles for name resolution, short name →
+# registered names for send's recipient resolution. TEMP triggers on the
+# writer connection report every inbox_counters / agents / agent_names row
+# a write touches, whichever tool made it; those keys are invalidated as the
+# write happens and again once the writer is released (committed or rolled back).
+_unread_cache = LRUCache(CACHE_SIZE)
+_agent_cache = LRUCache(CACHE_SIZE)
+_name_cache = LRUCache(CACHE_SIZE)
+_caches = {"unread": _unread_cache, "agent": _agent_cache, "names": _name_cache}
+
+# Names of the agents with the lead role (agent_roles, migrations v9).
+# Loaded by init_db and updated by register / deregister once their write
+# commits; rebound, never mutated, so writer-thread readers see a whole tuple.
+_leads: tuple = ()
+_touched_agents = set()
+
+
+def _row_touched(cache_name, agent_name):
+    _caches[cache_name].invalidate(agent_name)
+    _touched_agents.add((cache_name, agent_name))
+
+
+def _flush_touched():
+    while _touched_agents:
+        cache_name, agent_name = _touched_agents.pop()
+        _caches[cache_name].invalidate(agent_name)
+
+
+def _install_cache_triggers(conn):
+    conn.create_function("dead_drop_touched", 2, _row_touched)
+    watched = [
+        ("unread", "inbox_counters", "INSERT", "NEW.agent_name"),
+        ("unread", "inbox_counters", "UPDATE", "NEW.agent_name"),
+        ("unread", "inbox_counters", "DELETE", "OLD.agent_name"),
+        ("agent", "agents", "INSERT", "NEW.name"),
+        ("agent", "agents", "UPDATE OF team, role", "NEW.name"),
+        ("agent", "agents", "DELETE", "OLD.name"),
+        ("names", "agent_names", "INSERT", "NEW.short_name"),
+        ("names", "agent_names", "DELETE", "OLD.short_name"),
+    ]
+    for cache_name, table, event, key in watched:
+        conn.execute(f"""
+            CREATE TEMP TRIGGER IF NOT EXISTS cache_{table}_{event.split()[0].lower()}
+            AFTER {event} ON main.{table}
+            BEGIN SELECT dead_drop_touched('{cache_name}', {key}); END
+        """)
+
+
+def _agent_profile(cursor, name):
+    """{'team': str, 'roles': [str]} for a registered agent, None otherwise. Cached in _agent_cache."""
+    hit, cached = _agent_cache.lookup(name)
+    if hit:
+        return cached
+    cursor.execute("SELECT team, role FROM agents WHERE name = ?", (name,))
+    row = cursor.fetchone()
+    profile = None
+    if row:
+        profile = {"team": row[0] or "", "roles": [r.strip() for r in (row[1] or "").split(",") if r.strip()]}
+    _agent_cache.put(name, profile, cached)
+    return profile
+
+
+def _agents_named(cursor, short_name):
+    """Registered names whose short form is short_name, e.g. ("spartan", "gypsy-danger/spartan"). Cached in _name_cache."""
+    hit, cached = _name_cache.lookup(short_name)
+    if hit:
+        return cached
+    cursor.execute("SELECT name FROM agent_names WHERE short_name = ? ORDER BY name", (short_name,))
+    names = tuple(row[0] for row in cursor.fetchall())
+    _name_cache.put(short_name, names, cached)
+    return names
+
+
+def _get_leads():
+    """Names of all agents with the lead role, in registration order."""
+    return list(_leads)
+
+
+def _load_leads(conn):
+    global _leads
+    _leads = tuple(row[0] for row in conn.execute("""
+        SELECT agent_roles.agent FROM agent_roles JOIN agents ON agents.name = agent_roles.agent
+        WHERE agent_roles.role = 'lead' ORDER BY agents.rowid
+    """))
+
+
+def _set_lead(agent_name, is_lead):
+    """Keep _leads in step with a committed register/deregister."""
+    global _leads
+    if is_lead and agent_name not in _leads:
+        _leads = _leads + (agent_name,)
+    elif not is_lead and agent_name in _leads:
+        _leads = tuple(name for name in _leads if name != agent_name)
+
+
+def _insert_message(cursor, from_agent, to, content, task_id=None, reply_to=None, cc=(), cc_original_to=None, at=None):
+    """Store a message body once and deliver it to every agent in `to`, plus a CC
+    copy to every agent in `cc`. Returns the delivery ids — the message ids agents
+    see — `to` first, then `cc`.
+
+    The timestamp is taken here, on the writer thread, and never goes below
+    the newest body's, so message ids and timestamps sort the same way even
+    when group commit runs writes in a different order than they were
+    queued; get_history turns time bounds into id bounds on that basis.
+    `at` writes a given timestamp instead (backdated imports and tests)."""
+    recipients = [(agent, 0) for agent in to] + [(agent, 1) for agent in cc]
+    if not recipients:
+        return []
+    if at is None:
         cursor.execute(
-            "SELECT from_agent FROM messages WHERE to_agent = ? AND read_flag = 0",
-            (agent_name,)
+            """INSERT INTO message_bodies (from_agent, content, timestamp, task_id, reply_to)
+               VALUES (?, ?, max(?, COALESCE((SELECT MAX(timestamp) FROM message_bodies), '')), ?, ?)""",
+            (from_agent, content, datetime.datetime.now().isoformat(), task_id, reply_to)
         )
-        direct = [r[0] for r in cursor.fetchall()]
-        cursor.execute("""
-            SELECT from_agent FROM messages
-            WHERE to_agent = 'all' AND from_agent != ?
-            AND id NOT IN (SELECT message_id FROM broadcast_reads WHERE agent_name = ?)
-        """, (agent_name, agent_name))
-        broadcast = [r[0] for r in cursor.fetchall()]
-        senders = direct + broadcast
-        return len(senders), list(set(senders))
-    finally:
-        conn.close()
-
-
-# ── Database ─────────────────────────────────────────────────────────
-
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA busy_timeout=5000")
-    return conn
-
-
-def _get_leads(cursor):
-    """Find all agents with role containing 'lead'. Returns list of names."""
-    cursor.execute("SELECT name, role FROM agents WHERE role IS NOT NULL")
-    leads = []
-    for row in cursor.fetchall():
-        roles = [r.strip() for r in (row[1] or "").split(",")]
-        if "lead" in roles:
-            leads.append(row[0])
-    return leads
+    else:
+        cursor.execute(
+            "INSERT INTO message_bodies (from_agent, content, timestamp, task_id, reply_to) VALUES (?, ?, ?, ?, ?)",
+            (from_agent, content, at, task_id, reply_to)
+        )
+    body_id = cursor.lastrowid
+    ids = []
+    for agent, is_cc in recipients:
+        cursor.execute(
+            "INSERT INTO deliveries (body_id, from_agent, to_agent, read_flag, is_cc, cc_original_to) VALUES (?, ?, ?, 0, ?, ?)",
+            (body_id, from_agent, agent, is_cc, cc_original_to if is_cc else None)
+        )
+        ids.append(cursor.lastrowid)
+    return ids
 
 
 def _load_onboarding(role):
@@ -144,224 +485,80 @@ def _load_onboarding(role):
     return "\n\n---\n\n".join(parts) if parts else ""
 
 
+def _tiers():
+    """Schemas holding messages, hot first: main, plus the cold tier if attached."""
+    return ("main", COLD) if COLD in _pool.attached else ("main",)
+
+
+# Open event streams (GET /agents/{name}/events), woken when a committed
+# write added rows to the events log. A TEMP trigger flags the insert on the
+# writer thread; the release hook hands the wake-up to each stream's loop.
+_event_streams = set()           # (loop, asyncio.Event), one per open stream
+_event_streams_lock = threading.Lock()
+_events_written = threading.Event()
+
+
+def _install_event_trigger(conn):
+    conn.create_function("dead_drop_event", 0, _events_written.set)
+    conn.execute("""
+        CREATE TEMP TRIGGER IF NOT EXISTS stream_events_insert
+        AFTER INSERT ON main.events
+        BEGIN SELECT dead_drop_event(); END
+    """)
+    # The log only has to cover Last-Event-ID replay, and every delivery,
+    # task transition and handshake adds a row, so trim it here rather than
+    # waiting on retention (off by default). Every EVENTS_TRIM_EVERY-th insert
+    # deletes up to EVENTS_TRIM_MAX rows older than the window.
+    if EVENTS_REPLAY_HOURS > 0:
+        conn.execute(f"""
+            CREATE TEMP TRIGGER IF NOT EXISTS stream_events_trim
+            AFTER INSERT ON main.events WHEN NEW.id % {EVENTS_TRIM_EVERY} = 0
+            BEGIN
+                DELETE FROM events WHERE id IN (
+                    SELECT id FROM events
+                    WHERE created_at < strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime', '-{EVENTS_REPLAY_HOURS:g} hours')
+                    ORDER BY created_at LIMIT {EVENTS_TRIM_MAX});
+            END
+        """)
+
+
+def _wake_event_streams():
+    if not _events_written.is_set():
+        return
+    _events_written.clear()
+    with _event_streams_lock:
+        streams = list(_event_streams)
+    for loop, event in streams:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # the stream's loop is gone
+
+
 def init_db():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS agents (
-            name TEXT PRIMARY KEY,
-            registered_at TEXT,
-            last_seen TEXT,
-            last_inbox_check TEXT,
-            role TEXT DEFAULT NULL,
-            description TEXT DEFAULT NULL,
-            status TEXT DEFAULT 'offline'
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            from_agent TEXT,
-            to_agent TEXT,
-            content TEXT,
-            timestamp TEXT,
-            read_flag INTEGER DEFAULT 0,
-            is_cc INTEGER DEFAULT 0,
-            cc_original_to TEXT DEFAULT NULL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS broadcast_reads (
-            agent_name TEXT,
-            message_id INTEGER,
-            PRIMARY KEY (agent_name, message_id)
-        )
-    ''')
-    # Phase 1: Tasks
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id TEXT PRIMARY KEY,
-            project TEXT DEFAULT '',
-            title TEXT NOT NULL,
-            description TEXT DEFAULT '',
-            assigned_to TEXT,
-            created_by TEXT NOT NULL,
-            status TEXT DEFAULT 'pending'
-                CHECK(status IN ('pending','assigned','in_progress','review','completed','failed','verified')),
-            result TEXT DEFAULT '',
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            completed_at TEXT,
-            role_hat TEXT DEFAULT NULL,
-            goal_id TEXT DEFAULT '',
-            verified_by TEXT DEFAULT '',
-            verified_at TEXT DEFAULT NULL,
-            approved_by TEXT DEFAULT ''
-        )
-    ''')
-    # Phase 7: Goals
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS goals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            goal_id TEXT UNIQUE NOT NULL,
-            title TEXT NOT NULL,
-            description TEXT DEFAULT '',
-            project TEXT DEFAULT '',
-            creator TEXT NOT NULL,
-            status TEXT DEFAULT 'open'
-                CHECK(status IN ('open','active','pending_verify','verified','failed')),
-            verified_by TEXT DEFAULT '',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            verified_at TIMESTAMP DEFAULT NULL
-        )
-    ''')
-    # Phase 2: Handshakes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS handshakes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            initiated_by TEXT NOT NULL,
-            message_id INTEGER NOT NULL,
-            created_at TEXT NOT NULL,
-            status TEXT DEFAULT 'pending'
-                CHECK(status IN ('pending','completed'))
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS handshake_acks (
-            handshake_id INTEGER,
-            agent_name TEXT,
-            acked_at TEXT NOT NULL,
-            PRIMARY KEY (handshake_id, agent_name)
-        )
-    ''')
-    # Phase 5: Interface contracts
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS contracts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project TEXT DEFAULT '',
-            name TEXT NOT NULL,
-            type TEXT NOT NULL
-                CHECK(type IN ('function','dom_id','css_class','file_path','api_endpoint','event','other')),
-            owner TEXT NOT NULL,
-            spec TEXT DEFAULT '',
-            version INTEGER DEFAULT 1,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            UNIQUE(project, name, type)
-        )
-    ''')
-
-    # Phase 6: Minion spawn policy
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS spawn_policy (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            scope TEXT NOT NULL UNIQUE,
-            enabled BOOLEAN DEFAULT 1,
-            max_minions INTEGER DEFAULT 3,
-            set_by TEXT NOT NULL,
-            set_at TEXT NOT NULL
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS minion_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            pilot TEXT NOT NULL,
-            task_description TEXT NOT NULL,
-            status TEXT DEFAULT "spawned",
-            spawned_at TEXT NOT NULL,
-            completed_at TEXT,
-            result TEXT
-        )
-    ''')
-
-    # Migrations — agents
-    cursor.execute("PRAGMA table_info(agents)")
-    cols = [c[1] for c in cursor.fetchall()]
-    if 'last_inbox_check' not in cols:
-        cursor.execute("ALTER TABLE agents ADD COLUMN last_inbox_check TEXT")
-    if 'role' not in cols:
-        cursor.execute("ALTER TABLE agents ADD COLUMN role TEXT DEFAULT NULL")
-    if 'description' not in cols:
-        cursor.execute("ALTER TABLE agents ADD COLUMN description TEXT DEFAULT NULL")
-    if 'status' not in cols:
-        cursor.execute("ALTER TABLE agents ADD COLUMN status TEXT DEFAULT 'offline'")
-    if 'heartbeat_at' not in cols:
-        cursor.execute("ALTER TABLE agents ADD COLUMN heartbeat_at TEXT DEFAULT NULL")
-    if 'team' not in cols:
-        cursor.execute("ALTER TABLE agents ADD COLUMN team TEXT DEFAULT ''")
-
-    # Migrations — messages
-    cursor.execute("PRAGMA table_info(messages)")
-    mcols = [c[1] for c in cursor.fetchall()]
-    if 'is_cc' not in mcols:
-        cursor.execute("ALTER TABLE messages ADD COLUMN is_cc INTEGER DEFAULT 0")
-    if 'cc_original_to' not in mcols:
-        cursor.execute("ALTER TABLE messages ADD COLUMN cc_original_to TEXT DEFAULT NULL")
-    if 'task_id' not in mcols:
-        cursor.execute("ALTER TABLE messages ADD COLUMN task_id TEXT DEFAULT NULL")
-    if 'reply_to' not in mcols:
-        cursor.execute("ALTER TABLE messages ADD COLUMN reply_to INTEGER DEFAULT NULL")
-
-    # Migrations — tasks: check if CHECK constraint needs 'verified'
-    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='tasks'")
-    schema_row = cursor.fetchone()
-    if schema_row and "'verified'" not in (schema_row[0] or ''):
-        # Rebuild table with updated CHECK constraint
-        cursor.execute("PRAGMA table_info(tasks)")
-        existing_cols = [c[1] for c in cursor.fetchall()]
-        cursor.execute('''
-            CREATE TABLE tasks_rebuild (
-                id TEXT PRIMARY KEY,
-                project TEXT DEFAULT '',
-                title TEXT NOT NULL,
-                description TEXT DEFAULT '',
-                assigned_to TEXT,
-                created_by TEXT NOT NULL,
-                status TEXT DEFAULT 'pending'
-                    CHECK(status IN ('pending','assigned','in_progress','review','completed','failed','verified')),
-                result TEXT DEFAULT '',
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                completed_at TEXT,
-                role_hat TEXT DEFAULT NULL,
-                goal_id TEXT DEFAULT '',
-                verified_by TEXT DEFAULT '',
-                verified_at TEXT DEFAULT NULL,
-                approved_by TEXT DEFAULT ''
-            )
-        ''')
-        # Copy existing data using only columns that exist
-        base_cols = ['id','project','title','description','assigned_to','created_by','status','result','created_at','updated_at','completed_at']
-        copy_cols = [c for c in base_cols if c in existing_cols]
-        if 'role_hat' in existing_cols:
-            copy_cols.append('role_hat')
-        cols_str = ', '.join(copy_cols)
-        cursor.execute(f'INSERT INTO tasks_rebuild ({cols_str}) SELECT {cols_str} FROM tasks')
-        cursor.execute("DROP TABLE tasks")
-        cursor.execute("ALTER TABLE tasks_rebuild RENAME TO tasks")
-    else:
-        # Table already has 'verified' — just add new columns if missing
-        cursor.execute("PRAGMA table_info(tasks)")
-        tcols = [c[1] for c in cursor.fetchall()]
-        if 'role_hat' not in tcols:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN role_hat TEXT DEFAULT NULL")
-        if 'goal_id' not in tcols:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN goal_id TEXT DEFAULT ''")
-        if 'verified_by' not in tcols:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN verified_by TEXT DEFAULT ''")
-        if 'verified_at' not in tcols:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN verified_at TEXT DEFAULT NULL")
-        if 'approved_by' not in tcols:
-            cursor.execute("ALTER TABLE tasks ADD COLUMN approved_by TEXT DEFAULT ''")
-
-    conn.commit()
-    conn.close()
+    with _pool.writer() as conn:
+        applied = migrate(conn)
+        _install_cache_triggers(conn)
+        _install_event_trigger(conn)
+        _load_leads(conn)
+        if COLD in _pool.attached:
+            ensure_cold_schema(conn)
+            conn.commit()
+    _pool.on_writer_release(_flush_touched)
+    _pool.on_writer_release(_wake_event_streams)
+    for cache in _caches.values():
+        cache.clear()
+    if applied:
+        logger.info(f"DB: migrated {DB_PATH} to schema v{applied[-1]} (applied {applied})")
 
 
 init_db()
 
 
 # ── Tools ────────────────────────────────────────────────────────────
+# Each tool does its SQLite work in a nested function handed to _db, which
+# runs it on a worker thread: _q for reads, _tx for a write transaction that
+# commits when the function returns. Push notifications go out afterwards.
 
 @mcp.tool()
 async def register(agent_name: str, ctx: Context, role: str = "", description: str = "", team: str = "", token: str = "") -> str:
@@ -378,11 +575,10 @@ async def register(agent_name: str, ctx: Context, role: str = "", description: s
             return f"Invalid role(s): {', '.join(invalid)}. Valid roles: {', '.join(sorted(VALID_ROLES))}"
         role = ",".join(parsed_roles)
 
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
-        cursor.execute("""
+
+    def _tx(conn):
+        conn.execute("""
             INSERT INTO agents (name, registered_at, last_seen, role, description, status, team)
             VALUES (?, ?, ?, ?, ?, 'waiting for work', ?)
             ON CONFLICT(name) DO UPDATE SET
@@ -393,7 +589,13 @@ async def register(agent_name: str, ctx: Context, role: str = "", description: s
                 status = 'waiting for work'
         """, (agent_name, now, now, role or None, description or None, team or '',
               now, role, description, team))
-        conn.commit()
+
+    try:
+        await _db.write(_tx)
+        if role:
+            _set_lead(agent_name, "lead" in role.split(","))
+        # Supersedes any status or last_seen still waiting to be flushed.
+        _presence.update(agent_name, last_seen=now, status="waiting for work")
 
         # Register session for push notifications
         await _register_session(agent_name, ctx.session)
@@ -407,228 +609,355 @@ async def register(agent_name: str, ctx: Context, role: str = "", description: s
         return result
     except Exception as e:
         return f"Error registering agent: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def set_status(agent_name: str, status: str) -> str:
     """Set your current status (e.g. 'working on BUG-014', 'waiting for work'). Shows up in who() output."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
+
     try:
-        cursor.execute("UPDATE agents SET status = ?, last_seen = ? WHERE name = ?", (status, now, agent_name))
-        conn.commit()
+        _presence.update(agent_name, status=status, last_seen=now)
         return f"Status set: {agent_name} → {status}"
     except Exception as e:
         return f"Error setting status: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def send(from_agent: str, to_agent: str, message: str, ctx: Context, cc: str = "", task_id: str = "", reply_to: int = 0) -> str:
     """Sends a message to a specific agent name, or 'all' for broadcast. Optional: cc (carbon-copy), task_id (link to task), reply_to (message ID to reply to)."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Check for unread messages before allowing send
         # Match both short name and team-scoped name
-        cursor.execute("SELECT team FROM agents WHERE name = ?", (from_agent,))
-        _team_row = cursor.fetchone()
+        _profile = _agent_profile(cursor, from_agent)
         from_variants = [from_agent]
-        if _team_row and _team_row[0]:
-            from_variants.append(f"{_team_row[0]}/{from_agent}")
+        if _profile and _profile["team"]:
+            from_variants.append(f"{_profile['team']}/{from_agent}")
         _ph = ','.join(['?'] * len(from_variants))
-        cursor.execute(f"SELECT COUNT(*) FROM messages WHERE to_agent IN ({_ph}) AND read_flag = 0", from_variants)
-        unread_direct = cursor.fetchone()[0]
-        cursor.execute("""
-            SELECT COUNT(*) FROM messages
-            WHERE to_agent = 'all' AND from_agent != ?
-            AND id NOT IN (SELECT message_id FROM broadcast_reads WHERE agent_name = ?)
-        """, (from_agent, from_agent))
-        unread_broadcast = cursor.fetchone()[0]
-        unread = unread_direct + unread_broadcast
+        # Direct mail to any variant, broadcasts under the registered name
+        cursor.execute(f"""
+            SELECT COALESCE(SUM(direct_unread), 0)
+                 + COALESCE(SUM(CASE WHEN agent_name = ? THEN broadcast_unread END), 0)
+            FROM inbox_counters WHERE agent_name IN ({_ph})
+        """, [from_agent] + from_variants)
+        unread = cursor.fetchone()[0]
         if unread > 0:
-            return f"BLOCKED: You have {unread} unread message(s). Call check_inbox first."
-
-        # Auto-register unknown senders
-        cursor.execute("INSERT OR IGNORE INTO agents (name, registered_at, last_seen) VALUES (?, ?, ?)", (from_agent, now, now))
-
-        # Track sender's session if not already registered
-        if from_agent not in _agent_sessions:
-            await _register_session(from_agent, ctx.session)
+            return f"BLOCKED: You have {unread} unread message(s). Call check_inbox first.", None
 
         # Resolve team-scoped short names: if to_agent is a short name (no '/'),
         # check if it's unambiguous. If multiple agents share the name across teams,
         # require the full {team}/{agent_name} format.
         resolved_to = to_agent
         if to_agent != 'all' and '/' not in to_agent:
-            cursor.execute("SELECT name, team FROM agents WHERE name = ?", (to_agent,))
-            matches = cursor.fetchall()
-            if not matches:
-                # Check if it's a team-qualified name stored differently
-                cursor.execute("SELECT name FROM agents WHERE name LIKE ?", (f"%/{to_agent}",))
-                team_matches = cursor.fetchall()
-                if len(team_matches) == 1:
-                    resolved_to = team_matches[0][0]
-                elif len(team_matches) > 1:
-                    names = [r[0] for r in team_matches]
-                    return f"AMBIGUOUS: Multiple agents named '{to_agent}' across teams: {', '.join(names)}. Use full name (team/agent)."
+            names = _agents_named(cursor, to_agent)
+            if to_agent not in names:
+                # Only registered under team-qualified names
+                if len(names) == 1:
+                    resolved_to = names[0]
+                elif len(names) > 1:
+                    return f"AMBIGUOUS: Multiple agents named '{to_agent}' across teams: {', '.join(names)}. Use full name (team/agent).", None
+
+        # Auto-register unknown senders
+        cursor.execute("INSERT OR IGNORE INTO agents (name, registered_at, last_seen) VALUES (?, ?, ?)", (from_agent, now, now))
 
         # Auto-inherit task_id from reply_to message if not explicitly set
         effective_task_id = task_id or None
         effective_reply_to = reply_to if reply_to else None
         if effective_reply_to and not effective_task_id:
-            cursor.execute("SELECT task_id FROM messages WHERE id = ?", (effective_reply_to,))
-            row = cursor.fetchone()
-            if row and row[0]:
-                effective_task_id = row[0]
-
-        # Insert primary message
-        cursor.execute(
-            "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id, reply_to) VALUES (?, ?, ?, ?, 0, 0, ?, ?)",
-            (from_agent, resolved_to, message, now, effective_task_id, effective_reply_to)
-        )
+            for tier in _tiers():
+                cursor.execute(f"SELECT task_id FROM {tier}.messages WHERE id = ?", (effective_reply_to,))
+                row = cursor.fetchone()
+                if row:
+                    effective_task_id = row[0] or None
+                    break
 
         # Build CC list: explicit + auto-CC all leads
         cc_agents = [a.strip() for a in cc.split(",") if a.strip()] if cc else []
-        leads = _get_leads(cursor)
+        leads = _get_leads()
         for lead_name in leads:
             if from_agent != lead_name and resolved_to != lead_name and lead_name not in cc_agents:
                 cc_agents.append(lead_name)
 
-        for cc_agent in cc_agents:
-            if cc_agent != resolved_to:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, cc_original_to, task_id, reply_to) VALUES (?, ?, ?, ?, 0, 1, ?, ?, ?)",
-                    (from_agent, cc_agent, message, now, resolved_to, effective_task_id, effective_reply_to)
-                )
-
-        conn.commit()
-
-        # ── Push notifications to recipients ──
-        notify_targets = []
-        if resolved_to == 'all':
-            notify_targets = [a for a in _agent_sessions if a != from_agent]
-        else:
-            notify_targets.append(resolved_to)
-        for cc_agent in cc_agents:
-            if cc_agent not in notify_targets and cc_agent != from_agent:
-                notify_targets.append(cc_agent)
-
-        await _notify_agents(notify_targets)
+        # One body; the primary delivery plus a CC delivery per CC'd agent
+        _insert_message(
+            cursor, from_agent, [resolved_to], message,
+            task_id=effective_task_id, reply_to=effective_reply_to,
+            cc=[a for a in cc_agents if a != resolved_to], cc_original_to=resolved_to,
+        )
 
         cc_note = f" (cc: {cc})" if cc else ""
         task_note = f" [task: {effective_task_id}]" if effective_task_id else ""
-        return f"Message sent from '{from_agent}' to '{resolved_to}'{cc_note}{task_note}."
+        result = f"Message sent from '{from_agent}' to '{resolved_to}'{cc_note}{task_note}."
+        return result, (resolved_to, cc_agents)
+
+    try:
+        result, delivered = await _db.write(_tx)
     except Exception as e:
         return f"Error sending message: {e}"
-    finally:
-        conn.close()
+    if delivered is None:
+        return result
+
+    # Track sender's session for push notifications
+    await _register_session(from_agent, ctx.session)
+
+    # ── Push notifications to recipients ──
+    resolved_to, cc_agents = delivered
+    notify_targets = []
+    if resolved_to == 'all':
+        listening = list(_agent_sessions) + [a for a in _inbox_waiters if a not in _agent_sessions]
+        notify_targets = [a for a in listening if a != from_agent]
+    else:
+        notify_targets.append(resolved_to)
+    for cc_agent in cc_agents:
+        if cc_agent not in notify_targets and cc_agent != from_agent:
+            notify_targets.append(cc_agent)
+
+    await _notify_agents(notify_targets)
+    return result
 
 
 @mcp.tool()
-async def check_inbox(agent_name: str, ctx: Context) -> str:
-    """Returns unread messages for the agent, marks them as read."""
-    conn = get_db()
-    cursor = conn.cursor()
-    now = datetime.datetime.now().isoformat()
+async def check_inbox(agent_name: str, ctx: Context, limit: int = INBOX_PAGE_SIZE, after_id: int = 0, fields: str = "") -> str:
+    """Returns up to `limit` unread messages for the agent, oldest first, and marks just those as read. If has_more is true, call again to get the next page (pass next_after_id as after_id to resume past that point; after_id skips direct mail only, unread broadcasts are always returned, so a page may hold broadcasts older than after_id). Optional fields: comma-separated message fields to return (e.g. "id,from_agent,content")."""
+    limit = max(1, min(limit, PAGE_MAX))
     try:
-        # Ensure session is tracked for future push notifications
-        if agent_name not in _agent_sessions:
-            await _register_session(agent_name, ctx.session)
+        messages, has_more = await _read_inbox(agent_name, ctx, limit, after_id)
+        return _inbox_response(messages, has_more, fields)
+    except Exception as e:
+        return f"Error checking inbox: {e}"
+
+
+async def _read_inbox(agent_name, ctx, limit, after_id=0):
+    """Take one page of the agent's unread mail and mark it read. Returns (messages, has_more)."""
+    now = datetime.datetime.now().isoformat()
 
-        cursor.execute("UPDATE agents SET last_seen = ?, last_inbox_check = ? WHERE name = ?", (now, now, agent_name))
+    def _tx(conn):
+        cursor = conn.cursor()
 
         # Match both short name and team-scoped name (e.g. "spartan" and "gypsy-danger/spartan")
-        cursor.execute("SELECT team FROM agents WHERE name = ?", (agent_name,))
-        team_row = cursor.fetchone()
+        profile = _agent_profile(cursor, agent_name)
         name_variants = [agent_name]
-        if team_row and team_row[0]:
-            name_variants.append(f"{team_row[0]}/{agent_name}")
+        if profile and profile["team"]:
+            name_variants.append(f"{profile['team']}/{agent_name}")
         placeholders = ','.join(['?'] * len(name_variants))
 
-        cursor.execute(f"SELECT * FROM messages WHERE to_agent IN ({placeholders}) AND read_flag = 0", name_variants)
-        specific_msgs = [dict(row) for row in cursor.fetchall()]
-        if specific_msgs:
-            ids = [m['id'] for m in specific_msgs]
-            cursor.execute(f"UPDATE messages SET read_flag = 1 WHERE id IN ({','.join(['?']*len(ids))})", ids)
-
+        # Broadcast read state is one watermark per agent: every broadcast
+        # with a higher id is unread.
+        cursor.execute("SELECT last_read_id FROM broadcast_watermarks WHERE agent_name = ?", (agent_name,))
+        wm_row = cursor.fetchone()
+        watermark = wm_row[0] if wm_row else 0
+
+        # Pick the page from the delivery indexes alone (ids only, at most
+        # limit + 1 from each side), then load just those rows.
+        cursor.execute(f"""
+            SELECT id FROM deliveries
+            WHERE to_agent IN ({placeholders}) AND read_flag = 0 AND id > ?
+            ORDER BY id LIMIT ?
+        """, name_variants + [after_id, limit + 1])
+        direct_ids = [row[0] for row in cursor.fetchall()]
+        # Broadcasts always page from the watermark, not after_id: the
+        # watermark moves up to the page's last broadcast, so one skipped
+        # below after_id would be marked read without ever being returned.
         cursor.execute("""
-            SELECT * FROM messages WHERE to_agent = 'all'
-            AND id NOT IN (SELECT message_id FROM broadcast_reads WHERE agent_name = ?)
-        """, (agent_name,))
-        broadcast_msgs = [dict(row) for row in cursor.fetchall()]
-        if broadcast_msgs:
-            for msg in broadcast_msgs:
-                cursor.execute("INSERT INTO broadcast_reads (agent_name, message_id) VALUES (?, ?)", (agent_name, msg['id']))
-
-        conn.commit()
-
-        all_messages = specific_msgs + broadcast_msgs
-        all_messages.sort(key=lambda x: x['timestamp'])
-        for msg in all_messages:
-            if msg.get('is_cc'):
-                msg['cc_note'] = f"[CC] originally to: {msg.get('cc_original_to', 'unknown')}"
-
-        return json.dumps(all_messages, indent=2)
+            SELECT id FROM deliveries WHERE to_agent = 'all' AND id > ?
+            ORDER BY id LIMIT ?
+        """, (watermark, limit + 1))
+        broadcast_ids = [row[0] for row in cursor.fetchall()]
+
+        page = sorted(direct_ids + broadcast_ids)
+        has_more = len(page) > limit
+        page = page[:limit]
+        if not page:
+            return [], False
+
+        cursor.execute(f"SELECT * FROM messages WHERE id IN ({','.join(['?'] * len(page))}) ORDER BY id", page)
+        messages = [dict(row) for row in cursor.fetchall()]
+
+        direct_ids = [m['id'] for m in messages if m['to_agent'] != 'all']
+        if direct_ids:
+            cursor.execute(f"UPDATE deliveries SET read_flag = 1 WHERE id IN ({','.join(['?']*len(direct_ids))})", direct_ids)
+        broadcast_ids = [m['id'] for m in messages if m['to_agent'] == 'all']
+        if broadcast_ids:
+            cursor.execute("""
+                INSERT INTO broadcast_watermarks (agent_name, last_read_id) VALUES (?, ?)
+                ON CONFLICT(agent_name) DO UPDATE SET last_read_id = MAX(last_read_id, excluded.last_read_id)
+            """, (agent_name, broadcast_ids[-1]))
+        return messages, has_more
+
+    # Ensure session is tracked for future push notifications
+    await _register_session(agent_name, ctx.session)
+
+    messages, has_more = await _db.write(_tx)
+    _presence.update(agent_name, last_seen=now, last_inbox_check=now)
+    for msg in messages:
+        if msg.get('is_cc'):
+            msg['cc_note'] = f"[CC] originally to: {msg.get('cc_original_to', 'unknown')}"
+    return messages, has_more
+
+
+def _inbox_response(messages, has_more, fields=""):
+    return wire.encode("check_inbox", {
+        "messages": wire.rows(messages, fields),
+        "has_more": has_more,
+        "next_after_id": messages[-1]['id'] if has_more else None,
+    })
+
+
+@mcp.tool()
+async def wait_for_messages(agent_name: str, ctx: Context, timeout: float = 30, limit: int = INBOX_PAGE_SIZE, fields: str = "") -> str:
+    """Long-poll for mail: returns unread messages (marked read, like check_inbox) as soon as there are any, or an empty page after `timeout` seconds (max 300). Use this instead of calling check_inbox on a timer."""
+    limit = max(1, min(limit, PAGE_MAX))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(0.0, min(timeout, WAIT_MAX))
+    event = asyncio.Event()
+    waiters = _inbox_waiters.setdefault(agent_name, set())
+    waiters.add(event)
+    try:
+        while True:
+            # Registered before reading, so mail that commits after the read
+            # but before the wait still sets the event.
+            event.clear()
+            messages, has_more = await _read_inbox(agent_name, ctx, limit)
+            remaining = deadline - loop.time()
+            if messages or remaining <= 0:
+                return _inbox_response(messages, has_more, fields)
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass  # one last read: mail may have landed as time ran out
     except Exception as e:
-        return f"Error checking inbox: {e}"
+        return f"Error waiting for messages: {e}"
     finally:
-        conn.close()
+        waiters.discard(event)
+        if not waiters and _inbox_waiters.get(agent_name) is waiters:
+            del _inbox_waiters[agent_name]
 
 
 @mcp.tool()
-async def get_history(count: int = 10, task_id: str = "") -> str:
-    """Returns the last N messages across all agents (for catch-up). Optional task_id filter for threaded conversation."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+async def get_history(count: int = 10, task_id: str = "", fields: str = "", before_id: int = 0, after_id: int = 0,
+                      agent: str = "", since: str = "", until: str = "") -> str:
+    """Returns messages across all agents (for catch-up), oldest first: by default the last `count`. If has_more, page further back with before_id=next_before_id, or forward from a point with after_id (next_after_id continues). Filters: task_id (threaded conversation), agent (sender or recipient), since/until (ISO timestamps, until exclusive). Optional fields: comma-separated message fields to return."""
+    count = max(1, min(count, PAGE_MAX))
+    forward = bool(after_id) and not before_id
+
+    def _walk(conn, tier):
+        """Ids of up to count + 1 matches in one tier, nearest the cursor first."""
+        conditions, params = [], []
+        if before_id:
+            conditions.append("d.id < ?")
+            params.append(before_id)
+        if after_id:
+            conditions.append("d.id > ?")
+            params.append(after_id)
         if task_id:
-            cursor.execute("SELECT * FROM messages WHERE task_id = ? ORDER BY timestamp DESC LIMIT ?", (task_id, count))
+            conditions.append("b.task_id = ?")
+            params.append(task_id)
+        # _insert_message stamps bodies on the writer thread, never below the
+        # newest, so ids are in time order and a time bound becomes an id
+        # bound: the first delivery of the first body at or after it. The
+        # timestamp is still checked exactly, but unindexed (+) so the walk
+        # stays by id.
+        for bound, op, id_op in ((since, ">=", ">="), (until, "<", "<")):
+            if not bound:
+                continue
+            first = conn.execute(f"""
+                SELECT MIN(d.id) FROM {tier}.deliveries d WHERE d.body_id =
+                    (SELECT id FROM {tier}.message_bodies WHERE timestamp >= ? ORDER BY timestamp, id LIMIT 1)
+            """, (bound,)).fetchone()[0]
+            if first is None:
+                if op == ">=":
+                    return []  # nothing that recent
+                continue
+            conditions.append(f"d.id {id_op} ? AND +b.timestamp {op} ?")
+            params += [first, bound]
+        sides = [("d.to_agent = ?", agent), ("d.from_agent = ?", agent)] if agent else [(None, None)]
+
+        ids = set()
+        for side, value in sides:
+            where = conditions + [side] if side else conditions
+            rows = conn.execute(f"""
+                SELECT d.id FROM {tier}.deliveries d JOIN {tier}.message_bodies b ON b.id = d.body_id
+                {"WHERE " + " AND ".join(where) if where else ""}
+                ORDER BY d.id {"ASC" if forward else "DESC"} LIMIT ?
+            """, params + ([value] if side else []) + [count + 1])
+            ids.update(row[0] for row in rows)
+        return ids
+
+    def _q(conn):
+        # Walk deliveries by id from the cursor (newest-first unless paging
+        # forward) and stop after count + 1 matches. A participant is two
+        # walks, one per side, on (to_agent, id) and (from_agent, id); the
+        # cold tier, if attached, is walked the same way and merged by id.
+        tier_ids = {tier: _walk(conn, tier) for tier in _tiers()}
+        ids = sorted(set().union(*tier_ids.values()), reverse=not forward)
+        has_more = len(ids) > count
+        page = set(ids[:count])
+        if not page:
+            return [], False
+        msgs = {}
+        for tier in reversed(_tiers()):  # hot last: it wins an id caught mid-move in both
+            wanted = sorted(page & tier_ids[tier])
+            if wanted:
+                rows = conn.execute(f"SELECT * FROM {tier}.messages WHERE id IN ({','.join(['?'] * len(wanted))})", wanted)
+                msgs.update((row["id"], dict(row)) for row in rows)
+        return [msgs[i] for i in sorted(msgs)], has_more
+
+    try:
+        msgs, has_more = await _db.read(_q)
+        response = {"messages": wire.rows(msgs, fields), "has_more": has_more}
+        if forward:
+            response["next_after_id"] = msgs[-1]["id"] if has_more else None
         else:
-            cursor.execute("SELECT * FROM messages ORDER BY timestamp DESC LIMIT ?", (count,))
-        msgs = [dict(row) for row in cursor.fetchall()]
-        return json.dumps(msgs[::-1], indent=2)
+            response["next_before_id"] = msgs[0]["id"] if has_more else None
+        return wire.encode("get_history", response)
     except Exception as e:
         return f"Error fetching history: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def deregister(agent_name: str) -> str:
     """Removes an agent from the registry. Use to clean up stale/ghost entries from previous sessions."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    def _tx(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT name FROM agents WHERE name = ?", (agent_name,))
         if not cursor.fetchone():
-            return f"Agent '{agent_name}' not found."
+            return False
         cursor.execute("DELETE FROM agents WHERE name = ?", (agent_name,))
-        conn.commit()
+        return True
+
+    try:
+        if not await _db.write(_tx):
+            return f"Agent '{agent_name}' not found."
+        _set_lead(agent_name, False)
         await _unregister_session(agent_name)
         return f"Agent '{agent_name}' deregistered."
     except Exception as e:
         return f"Error deregistering agent: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
-async def who() -> str:
-    """Lists all registered agents with connection status and health. Health: healthy (<2m), stale (<10m), dead (>=10m), unknown (no heartbeat)."""
-    conn = get_db()
-    cursor = conn.cursor()
+async def who(fields: str = "", role: str = "") -> str:
+    """Lists all registered agents with connection status and health. Health: healthy (<2m), stale (<10m), dead (>=10m), unknown (no heartbeat). Optional fields: comma-separated agent fields to return (e.g. "name,role,health"). Optional role: only agents with that role (e.g. "tester")."""
     now_dt = datetime.datetime.now()
+
+    def _q(conn):
+        if role:
+            rows = conn.execute("""
+                SELECT agents.* FROM agent_roles JOIN agents ON agents.name = agent_roles.agent
+                WHERE agent_roles.role = ?
+            """, (role,))
+        else:
+            rows = conn.execute("SELECT * FROM agents")
+        return [dict(row) for row in rows]
+
     try:
-        cursor.execute("SELECT * FROM agents ORDER BY last_seen DESC")
-        agents = [dict(row) for row in cursor.fetchall()]
+        agents = _presence.overlay(await _db.read(_q))
+        agents.sort(key=lambda agent: agent['last_seen'] or '', reverse=True)
         for agent in agents:
-            agent['connected'] = agent['name'] in _agent_sessions
+            agent['connected'] = _connected(agent['name'])
             # Compute health from heartbeat
             hb = agent.get('heartbeat_at')
             if hb:
@@ -645,24 +974,31 @@ async def who() -> str:
                     agent['health'] = 'unknown'
             else:
                 agent['health'] = 'unknown'
-        return json.dumps(agents, indent=2)
+        return wire.encode("who", wire.rows(agents, fields))
     except Exception as e:
         return f"Error listing agents: {e}"
-    finally:
-        conn.close()
 
 
 # ── Phase 1: Task State Machine ───────────────────────────────────────
 
+def _reserve_ids(cursor, sequence, count=1):
+    """Take the next count numbers of a sequence (migrations v11). Returns them as a range.
+
+    Runs inside the caller's write transaction, so the numbers are its own
+    and go back if it rolls back; batch creators reserve once for all rows.
+    """
+    cursor.execute("""
+        INSERT INTO sequences (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        RETURNING value
+    """, (sequence, count))
+    last = cursor.fetchone()[0]
+    return range(last - count + 1, last + 1)
+
+
 def _next_task_id(cursor):
     """Generate next TASK-NNN id."""
-    cursor.execute("SELECT id FROM tasks ORDER BY CAST(SUBSTR(id, 6) AS INTEGER) DESC LIMIT 1")
-    row = cursor.fetchone()
-    if row:
-        num = int(row[0].split("-")[1]) + 1
-    else:
-        num = 1
-    return f"TASK-{num:03d}"
+    return f"TASK-{_reserve_ids(cursor, 'task')[0]:03d}"
 
 
 _CONFLICTING_HATS = {
@@ -714,15 +1050,15 @@ _TASK_TRANSITIONS = {
 @mcp.tool()
 async def create_task(creator: str, title: str, ctx: Context, description: str = "", assigned_to: str = "", project: str = "", role_hat: str = "") -> str:
     """Create a task. Optionally assign it immediately with assigned_to. Returns task ID. Auto-sends assignment message if assigned. role_hat: which role the assignee should wear for this task."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Check hat conflict before creating
         if role_hat and project and assigned_to:
             conflict = _check_hat_conflict(cursor, assigned_to, role_hat, project)
             if conflict:
-                return conflict
+                return conflict, []
 
         task_id = _next_task_id(cursor)
         status = "assigned" if assigned_to else "pending"
@@ -730,11 +1066,11 @@ async def create_task(creator: str, title: str, ctx: Context, description: str =
             "INSERT INTO tasks (id, project, title, description, assigned_to, created_by, status, created_at, updated_at, role_hat) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (task_id, project, title, description, assigned_to or None, creator, status, now, now, role_hat or None)
         )
-        conn.commit()
 
         result = f"Task {task_id} created: '{title}' (status: {status})"
         if role_hat:
             result += f" role_hat={role_hat}"
+        notify_targets = []
 
         # Auto-send assignment message
         if assigned_to:
@@ -743,46 +1079,39 @@ async def create_task(creator: str, title: str, ctx: Context, description: str =
                 msg += f"\nROLE HAT: {role_hat}"
             if description:
                 msg += f"\n\n{description}"
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                (creator, assigned_to, msg, now, task_id)
-            )
             # CC all leads if creator isn't a lead
-            leads = _get_leads(cursor)
+            leads = _get_leads()
             cc_leads = [l for l in leads if l != creator and l != assigned_to]
-            for lead_name in cc_leads:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, cc_original_to, task_id) VALUES (?, ?, ?, ?, 0, 1, ?, ?)",
-                    (creator, lead_name, msg, now, assigned_to, task_id)
-                )
-            conn.commit()
-            await _notify_agent(assigned_to)
-            for lead_name in cc_leads:
-                await _notify_agent(lead_name)
+            _insert_message(cursor, creator, [assigned_to], msg, task_id=task_id, cc=cc_leads, cc_original_to=assigned_to)
+            notify_targets = [assigned_to] + cc_leads
             result += f" → assigned to {assigned_to}"
 
-        return result
+        return result, notify_targets
+
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error creating task: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
 async def update_task(agent_name: str, task_id: str, ctx: Context, status: str = "", assigned_to: str = "", result: str = "") -> str:
     """Update a task. Can transition status, reassign, or both. Lead can: assign, approve, reject, reassign. Assignee can: start, submit for review, fail."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         if not task:
-            return f"Task {task_id} not found."
+            return f"Task {task_id} not found.", []
         task = dict(task)
 
         if not status and not assigned_to and not result:
-            return "Nothing to update. Provide status, assigned_to, or result."
+            return "Nothing to update. Provide status, assigned_to, or result.", []
 
         updates = []
         params = []
@@ -791,9 +1120,9 @@ async def update_task(agent_name: str, task_id: str, ctx: Context, status: str =
 
         # Handle reassignment
         if assigned_to:
-            leads = _get_leads(cursor)
+            leads = _get_leads()
             if agent_name not in leads:
-                return f"Only a lead can reassign tasks."
+                return f"Only a lead can reassign tasks.", []
             updates.append("assigned_to = ?")
             params.append(assigned_to)
             messages.append(f"[{task_id}] Reassigned to {assigned_to} by {agent_name}")
@@ -806,16 +1135,16 @@ async def update_task(agent_name: str, task_id: str, ctx: Context, status: str =
 
             if transition not in _TASK_TRANSITIONS:
                 valid = [t[1] for t in _TASK_TRANSITIONS if t[0] == old_status]
-                return f"Invalid transition: {old_status} → {status}. Valid: {', '.join(valid) if valid else 'none (terminal state)'}"
+                return f"Invalid transition: {old_status} → {status}. Valid: {', '.join(valid) if valid else 'none (terminal state)'}", []
 
             required_role = _TASK_TRANSITIONS[transition]
-            leads = _get_leads(cursor)
+            leads = _get_leads()
 
             if required_role == "lead" and agent_name not in leads:
-                return f"Only a lead ({', '.join(leads) or 'none registered'}) can transition {old_status} → {status}."
+                return f"Only a lead ({', '.join(leads) or 'none registered'}) can transition {old_status} → {status}.", []
             effective_assignee = assigned_to or task["assigned_to"]
             if required_role == "assignee" and agent_name != effective_assignee:
-                return f"Only the assigned agent ({effective_assignee}) can transition {old_status} → {status}."
+                return f"Only the assigned agent ({effective_assignee}) can transition {old_status} → {status}.", []
 
             updates.append("status = ?")
             params.append(status)
@@ -839,32 +1168,18 @@ async def update_task(agent_name: str, task_id: str, ctx: Context, status: str =
             if result:
                 msg += f"\n\n{result}"
             required_role = _TASK_TRANSITIONS.get((old_status, status), "any")
-            leads = _get_leads(cursor)
+            leads = _get_leads()
 
             if required_role == "assignee" and leads:
-                for lead_name in leads:
-                    cursor.execute(
-                        "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                        (agent_name, lead_name, msg, now, task_id)
-                    )
-                    notify_targets.append(lead_name)
+                _insert_message(cursor, agent_name, leads, msg, task_id=task_id)
+                notify_targets.extend(leads)
             elif required_role == "lead" and task["assigned_to"]:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                    (agent_name, task["assigned_to"], msg, now, task_id)
-                )
+                _insert_message(cursor, agent_name, [task["assigned_to"]], msg, task_id=task_id)
                 notify_targets.append(task["assigned_to"])
 
         # Send reassignment messages
         for msg_text in messages:
-            for target in notify_targets:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                    (agent_name, target, msg_text, now, task_id)
-                )
-
-        conn.commit()
-        await _notify_agents(notify_targets)
+            _insert_message(cursor, agent_name, notify_targets, msg_text, task_id=task_id)
 
         parts = []
         if status:
@@ -873,67 +1188,93 @@ async def update_task(agent_name: str, task_id: str, ctx: Context, status: str =
             parts.append(f"assigned to {assigned_to}")
         if result:
             parts.append(f"result updated")
-        return " | ".join(parts) if parts else f"Task {task_id} updated."
+        return (" | ".join(parts) if parts else f"Task {task_id} updated."), notify_targets
+
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error updating task: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
-async def list_tasks(status: str = "", assigned_to: str = "", project: str = "") -> str:
-    """List tasks. Filter by status, assigned_to, project. Default: all non-completed tasks. Includes health warning for dead agents."""
-    conn = get_db()
-    cursor = conn.cursor()
+async def list_tasks(status: str = "", assigned_to: str = "", project: str = "", fields: str = "",
+                     limit: int = 100, after_id: str = "") -> str:
+    """List tasks, oldest first. Filter by status, assigned_to, project. Default: all non-completed tasks. Includes health warning for dead agents. Returns up to `limit` tasks; if has_more, pass next_after_id as after_id for the next page. Optional fields: comma-separated task fields to return (e.g. "id,title,status")."""
+    limit = max(1, min(limit, PAGE_MAX))
     now_dt = datetime.datetime.now()
-    try:
-        query = "SELECT * FROM tasks WHERE 1=1"
-        params = []
+
+    def _q(conn):
+        conditions, params = [], []
         if status:
-            query += " AND status = ?"
+            conditions.append("t.status = ?")
             params.append(status)
         elif not assigned_to and not project:
-            query += " AND status NOT IN ('completed')"
+            conditions.append("t.status != 'completed'")
         if assigned_to:
-            query += " AND assigned_to = ?"
+            conditions.append("t.assigned_to = ?")
             params.append(assigned_to)
         if project:
-            query += " AND project = ?"
+            conditions.append("t.project = ?")
             params.append(project)
-        query += " ORDER BY created_at ASC"
+        if after_id:
+            cursor_row = conn.execute("SELECT created_at, id FROM tasks WHERE id = ?", (after_id,)).fetchone()
+            if not cursor_row:
+                return None
+            conditions.append("(t.created_at, t.id) > (?, ?)")
+            params.extend(cursor_row)
+
+        # One pass: the page in (created_at, id) order from the filter's
+        # index, with each in-progress assignee's heartbeat joined in.
+        rows = conn.execute(f"""
+            SELECT t.*, a.heartbeat_at AS assignee_heartbeat_at FROM tasks t
+            LEFT JOIN agents a ON t.status = 'in_progress' AND a.name = t.assigned_to
+            WHERE {" AND ".join(conditions) or "1=1"}
+            ORDER BY t.created_at, t.id
+            LIMIT ?
+        """, params + [limit + 1])
+        return [dict(row) for row in rows]
 
-        cursor.execute(query, params)
-        tasks = [dict(row) for row in cursor.fetchall()]
+    try:
+        tasks = await _db.read(_q)
+        if tasks is None:
+            return f"Task {after_id} not found (after_id must be a task id from a previous page)."
+        has_more = len(tasks) > limit
+        tasks = tasks[:limit]
 
         # Add health warnings for in-progress tasks with dead agents
         for task in tasks:
+            hb = task.pop("assignee_heartbeat_at")
             if task["status"] == "in_progress" and task["assigned_to"]:
-                cursor.execute("SELECT heartbeat_at FROM agents WHERE name = ?", (task["assigned_to"],))
-                row = cursor.fetchone()
-                if row and row[0]:
+                hb = _presence.get(task["assigned_to"]).get("heartbeat_at") or hb
+                if hb:
                     try:
-                        last_hb = datetime.datetime.fromisoformat(row[0])
+                        last_hb = datetime.datetime.fromisoformat(hb)
                         if (now_dt - last_hb).total_seconds() >= 600:
                             task["warning"] = "assigned agent appears dead"
                     except (ValueError, TypeError):
                         pass
 
-        return json.dumps(tasks, indent=2)
+        return wire.encode("list_tasks", {
+            "tasks": wire.rows(tasks, fields),
+            "has_more": has_more,
+            "next_after_id": tasks[-1]["id"] if has_more else None,
+        })
     except Exception as e:
         return f"Error listing tasks: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def assign_role_hat(agent_name: str, task_id: str, role: str) -> str:
     """Set which role hat an agent wears for a specific task. Only leads can call this. The role must be one of the agent's registered roles."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Verify caller is a lead
-        leads = _get_leads(cursor)
+        leads = _get_leads()
         if leads and agent_name not in leads:
             return f"Only a lead ({', '.join(leads)}) can assign role hats."
 
@@ -949,12 +1290,11 @@ async def assign_role_hat(agent_name: str, task_id: str, role: str) -> str:
             return f"Task {task_id} has no assignee. Assign the task first."
 
         # Verify the role is one of the assignee's registered roles
-        cursor.execute("SELECT role FROM agents WHERE name = ?", (assignee,))
-        agent_row = cursor.fetchone()
-        if not agent_row or not agent_row[0]:
+        profile = _agent_profile(cursor, assignee)
+        agent_roles = profile["roles"] if profile else []
+        if not agent_roles:
             return f"Agent '{assignee}' has no registered roles."
 
-        agent_roles = [r.strip() for r in agent_row[0].split(",")]
         if role not in agent_roles:
             return f"Role '{role}' is not in {assignee}'s registered roles: {', '.join(agent_roles)}"
 
@@ -969,20 +1309,19 @@ async def assign_role_hat(agent_name: str, task_id: str, role: str) -> str:
             "UPDATE tasks SET role_hat = ?, updated_at = ? WHERE id = ?",
             (role, now, task_id)
         )
-        conn.commit()
         return f"Task {task_id}: role_hat set to '{role}' for {assignee}"
+
+    try:
+        return await _db.write(_tx)
     except Exception as e:
         return f"Error assigning role hat: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def hat_history(project: str) -> str:
     """List all role_hat assignments for a project. Shows who wore what hat, for which task, and the task status."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    def _q(conn):
+        cursor = conn.cursor()
         cursor.execute(
             "SELECT assigned_to, role_hat, id, title, status FROM tasks WHERE project = ? AND role_hat IS NOT NULL ORDER BY created_at ASC",
             (project,)
@@ -999,11 +1338,12 @@ async def hat_history(project: str) -> str:
             })
         if not history:
             return f"No role_hat assignments found for project '{project}'."
-        return json.dumps(history, indent=2)
+        return wire.encode("hat_history", history)
+
+    try:
+        return await _db.read(_q)
     except Exception as e:
         return f"Error fetching hat history: {e}"
-    finally:
-        conn.close()
 
 
 # ── Phase 2: Handshake ACK ───────────────────────────────────────────
@@ -1011,14 +1351,14 @@ async def hat_history(project: str) -> str:
 @mcp.tool()
 async def initiate_handshake(from_agent: str, message: str, ctx: Context, agents: str = "") -> str:
     """Lead broadcasts a neural handshake plan. All target agents must ACK before GO. Returns handshake ID. Agents param: comma-separated names, or empty for all non-lead agents."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Verify lead
-        leads = _get_leads(cursor)
+        leads = _get_leads()
         if leads and from_agent not in leads:
-            return f"Only a lead ({', '.join(leads)}) can initiate handshakes."
+            return f"Only a lead ({', '.join(leads)}) can initiate handshakes.", []
 
         # Determine target agents
         if agents:
@@ -1028,21 +1368,14 @@ async def initiate_handshake(from_agent: str, message: str, ctx: Context, agents
             target_agents = [row[0] for row in cursor.fetchall()]
 
         if not target_agents:
-            return "No agents to handshake with. Register agents first."
+            return "No agents to handshake with. Register agents first.", []
 
         # Broadcast the handshake message
         handshake_prefix = "[HANDSHAKE] "
         full_message = handshake_prefix + message
 
-        # Send to each target agent individually (not broadcast) so we can track delivery
-        msg_id = None
-        for agent in target_agents:
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, NULL)",
-                (from_agent, agent, full_message, now)
-            )
-            if msg_id is None:
-                msg_id = cursor.lastrowid
+        # Deliver to each target agent individually (not broadcast) so we can track delivery
+        msg_id = _insert_message(cursor, from_agent, target_agents, full_message)[0]
 
         # Create handshake record
         cursor.execute(
@@ -1050,39 +1383,41 @@ async def initiate_handshake(from_agent: str, message: str, ctx: Context, agents
             (from_agent, msg_id, now)
         )
         handshake_id = cursor.lastrowid
-        conn.commit()
 
         # Push notify all targets
-        await _notify_agents(target_agents)
 
         agent_list = ", ".join(target_agents)
-        return f"Handshake #{handshake_id} initiated. Waiting for ACK from: {agent_list}. Agents: call ack_handshake(agent_name, handshake_id={handshake_id}) after reading the plan."
+        return f"Handshake #{handshake_id} initiated. Waiting for ACK from: {agent_list}. Agents: call ack_handshake(agent_name, handshake_id={handshake_id}) after reading the plan.", target_agents
+
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error initiating handshake: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
 async def ack_handshake(agent_name: str, handshake_id: int, ctx: Context) -> str:
     """Acknowledge a neural handshake. Call this after reading the plan to confirm you understand it."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Verify handshake exists and is pending
         cursor.execute("SELECT * FROM handshakes WHERE id = ?", (handshake_id,))
         hs = cursor.fetchone()
         if not hs:
-            return f"Handshake #{handshake_id} not found."
+            return f"Handshake #{handshake_id} not found.", []
         hs = dict(hs)
         if hs["status"] == "completed":
-            return f"Handshake #{handshake_id} is already completed."
+            return f"Handshake #{handshake_id} is already completed.", []
 
         # Check if already acked
         cursor.execute("SELECT * FROM handshake_acks WHERE handshake_id = ? AND agent_name = ?", (handshake_id, agent_name))
         if cursor.fetchone():
-            return f"You already ACKed handshake #{handshake_id}."
+            return f"You already ACKed handshake #{handshake_id}.", []
 
         # Record the ACK
         cursor.execute("INSERT INTO handshake_acks (handshake_id, agent_name, acked_at) VALUES (?, ?, ?)", (handshake_id, agent_name, now))
@@ -1094,36 +1429,31 @@ async def ack_handshake(agent_name: str, handshake_id: int, ctx: Context) -> str
         acked_agents = {row[0] for row in cursor.fetchall()}
         pending = all_agents - acked_agents
 
-        if not pending:
-            cursor.execute("UPDATE handshakes SET status = 'completed' WHERE id = ?", (handshake_id,))
-            # Notify the initiator + all leads that agents are synced
-            initiator = hs["initiated_by"]
-            leads = _get_leads(cursor)
-            notify_set = set(leads) | {initiator}
-            for target in notify_set:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc) VALUES (?, ?, ?, ?, 0, 0)",
-                    ("system", target, f"[HANDSHAKE #{handshake_id}] ALL AGENTS SYNCED. Ready for GO signal.", now)
-                )
-            conn.commit()
-            for target in notify_set:
-                await _notify_agent(target)
-            return f"ACK recorded. Handshake #{handshake_id} COMPLETE — all agents synced!"
-        else:
-            conn.commit()
-            return f"ACK recorded. Still waiting on: {', '.join(pending)}"
+        if pending:
+            return f"ACK recorded. Still waiting on: {', '.join(pending)}", []
+
+        cursor.execute("UPDATE handshakes SET status = 'completed' WHERE id = ?", (handshake_id,))
+        # Notify the initiator + all leads that agents are synced
+        initiator = hs["initiated_by"]
+        leads = _get_leads()
+        notify_set = set(leads) | {initiator}
+        _insert_message(cursor, "system", list(notify_set), f"[HANDSHAKE #{handshake_id}] ALL AGENTS SYNCED. Ready for GO signal.")
+        return f"ACK recorded. Handshake #{handshake_id} COMPLETE — all agents synced!", list(notify_set)
+
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error acknowledging handshake: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
 async def handshake_status(handshake_id: int) -> str:
     """Check status of a neural handshake. Shows who has ACKed and who is still pending."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    def _q(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM handshakes WHERE id = ?", (handshake_id,))
         hs = cursor.fetchone()
         if not hs:
@@ -1146,11 +1476,12 @@ async def handshake_status(handshake_id: int) -> str:
             "acked": acks,
             "pending": pending,
         }
-        return json.dumps(result, indent=2)
+        return wire.encode("handshake_status", result)
+
+    try:
+        return await _db.read(_q)
     except Exception as e:
         return f"Error checking handshake status: {e}"
-    finally:
-        conn.close()
 
 
 # ── Phase 3: Agent Health ────────────────────────────────────────────
@@ -1158,20 +1489,15 @@ async def handshake_status(handshake_id: int) -> str:
 @mcp.tool()
 async def ping(agent_name: str, ctx: Context) -> str:
     """Lightweight heartbeat. Call periodically (every 60s recommended) to signal liveness. Updates health status in who()."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
+
     try:
-        cursor.execute("UPDATE agents SET heartbeat_at = ?, last_seen = ? WHERE name = ?", (now, now, agent_name))
-        conn.commit()
+        _presence.update(agent_name, heartbeat_at=now, last_seen=now)
         # Re-register session if needed
-        if agent_name not in _agent_sessions:
-            await _register_session(agent_name, ctx.session)
+        await _register_session(agent_name, ctx.session)
         return f"pong — {now}"
     except Exception as e:
         return f"Error: {e}"
-    finally:
-        conn.close()
 
 
 # ── Phase 4: Review Gates ────────────────────────────────────────────
@@ -1179,19 +1505,19 @@ async def ping(agent_name: str, ctx: Context) -> str:
 @mcp.tool()
 async def submit_for_review(agent_name: str, task_id: str, summary: str, ctx: Context, files_changed: str = "", test_results: str = "") -> str:
     """Submit a task for lead review. Transitions task to 'review' and sends structured review message to lead."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         if not task:
-            return f"Task {task_id} not found."
+            return f"Task {task_id} not found.", []
         task = dict(task)
         if task["status"] != "in_progress":
-            return f"Task {task_id} is '{task['status']}', must be 'in_progress' to submit for review."
+            return f"Task {task_id} is '{task['status']}', must be 'in_progress' to submit for review.", []
         if task["assigned_to"] != agent_name:
-            return f"Task {task_id} is assigned to '{task['assigned_to']}', not you."
+            return f"Task {task_id} is assigned to '{task['assigned_to']}', not you.", []
 
         # Build result JSON
         review_data = json.dumps({
@@ -1202,7 +1528,7 @@ async def submit_for_review(agent_name: str, task_id: str, summary: str, ctx: Co
         cursor.execute("UPDATE tasks SET status = 'review', result = ?, updated_at = ? WHERE id = ?", (review_data, now, task_id))
 
         # Send structured review message to all leads
-        leads = _get_leads(cursor)
+        leads = _get_leads()
         if leads:
             msg = f"[REVIEW] {task_id}: {task['title']}\n\nSUMMARY: {summary}"
             if files_changed:
@@ -1210,42 +1536,37 @@ async def submit_for_review(agent_name: str, task_id: str, summary: str, ctx: Co
             if test_results:
                 msg += f"\nTESTS: {test_results}"
             msg += f"\n\nAwaiting review. Use approve_task or reject_task."
-            for lead_name in leads:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                    (agent_name, lead_name, msg, now, task_id)
-                )
-            conn.commit()
-            for lead_name in leads:
-                await _notify_agent(lead_name)
-        else:
-            conn.commit()
+            _insert_message(cursor, agent_name, leads, msg, task_id=task_id)
+
+        return f"Task {task_id} submitted for review.", leads
 
-        return f"Task {task_id} submitted for review."
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error submitting for review: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
 async def approve_task(agent_name: str, task_id: str, ctx: Context, notes: str = "") -> str:
     """Lead approves a task in review. Transitions to 'completed' and notifies the assignee."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
-        leads = _get_leads(cursor)
+
+    def _tx(conn):
+        cursor = conn.cursor()
+        leads = _get_leads()
         if leads and agent_name not in leads:
-            return f"Only a lead ({', '.join(leads)}) can approve tasks."
+            return f"Only a lead ({', '.join(leads)}) can approve tasks.", []
 
         cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         if not task:
-            return f"Task {task_id} not found."
+            return f"Task {task_id} not found.", []
         task = dict(task)
         if task["status"] != "review":
-            return f"Task {task_id} is '{task['status']}', must be 'review' to approve."
+            return f"Task {task_id} is '{task['status']}', must be 'review' to approve.", []
 
         cursor.execute("UPDATE tasks SET status = 'completed', completed_at = ?, updated_at = ?, approved_by = ? WHERE id = ?", (now, now, agent_name, task_id))
 
@@ -1254,60 +1575,56 @@ async def approve_task(agent_name: str, task_id: str, ctx: Context, notes: str =
             msg = f"[APPROVED] {task_id}: {task['title']}"
             if notes:
                 msg += f"\n\nNotes: {notes}"
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                (agent_name, task["assigned_to"], msg, now, task_id)
-            )
-            conn.commit()
-            await _notify_agent(task["assigned_to"])
-        else:
-            conn.commit()
+            _insert_message(cursor, agent_name, [task["assigned_to"]], msg, task_id=task_id)
+
+        notify_targets = [task["assigned_to"]] if task["assigned_to"] else []
+        return f"Task {task_id} approved and completed.", notify_targets
 
-        return f"Task {task_id} approved and completed."
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error approving task: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
 async def reject_task(agent_name: str, task_id: str, reason: str, ctx: Context) -> str:
     """Lead rejects a task in review. Sends it back to 'in_progress' for rework with feedback."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
-        leads = _get_leads(cursor)
+
+    def _tx(conn):
+        cursor = conn.cursor()
+        leads = _get_leads()
         if leads and agent_name not in leads:
-            return f"Only a lead ({', '.join(leads)}) can reject tasks."
+            return f"Only a lead ({', '.join(leads)}) can reject tasks.", []
 
         cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         if not task:
-            return f"Task {task_id} not found."
+            return f"Task {task_id} not found.", []
         task = dict(task)
         if task["status"] != "review":
-            return f"Task {task_id} is '{task['status']}', must be 'review' to reject."
+            return f"Task {task_id} is '{task['status']}', must be 'review' to reject.", []
 
         cursor.execute("UPDATE tasks SET status = 'in_progress', updated_at = ? WHERE id = ?", (now, task_id))
 
         # Notify assignee with rework feedback
         if task["assigned_to"]:
             msg = f"[REWORK] {task_id}: {task['title']}\n\nREASON: {reason}"
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                (agent_name, task["assigned_to"], msg, now, task_id)
-            )
-            conn.commit()
-            await _notify_agent(task["assigned_to"])
-        else:
-            conn.commit()
+            _insert_message(cursor, agent_name, [task["assigned_to"]], msg, task_id=task_id)
+
+        notify_targets = [task["assigned_to"]] if task["assigned_to"] else []
+        return f"Task {task_id} rejected — sent back to {task['assigned_to']} for rework.", notify_targets
 
-        return f"Task {task_id} rejected — sent back to {task['assigned_to']} for rework."
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error rejecting task: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 # ── Phase 5: Interface Contracts ─────────────────────────────────────
@@ -1319,56 +1636,50 @@ async def declare_contract(agent_name: str, name: str, type: str, spec: str, ctx
     if type not in valid_types:
         return f"Invalid type '{type}'. Must be one of: {', '.join(valid_types)}"
 
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Check if exists
         cursor.execute("SELECT * FROM contracts WHERE project = ? AND name = ? AND type = ?", (project, name, type))
         existing = cursor.fetchone()
 
-        if existing:
-            existing = dict(existing)
-            new_version = existing["version"] + 1
-            cursor.execute(
-                "UPDATE contracts SET spec = ?, owner = ?, version = ?, updated_at = ? WHERE id = ?",
-                (spec, agent_name, new_version, now, existing["id"])
-            )
-            conn.commit()
-
-            # Auto-broadcast version change
-            msg = f"[CONTRACT v{new_version}] {type} '{name}' updated by {agent_name}: {spec}"
-            # Send to all registered agents except self
-            cursor.execute("SELECT name FROM agents WHERE name != ?", (agent_name,))
-            targets = [row[0] for row in cursor.fetchall()]
-            for target in targets:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc) VALUES (?, ?, ?, ?, 0, 0)",
-                    (agent_name, target, msg, now)
-                )
-            conn.commit()
-            await _notify_agents(targets)
-
-            return f"Contract updated: {type} '{name}' v{new_version} (owner: {agent_name})"
-        else:
+        if not existing:
             cursor.execute(
                 "INSERT INTO contracts (project, name, type, owner, spec, version, created_at, updated_at) VALUES (?, ?, ?, ?, ?, 1, ?, ?)",
                 (project, name, type, agent_name, spec, now, now)
             )
-            conn.commit()
-            return f"Contract declared: {type} '{name}' v1 (owner: {agent_name})"
+            return f"Contract declared: {type} '{name}' v1 (owner: {agent_name})", []
+
+        existing = dict(existing)
+        new_version = existing["version"] + 1
+        cursor.execute(
+            "UPDATE contracts SET spec = ?, owner = ?, version = ?, updated_at = ? WHERE id = ?",
+            (spec, agent_name, new_version, now, existing["id"])
+        )
+
+        # Auto-broadcast version change
+        msg = f"[CONTRACT v{new_version}] {type} '{name}' updated by {agent_name}: {spec}"
+        # Send to all registered agents except self
+        cursor.execute("SELECT name FROM agents WHERE name != ?", (agent_name,))
+        targets = [row[0] for row in cursor.fetchall()]
+        _insert_message(cursor, agent_name, targets, msg)
+        return f"Contract updated: {type} '{name}' v{new_version} (owner: {agent_name})", targets
+
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error declaring contract: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
-async def list_contracts(project: str = "", owner: str = "", type: str = "") -> str:
-    """List declared interface contracts. Filter by project, owner, type."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+async def list_contracts(project: str = "", owner: str = "", type: str = "", fields: str = "") -> str:
+    """List declared interface contracts. Filter by project, owner, type. Optional fields: comma-separated contract fields to return."""
+    def _q(conn):
+        cursor = conn.cursor()
         query = "SELECT * FROM contracts WHERE 1=1"
         params = []
         if project:
@@ -1384,11 +1695,12 @@ async def list_contracts(project: str = "", owner: str = "", type: str = "") ->
 
         cursor.execute(query, params)
         contracts = [dict(row) for row in cursor.fetchall()]
-        return json.dumps(contracts, indent=2)
+        return wire.encode("list_contracts", wire.rows(contracts, fields))
+
+    try:
+        return await _db.read(_q)
     except Exception as e:
         return f"Error listing contracts: {e}"
-    finally:
-        conn.close()
 
 
 # ── Phase 6: Minion Spawn Policy ─────────────────────────────────────
@@ -1396,12 +1708,12 @@ async def list_contracts(project: str = "", owner: str = "", type: str = "") ->
 @mcp.tool()
 async def set_spawn_policy(agent_name: str, scope: str, enabled: bool = True, max_minions: int = 3) -> str:
     """Set minion spawn policy. Only leads can call this. Scope: 'global' or a specific agent name. Controls whether agents can spawn minions and how many."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         # Verify caller is a lead
-        leads = _get_leads(cursor)
+        leads = _get_leads()
         if leads and agent_name not in leads:
             return f"Only a lead ({', '.join(leads)}) can set spawn policy."
 
@@ -1414,22 +1726,21 @@ async def set_spawn_policy(agent_name: str, scope: str, enabled: bool = True, ma
                 set_by = excluded.set_by,
                 set_at = excluded.set_at
         """, (scope, 1 if enabled else 0, max_minions, agent_name, now))
-        conn.commit()
 
         state = "enabled" if enabled else "disabled"
         return f"Spawn policy set: scope='{scope}' {state} max_minions={max_minions} (by {agent_name})"
+
+    try:
+        return await _db.write(_tx)
     except Exception as e:
         return f"Error setting spawn policy: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def get_spawn_policy(agent_name: str) -> str:
     """Get effective spawn policy for an agent. Checks agent-specific policy first, falls back to global, then defaults. Returns enabled, max_minions, active_minions, can_spawn."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    def _q(conn):
+        cursor = conn.cursor()
         # Check agent-specific policy first
         cursor.execute("SELECT enabled, max_minions FROM spawn_policy WHERE scope = ?", (agent_name,))
         row = cursor.fetchone()
@@ -1462,11 +1773,12 @@ async def get_spawn_policy(agent_name: str) -> str:
             "active_minions": active_minions,
             "can_spawn": can_spawn,
         }
-        return json.dumps(result, indent=2)
+        return wire.encode("get_spawn_policy", result)
+
+    try:
+        return await _db.read(_q)
     except Exception as e:
         return f"Error getting spawn policy: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
@@ -1476,16 +1788,15 @@ async def log_minion(agent_name: str, task_description: str, status: str, result
     if status not in valid_statuses:
         return f"Invalid status '{status}'. Must be one of: {', '.join(valid_statuses)}"
 
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         if status == "spawned":
             cursor.execute(
                 "INSERT INTO minion_log (pilot, task_description, status, spawned_at) VALUES (?, ?, 'spawned', ?)",
                 (agent_name, task_description, now)
             )
-            conn.commit()
             minion_id = cursor.lastrowid
             return f"Minion logged: id={minion_id} pilot={agent_name} status=spawned"
         else:
@@ -1503,25 +1814,19 @@ async def log_minion(agent_name: str, task_description: str, status: str, result
                 "UPDATE minion_log SET status = ?, completed_at = ?, result = ? WHERE id = ?",
                 (status, now, result or None, minion_id)
             )
-            conn.commit()
             return f"Minion updated: id={minion_id} pilot={agent_name} status={status}"
+
+    try:
+        return await _db.write(_tx)
     except Exception as e:
         return f"Error logging minion: {e}"
-    finally:
-        conn.close()
 
 
 # ── Goal / Verification Tools ────────────────────────────────────────
 
 def _next_goal_id(cursor):
     """Generate next GOAL-XXX id."""
-    cursor.execute("SELECT goal_id FROM goals ORDER BY id DESC LIMIT 1")
-    row = cursor.fetchone()
-    if row:
-        num = int(row[0].split('-')[1]) + 1
-    else:
-        num = 1
-    return f"GOAL-{num:03d}"
+    return f"GOAL-{_reserve_ids(cursor, 'goal')[0]:03d}"
 
 
 def _auto_bump_goal(cursor, goal_id, now):
@@ -1550,31 +1855,31 @@ def _auto_bump_goal(cursor, goal_id, now):
 @mcp.tool()
 async def create_goal(creator: str, title: str, ctx: Context, description: str = "", project: str = "") -> str:
     """Create a new goal. Goals group related tasks and require full verification before completion."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         goal_id = _next_goal_id(cursor)
         cursor.execute(
             "INSERT INTO goals (goal_id, title, description, project, creator, status, created_at) VALUES (?, ?, ?, ?, ?, 'open', ?)",
             (goal_id, title, description, project, creator, now)
         )
-        conn.commit()
         return f"Goal created: {goal_id} — {title}"
+
+    try:
+        return await _db.write(_tx)
     except Exception as e:
         return f"Error creating goal: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def link_task_to_goal(agent_name: str, task_id: str, goal_id: str, ctx: Context) -> str:
     """Link a task to a goal. Lead only. If goal is open and task is in_progress, bumps goal to active."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
-        leads = _get_leads(cursor)
+
+    def _tx(conn):
+        cursor = conn.cursor()
+        leads = _get_leads()
         if leads and agent_name not in leads:
             return f"Only a lead ({', '.join(leads)}) can link tasks to goals."
 
@@ -1596,20 +1901,19 @@ async def link_task_to_goal(agent_name: str, task_id: str, goal_id: str, ctx: Co
         if goal["status"] == "open" and task["status"] in ("in_progress", "review", "completed"):
             cursor.execute("UPDATE goals SET status = 'active' WHERE goal_id = ?", (goal_id,))
 
-        conn.commit()
         return f"Task {task_id} linked to goal {goal_id}."
+
+    try:
+        return await _db.write(_tx)
     except Exception as e:
         return f"Error linking task to goal: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def goal_status(goal_id: str, ctx: Context) -> str:
     """Get goal info and all linked tasks with their statuses."""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
+    def _q(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM goals WHERE goal_id = ?", (goal_id,))
         goal = cursor.fetchone()
         if not goal:
@@ -1640,41 +1944,42 @@ async def goal_status(goal_id: str, ctx: Context) -> str:
             lines.append(f"\nGoal verified by: {goal['verified_by']} at {goal['verified_at']}")
 
         return "\n".join(lines)
+
+    try:
+        return await _db.read(_q)
     except Exception as e:
         return f"Error getting goal status: {e}"
-    finally:
-        conn.close()
 
 
 @mcp.tool()
 async def verify_task(agent_name: str, task_id: str, ctx: Context, notes: str = "") -> str:
     """Independently verify a completed task. Enforces: verifier != builder, verifier != approver, hat conflict check."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         if not task:
-            return f"Task {task_id} not found."
+            return f"Task {task_id} not found.", []
         task = dict(task)
 
         if task["status"] != "completed":
-            return f"Task {task_id} is '{task['status']}', must be 'completed' to verify."
+            return f"Task {task_id} is '{task['status']}', must be 'completed' to verify.", []
 
         # Enforcement: verifier != builder
         if agent_name == task["assigned_to"]:
-            return f"BLOCKED: You ({agent_name}) built this task. Cannot verify your own work."
+            return f"BLOCKED: You ({agent_name}) built this task. Cannot verify your own work.", []
 
         # Enforcement: verifier != approver
         if task.get("approved_by") and agent_name == task["approved_by"]:
-            return f"BLOCKED: You ({agent_name}) approved this task. Cannot also verify it."
+            return f"BLOCKED: You ({agent_name}) approved this task. Cannot also verify it.", []
 
         # Enforcement: hat conflict (verifying = tester hat)
         project = task.get("project", "")
         conflict = _check_hat_conflict(cursor, agent_name, "tester", project)
         if conflict:
-            return conflict
+            return conflict, []
 
         cursor.execute(
             "UPDATE tasks SET status = 'verified', verified_by = ?, verified_at = ?, updated_at = ? WHERE id = ?",
@@ -1689,35 +1994,29 @@ async def verify_task(agent_name: str, task_id: str, ctx: Context, notes: str =
         if notes:
             msg += f"\nNotes: {notes}"
         if task["assigned_to"]:
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                (agent_name, task["assigned_to"], msg, now, task_id)
-            )
+            _insert_message(cursor, agent_name, [task["assigned_to"]], msg, task_id=task_id)
 
         # Notify leads if goal bumped
         notify_targets = []
         if task["assigned_to"]:
             notify_targets.append(task["assigned_to"])
         if goal_msg:
-            leads = _get_leads(cursor)
-            for lead in leads:
-                cursor.execute(
-                    "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                    (agent_name, lead, goal_msg, now, task_id)
-                )
-                notify_targets.append(lead)
-
-        conn.commit()
-        await _notify_agents(notify_targets)
+            leads = _get_leads()
+            _insert_message(cursor, agent_name, leads, goal_msg, task_id=task_id)
+            notify_targets.extend(leads)
 
         result = f"Task {task_id} verified by {agent_name}."
         if goal_msg:
             result += f"\n{goal_msg}"
-        return result
+        return result, notify_targets
+
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error verifying task: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
@@ -1726,26 +2025,26 @@ async def reject_verification(agent_name: str, task_id: str, reason: str, ctx: C
     if not reason or not reason.strip():
         return "Reason is required for rejection."
 
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
+
+    def _tx(conn):
+        cursor = conn.cursor()
         cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
         task = cursor.fetchone()
         if not task:
-            return f"Task {task_id} not found."
+            return f"Task {task_id} not found.", []
         task = dict(task)
 
         if task["status"] != "completed":
-            return f"Task {task_id} is '{task['status']}', must be 'completed' to reject verification."
+            return f"Task {task_id} is '{task['status']}', must be 'completed' to reject verification.", []
 
         # Enforcement: rejector != builder
         if agent_name == task["assigned_to"]:
-            return f"BLOCKED: You ({agent_name}) built this task. Cannot reject your own work."
+            return f"BLOCKED: You ({agent_name}) built this task. Cannot reject your own work.", []
 
         # Enforcement: rejector != approver
         if task.get("approved_by") and agent_name == task["approved_by"]:
-            return f"BLOCKED: You ({agent_name}) approved this task. Cannot also reject verification."
+            return f"BLOCKED: You ({agent_name}) approved this task. Cannot also reject verification.", []
 
         cursor.execute(
             "UPDATE tasks SET status = 'in_progress', updated_at = ? WHERE id = ?",
@@ -1764,41 +2063,39 @@ async def reject_verification(agent_name: str, task_id: str, reason: str, ctx: C
         notify_targets = []
         if task["assigned_to"]:
             msg = f"[VERIFICATION REJECTED] {task_id}: {task['title']}\nRejected by: {agent_name}\nReason: {reason}\n\nTask sent back to in_progress. Please rework and resubmit."
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                (agent_name, task["assigned_to"], msg, now, task_id)
-            )
+            _insert_message(cursor, agent_name, [task["assigned_to"]], msg, task_id=task_id)
             notify_targets.append(task["assigned_to"])
 
-        conn.commit()
-        await _notify_agents(notify_targets)
+        return f"Task {task_id} verification rejected. Sent back to in_progress.", notify_targets
 
-        return f"Task {task_id} verification rejected. Sent back to in_progress."
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error rejecting verification: {e}"
-    finally:
-        conn.close()
+
+    await _notify_agents(notify_targets)
+    return response
 
 
 @mcp.tool()
 async def verify_goal(agent_name: str, goal_id: str, ctx: Context, notes: str = "") -> str:
     """Lead verifies a goal after all linked tasks are verified. Final sign-off."""
-    conn = get_db()
-    cursor = conn.cursor()
     now = datetime.datetime.now().isoformat()
-    try:
-        leads = _get_leads(cursor)
+
+    def _tx(conn):
+        cursor = conn.cursor()
+        leads = _get_leads()
         if leads and agent_name not in leads:
-            return f"Only a lead ({', '.join(leads)}) can verify goals."
+            return f"Only a lead ({', '.join(leads)}) can verify goals.", []
 
         cursor.execute("SELECT * FROM goals WHERE goal_id = ?", (goal_id,))
         goal = cursor.fetchone()
         if not goal:
-            return f"Goal {goal_id} not found."
+            return f"Goal {goal_id} not found.", []
         goal = dict(goal)
 
         if goal["status"] != "pending_verify":
-            return f"Goal {goal_id} is '{goal['status']}', must be 'pending_verify' to verify."
+            return f"Goal {goal_id} is '{goal['status']}', must be 'pending_verify' to verify.", []
 
         # Check all tasks are verified
         cursor.execute("SELECT id, title, status FROM tasks WHERE goal_id = ?", (goal_id,))
@@ -1808,7 +2105,7 @@ async def verify_goal(agent_name: str, goal_id: str, ctx: Context, notes: str =
             lines = [f"Cannot verify goal — {len(not_verified)} task(s) not yet verified:"]
             for t in not_verified:
                 lines.append(f"  {t[0]}: {t[1]} — status: {t[2]}")
-            return "\n".join(lines)
+            return "\n".join(lines), []
 
         cursor.execute(
             "UPDATE goals SET status = 'verified', verified_by = ?, verified_at = ? WHERE goal_id = ?",
@@ -1823,24 +2120,366 @@ async def verify_goal(agent_name: str, goal_id: str, ctx: Context, notes: str =
             row = cursor.fetchone()
             if row and row[0]:
                 assignees.add(row[0])
-        for assignee in assignees:
-            msg = f"[GOAL VERIFIED] {goal_id}: {goal['title']} — verified by {agent_name}"
-            if notes:
-                msg += f"\nNotes: {notes}"
-            cursor.execute(
-                "INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, task_id) VALUES (?, ?, ?, ?, 0, 0, ?)",
-                (agent_name, assignee, msg, now, None)
-            )
-            notify_targets.append(assignee)
+        msg = f"[GOAL VERIFIED] {goal_id}: {goal['title']} — verified by {agent_name}"
+        if notes:
+            msg += f"\nNotes: {notes}"
+        _insert_message(cursor, agent_name, list(assignees), msg)
+        notify_targets.extend(assignees)
 
-        conn.commit()
-        await _notify_agents(notify_targets)
+        return f"Goal {goal_id} verified by {agent_name}. All {len(tasks)} tasks confirmed.", notify_targets
 
-        return f"Goal {goal_id} verified by {agent_name}. All {len(tasks)} tasks confirmed."
+    try:
+        response, notify_targets = await _db.write(_tx)
     except Exception as e:
         return f"Error verifying goal: {e}"
+
+    await _notify_agents(notify_targets)
+    return response
+
+
+# ── Task Metrics ─────────────────────────────────────────────────────
+# Triggers log every task status change to task_events and fold it into
+# task_rollups (migrations v13, v15). Totals for the whole room or one
+# agent, project or role_hat come straight from the rollups; anything
+# narrower reads task_events through an index on one of its filters
+# (project, agent, role_hat or at; migrations v14). Percentiles need the
+# individual durations, so they cover `since` if given and otherwise the
+# last METRICS_WINDOW_DAYS, which keeps their cost to recent activity.
+
+_REWORK = "COALESCE(e.to_status = 'in_progress' AND e.from_status IN ('review', 'completed'), 0)"
+
+
+def _percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list; None if it's empty."""
+    if not ordered:
+        return None
+    return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 3)
+
+
+@mcp.tool()
+async def task_metrics(project: str = "", agent: str = "", role_hat: str = "", since: str = "") -> str:
+    """Task flow metrics from the task status log. Per state: times entered and left, distinct tasks that entered it, rework (sent back to in_progress), avg seconds spent in it, and p50/p95 seconds. throughput: distinct tasks that reached completed / verified. cycle_time: seconds from creation to each task's last completion. Filter by project, agent (assignee), role_hat, or since (ISO timestamp). Percentiles and cycle_time cover since, or the last DEAD_DROP_METRICS_WINDOW_DAYS (default 30) without it; percentiles_since says which."""
+    filters = [(column, value) for column, value in (("project", project), ("agent", agent), ("role_hat", role_hat)) if value]
+    window_start = since or (
+        (datetime.datetime.now() - datetime.timedelta(days=METRICS_WINDOW_DAYS)).isoformat() if METRICS_WINDOW_DAYS > 0 else "")
+
+    def _where(start):
+        conditions, params = [], []
+        for column, value in filters:
+            conditions.append(f"e.{column} = ?")
+            params.append(value)
+        if start:
+            conditions.append("e.at >= ?")
+            params.append(start)
+        return " AND ".join(conditions) or "1=1", params
+
+    def _q(conn):
+        states = {}
+        if len(filters) <= 1 and not since:
+            dim, key = filters[0] if filters else ("all", "")
+            rows = conn.execute("SELECT state, entered, exited, tasks, seconds, rework FROM task_rollups WHERE dim = ? AND key = ?",
+                                (dim, key))
+        else:
+            where, params = _where(since)
+            rows = conn.execute(f"""
+                SELECT state, SUM(entered), SUM(exited), COUNT(DISTINCT task_id), SUM(seconds), SUM(rework) FROM (
+                    SELECT e.to_status AS state, 1 AS entered, 0 AS exited, e.task_id, 0 AS seconds, {_REWORK} AS rework
+                    FROM task_events e WHERE {where}
+                    UNION ALL
+                    SELECT e.from_status, 0, 1, NULL, COALESCE(e.seconds_in_prev, 0), 0
+                    FROM task_events e WHERE e.from_status IS NOT NULL AND {where}
+                ) GROUP BY state
+            """, params + params)
+        for state, entered, exited, tasks, seconds, rework in rows:
+            states[state] = {"entered": entered, "exited": exited, "tasks": tasks, "rework": rework,
+                             "avg_s": round(seconds / exited, 3) if exited else None}
+
+        where, params = _where(window_start)
+        durations = {}
+        for state, seconds in conn.execute(f"""
+            SELECT e.from_status, e.seconds_in_prev FROM task_events e
+            WHERE e.from_status IS NOT NULL AND e.seconds_in_prev IS NOT NULL AND {where}
+        """, params):
+            durations.setdefault(state, []).append(seconds)
+        # Sorted here, not in SQL: an ORDER BY from_status pulls the planner
+        # onto idx_task_events_from and off the at index the window needs.
+        for state, seconds in durations.items():
+            ordered = sorted(seconds)
+            states[state].update(p50_s=_percentile(ordered, 50), p95_s=_percentile(ordered, 95))
+
+        # One completion per task: a task reworked after completed counts
+        # once, at its last completion.
+        cycle = [row[0] for row in conn.execute(f"""
+            SELECT (julianday(e.at) - julianday(t.created_at)) * 86400 AS seconds
+            FROM task_events e JOIN tasks t ON t.id = e.task_id
+            WHERE e.id IN (SELECT MAX(e.id) FROM task_events e
+                           WHERE e.to_status = 'completed' AND {where} GROUP BY e.task_id)
+            ORDER BY seconds
+        """, params)]
+        return states, cycle
+
+    try:
+        states, cycle = await _db.read(_q)
+        return wire.encode("task_metrics", {
+            "filters": dict(filters, **({"since": since} if since else {})),
+            "percentiles_since": window_start or None,
+            "throughput": {state: states.get(state, {}).get("tasks", 0) for state in ("completed", "verified")},
+            "rework": sum(s["rework"] for s in states.values()),
+            "cycle_time": {"count": len(cycle), "p50_s": _percentile(cycle, 50), "p95_s": _percentile(cycle, 95)},
+            "states": states,
+        })
+    except Exception as e:
+        return f"Error computing task metrics: {e}"
+
+
+# ── Search ───────────────────────────────────────────────────────────
+
+SEARCH_KINDS = ("messages", "tasks", "contracts")
+
+
+def _fts_phrases(query):
+    """Quote every word of a query so FTS5 reads punctuation (TASK-001, a.b) literally."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+def _search_kind(conn, kind, match, agent, task_id, project, since, until, limit, tier="main"):
+    """Top `limit` hits of one kind by bm25 rank (lower is better). Messages are searched in `tier`."""
+    conditions, params = [], [match]
+    if kind == "messages":
+        select = f"""
+            SELECT 'message' AS kind, (SELECT MIN(id) FROM {tier}.deliveries WHERE body_id = b.id) AS id,
+                   b.from_agent, (SELECT group_concat(to_agent, ',') FROM {tier}.deliveries WHERE body_id = b.id AND is_cc = 0) AS to_agent,
+                   b.task_id, b.timestamp, snippet(messages_fts, 0, '**', '**', '…', 16) AS snippet,
+                   bm25(messages_fts) AS rank
+            FROM {tier}.messages_fts JOIN {tier}.message_bodies b ON b.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?"""
+        if agent:
+            conditions.append(f"(b.from_agent = ? OR EXISTS (SELECT 1 FROM {tier}.deliveries WHERE body_id = b.id AND to_agent = ?))")
+            params += [agent, agent]
+        if task_id:
+            conditions.append("b.task_id = ?")
+            params.append(task_id)
+        if project:
+            conditions.append("b.task_id IN (SELECT id FROM main.tasks WHERE project = ?)")
+            params.append(project)
+        timestamp = "b.timestamp"
+    elif kind == "tasks":
+        select = """
+            SELECT 'task' AS kind, t.id, t.title, t.status, t.assigned_to, t.project, t.updated_at AS timestamp,
+                   snippet(tasks_fts, -1, '**', '**', '…', 16) AS snippet,
+                   bm25(tasks_fts, 0.0, 3.0, 1.0, 1.0) AS rank
+            FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.task_id
+            WHERE tasks_fts MATCH ?"""
+        if agent:
+            conditions.append("(t.assigned_to = ? OR t.created_by = ?)")
+            params += [agent, agent]
+        if task_id:
+            conditions.append("t.id = ?")
+            params.append(task_id)
+        if project:
+            conditions.append("t.project = ?")
+            params.append(project)
+        timestamp = "t.updated_at"
+    else:
+        if task_id:
+            return []  # contracts aren't tied to tasks
+        select = """
+            SELECT 'contract' AS kind, c.id, c.name, c.type, c.owner, c.project, c.version, c.updated_at AS timestamp,
+                   snippet(contracts_fts, -1, '**', '**', '…', 16) AS snippet,
+                   bm25(contracts_fts, 2.0, 1.0) AS rank
+            FROM contracts_fts JOIN contracts c ON c.id = contracts_fts.rowid
+            WHERE contracts_fts MATCH ?"""
+        if agent:
+            conditions.append("c.owner = ?")
+            params.append(agent)
+        if project:
+            conditions.append("c.project = ?")
+            params.append(project)
+        timestamp = "c.updated_at"
+    if since:
+        conditions.append(f"{timestamp} >= ?")
+        params.append(since)
+    if until:
+        conditions.append(f"{timestamp} < ?")
+        params.append(until)
+
+    query = select + "".join(f" AND {c}" for c in conditions) + " ORDER BY rank LIMIT ?"
+    return [dict(row) for row in conn.execute(query, params + [limit])]
+
+
+@mcp.tool()
+async def search(query: str, kinds: str = "", agent: str = "", task_id: str = "", project: str = "",
+                 since: str = "", until: str = "", limit: int = 10, fields: str = "") -> str:
+    """Full-text search over message content, task title/description/result, and contract name/spec. Returns the best `limit` hits, ranked, each with a snippet (matches in **bold**). kinds: comma-separated subset of messages,tasks,contracts (default all). Filters: agent (sender/recipient, assignee/creator, contract owner), task_id, project, since/until (ISO timestamps). Query syntax: words (all must match), "exact phrase", OR, NOT, prefix*."""
+    wanted = [k.strip() for k in kinds.split(",") if k.strip()] if kinds else list(SEARCH_KINDS)
+    unknown = [k for k in wanted if k not in SEARCH_KINDS]
+    if unknown:
+        return f"Invalid kinds {unknown}. Must be among: {', '.join(SEARCH_KINDS)}"
+    if not query.strip():
+        return "Error searching: empty query"
+    limit = max(1, min(limit, PAGE_MAX))
+
+    def _q(conn):
+        results = []
+        for kind in wanted:
+            # Messages moved to the cold tier are searched in its own index.
+            for tier in _tiers() if kind == "messages" else ("main",):
+                try:
+                    hits = _search_kind(conn, kind, query, agent, task_id, project, since, until, limit, tier)
+                except sqlite3.OperationalError as e:
+                    if "fts5" not in str(e) and "no such column" not in str(e):
+                        raise
+                    # Not valid FTS5 syntax (e.g. "TASK-001"): search the words literally.
+                    hits = _search_kind(conn, kind, _fts_phrases(query), agent, task_id, project, since, until, limit, tier)
+                results.extend(hits)
+        # A message caught mid-move is in both tiers; keep one hit for it.
+        results = list({(hit["kind"], hit["id"]): hit for hit in reversed(results)}.values())
+        results.sort(key=lambda hit: hit["rank"])
+        for hit in results:
+            hit["rank"] = round(hit["rank"], 4)
+        return results[:limit]
+
+    try:
+        results = await _db.read(_q)
+        return wire.encode("search", {"results": wire.rows(results, fields)})
+    except Exception as e:
+        return f"Error searching: {e}"
+
+
+# ── Diagnostics ──────────────────────────────────────────────────────
+
+@mcp.tool()
+async def server_stats() -> str:
+    """Server internals for operators. db_pool: connection checkouts and waits — steady reader_waits mean DEAD_DROP_DB_READERS is too small. db_writer: group-commit batches — avg_batch near 1 under load means the batching window is too short. unread_cache/agent_cache/name_cache: hit rates and evictions — steady evictions mean DEAD_DROP_CACHE_SIZE is too small. wire: response bytes and encoder CPU time per tool. retention: mail moved to the cold tier, handshakes pruned, bytes reclaimed by incremental vacuum, and each tier's size and free space (free_bytes > 0 with auto_vacuum none needs `python -m dead_drop.retention --enable-vacuum`). push: notification fan-outs and their duration — timed_out counts clients that didn't take a push within DEAD_DROP_PUSH_TIMEOUT; coalesced counts notifications merged into a push already pending in the DEAD_DROP_PUSH_COALESCE_MS window. presence: write-behind flushes of last_seen/heartbeat_at/status (pending: agents not yet written). sessions: push sessions registered, dropped when their transport closed, and evicted by the sweep (evicted_dead: transport gone without closing; evicted_idle: no tool call in DEAD_DROP_SESSION_IDLE seconds)."""
+    stats = {
+        "db_pool": _pool.stats(),
+        "db_writer": _db.stats(),
+        "unread_cache": _unread_cache.stats(),
+        "agent_cache": _agent_cache.stats(),
+        "name_cache": _name_cache.stats(),
+        "wire": wire.stats(),
+        "retention": _retention.stats() if _retention else {"days": 0},
+        "sessions": dict(_session_stats, registered=len(_agent_sessions)),
+        "presence": _presence_flusher.stats(),
+        "push": dict(_push_stats, fanout_ms_avg=_push_stats["fanout_ms_total"] / max(1, _push_stats["fanouts"])),
+    }
+    stats["retention"]["space"] = await _db.read(lambda conn: {tier: retention_space(conn, tier) for tier in _tiers()})
+    return wire.encode("server_stats", stats)
+
+
+@mcp.tool()
+async def check_inbox_counters(repair: bool = False) -> str:
+    """Recount unread mail from scratch and compare with the inbox_counters table behind unread alerts and send blocking. repair=True rewrites the table from the recount."""
+    try:
+        if repair:
+            mismatches = await _db.write(lambda conn: check_counters(conn, repair=True))
+        else:
+            mismatches = await _db.read(check_counters)
+        return wire.encode("check_inbox_counters", {"mismatches": mismatches, "repaired": repair})
+    except Exception as e:
+        return f"Error checking inbox counters: {e}"
+
+
+# ── Event Stream ─────────────────────────────────────────────────────
+# GET /agents/{name}/events: Server-Sent Events for watchers that don't run
+# an MCP session (shell scripts, dashboards, other runtimes). Replays the
+# events log (migrations v8) past Last-Event-ID, then follows it live.
+# The log keeps DEAD_DROP_EVENTS_REPLAY_HOURS of events (see
+# _install_event_trigger); a client resuming from further back gets what
+# is left.
+
+def _request_token(request):
+    auth = request.headers.get("authorization", "")
+    if auth.lower().startswith("bearer "):
+        return auth[7:].strip()
+    return request.query_params.get("token", "")
+
+
+def _events_after(conn, audience, after_id, limit):
+    """Up to `limit` events past after_id that `audience` (agent name variants) sees, as (id, kind, payload)."""
+    rows = conn.execute(f"""
+        SELECT id, kind, ref, detail FROM events
+        WHERE id > ? AND (agent_name IS NULL OR agent_name IN ({','.join(['?'] * len(audience))}))
+        ORDER BY id LIMIT ?
+    """, [after_id] + audience + [limit]).fetchall()
+    message_ids = [int(row["ref"]) for row in rows if row["kind"] == "message"]
+    messages = {}
+    if message_ids:
+        for tier in _tiers():
+            found = conn.execute(f"SELECT * FROM {tier}.messages WHERE id IN ({','.join(['?'] * len(message_ids))})",
+                                 message_ids)
+            messages.update((m["id"], dict(m)) for m in found)
+    events = []
+    for row in rows:
+        if row["kind"] == "message":
+            payload = messages.get(int(row["ref"]), {"id": int(row["ref"])})
+        else:
+            payload = {f"{row['kind']}_id": int(row["ref"]) if row["kind"] == "handshake" else row["ref"]}
+            payload.update(json.loads(row["detail"] or "{}"))
+        events.append((row["id"], row["kind"], payload))
+    return events
+
+
+async def _event_stream(request, audience, after_id):
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    stream = (loop, wake)
+    with _event_streams_lock:
+        _event_streams.add(stream)
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            # Cleared before reading: an event committed after the read
+            # still wakes the wait below.
+            wake.clear()
+            events = await _db.read(_events_after, audience, after_id, EVENTS_BATCH)
+            for event_id, kind, payload in events:
+                data = wire.encode("agent_events", wire.rows([payload])[0])
+                yield f"id: {event_id}\nevent: {kind}\ndata: {data}\n\n"
+                after_id = event_id
+            if len(events) == EVENTS_BATCH:
+                continue
+            if await request.is_disconnected():
+                return
+            try:
+                await asyncio.wait_for(wake.wait(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
     finally:
-        conn.close()
+        with _event_streams_lock:
+            _event_streams.discard(stream)
+
+
+@mcp.custom_route("/agents/{name:path}/events", methods=["GET"])
+async def agent_events(request: Request) -> Response:
+    """GET /agents/{name}/events — new mail, task transitions and handshakes as SSE.
+
+    Authenticated with the room token (Authorization: Bearer, or ?token=)
+    when DEAD_DROP_ROOM_TOKEN is set. Resumes after the Last-Event-ID header
+    (or ?last_event_id=); without one it starts from now.
+    """
+    if ROOM_TOKEN and _request_token(request) != ROOM_TOKEN:
+        return JSONResponse({"error": "invalid room token"}, status_code=401)
+    name = request.path_params["name"]
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+
+    def _q(conn):
+        # Direct mail may be addressed to the short or the team-scoped name.
+        profile = _agent_profile(conn.cursor(), name)
+        audience = [name] + ([f"{profile['team']}/{name}"] if profile and profile["team"] else [])
+        start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        return audience, start
+
+    try:
+        audience, start = await _db.read(_q)
+        after_id = int(last_event_id) if last_event_id else start
+    except ValueError:
+        return JSONResponse({"error": "Last-Event-ID must be an event id"}, status_code=400)
+    return StreamingResponse(
+        _event_stream(request, audience, after_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # ── Dynamic Tool Descriptions ────────────────────────────────────────
@@ -1848,29 +2487,43 @@ async def verify_goal(agent_name: str, goal_id: str, ctx: Context, notes: str =
 # description. When tools/list_changed fires, the client re-fetches tools
 # and sees "*** YOU HAVE 3 UNREAD MESSAGE(S) from juno ***" which prompts
 # the AI to call check_inbox automatically.
+#
+# Every push makes the client re-fetch the list, so the tools themselves are
+# built once and shared; only check_inbox is copied, and only for an agent
+# with unread mail. _notify_agent warms _unread_cache just before the push,
+# so the count normally comes from memory.
+
+_tool_list = None                # [Tool], built on the first tools/list
 
-async def _custom_list_tools():
-    """list_tools handler with per-session unread count injection."""
-    tools = await mcp.list_tools()
 
-    # Identify calling agent from current session
+def _calling_agent():
+    """The agent registered on the current request's session, if any."""
     try:
         session = mcp._mcp_server.request_context.session
-        agent_name = _session_to_agent.get(id(session))
     except (LookupError, AttributeError):
-        agent_name = None
+        return None
+    agent_name = _session_to_agent.get(id(session))
+    # id() is only unique among live objects; make sure it's still this session.
+    return agent_name if _agent_sessions.get(agent_name) is session else None
+
+
+async def _custom_list_tools():
+    """list_tools handler with per-session unread count injection."""
+    global _tool_list
+    if _tool_list is None:
+        _tool_list = await mcp.list_tools()
 
+    agent_name = _calling_agent()
     if agent_name:
-        count, senders = _get_unread_info(agent_name)
+        count, senders = await _get_unread_info(agent_name)
         if count > 0:
             sender_str = ", ".join(senders)
             alert = f"*** YOU HAVE {count} UNREAD MESSAGE(S) from {sender_str} *** Call check_inbox now!"
-            for tool in tools:
-                if tool.name == "check_inbox":
-                    tool.description = f"{alert} | {tool.description}"
-                    break
+            return [tool.model_copy(update={"description": f"{alert} | {tool.description}"})
+                    if tool.name == "check_inbox" else tool
+                    for tool in _tool_list]
 
-    return tools
+    return _tool_list
 
 # Register the override (replaces FastMCP's default list_tools handler)
 mcp._mcp_server.list_tools()(_custom_list_tools)
@@ -1921,11 +2574,25 @@ def main():
     mcp._host = HOST
     mcp._port = PORT
 
+    if _retention:
+        _retention.start()
+    _presence_flusher.start()
+
     transport = "stdio"
     if "--http" in args:
         transport = "streamable-http"
         logger.info(f"Dead Drop server starting on http://{HOST}:{PORT}/mcp")
-    mcp.run(transport=transport)
+    try:
+        mcp.run(transport=transport)
+    finally:
+        _presence_flusher.stop()
+        if _retention:
+            # Lets a pass finish its current batch: move_batch commits the
+            # cold copy and the hot delete separately.
+            _retention.stop()
+        # Drain the write queue: its thread is a daemon, so whatever is still
+        # queued when the interpreter exits would be lost.
+        _db.shutdown()
 
 
 if __name__ == "__main__":
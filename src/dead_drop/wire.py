@@ -0,0 +1,68 @@
+"""Encoding tool responses for the wire.
+
+Listing tools (check_inbox, get_history, who, list_tasks, list_contracts,
+the hub's list_rooms) return whole table rows, mostly to an LLM that pays
+for every byte. They shape their rows with rows(). Every tool that answers
+in JSON encodes the response with encode(), which also counts bytes and
+encoder CPU time per tool.
+
+Compact mode, the default, encodes without indentation or spaces and drops
+null fields. DEAD_DROP_WIRE_FORMAT=pretty restores the old indented
+output with every field.
+"""
+
+import json
+import os
+import threading
+import time
+
+COMPACT = os.getenv("DEAD_DROP_WIRE_FORMAT", "compact") != "pretty"
+
+# Built once: json.dumps() with arguments constructs a new encoder per call.
+_compact_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+_pretty_encoder = json.JSONEncoder(indent=2)
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def rows(items, fields=""):
+    """Shape rows for a response.
+
+    fields is a comma-separated projection ("id,from_agent,content"); empty
+    keeps every column. Names that aren't columns are ignored. In compact
+    mode null values are dropped as well.
+    """
+    keep = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    shaped = []
+    for item in items:
+        if keep is not None:
+            item = {k: item[k] for k in keep if k in item}
+        if COMPACT:
+            item = {k: v for k, v in item.items() if v is not None}
+        shaped.append(item)
+    return shaped
+
+
+def encode(tool, data):
+    """Serialize a tool response, recording its size and encode time under tool."""
+    started = time.thread_time()
+    text = (_compact_encoder if COMPACT else _pretty_encoder).encode(data)
+    cpu_ms = (time.thread_time() - started) * 1000
+    size = len(text.encode("utf-8")) if not text.isascii() else len(text)
+    with _stats_lock:
+        entry = _stats.setdefault(tool, {"responses": 0, "bytes": 0, "encode_cpu_ms": 0.0})
+        entry["responses"] += 1
+        entry["bytes"] += size
+        entry["encode_cpu_ms"] += cpu_ms
+    return text
+
+
+def stats():
+    """Per-tool response counts, total and average bytes, and encoder CPU time."""
+    with _stats_lock:
+        snapshot = {tool: dict(entry) for tool, entry in _stats.items()}
+    for entry in snapshot.values():
+        entry["avg_bytes"] = round(entry["bytes"] / entry["responses"])
+        entry["encode_cpu_ms"] = round(entry["encode_cpu_ms"], 3)
+    return {"format": "compact" if COMPACT else "pretty", "tools": snapshot}
@@ -0,0 +1,49 @@
+"""Shared fixtures: the room server's tools against a fresh database per test."""
+
+import os
+import tempfile
+
+import pytest
+
+# server opens DEAD_DROP_DB_PATH at import; keep that away from ~/.dead-drop.
+os.environ.setdefault("DEAD_DROP_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="dead-drop-test-"), "messages.db"))
+
+from dead_drop import server  # noqa: E402
+from dead_drop.db import ConnectionPool, DBExecutor  # noqa: E402
+
+
+class FakeSession:
+    """Stands in for an MCP ServerSession; records what the server pushes."""
+
+    def __init__(self):
+        self.pushes = []
+
+    async def send_tool_list_changed(self):
+        self.pushes.append("tools/list_changed")
+
+    async def send_log_message(self, level, data, logger=None, **kwargs):
+        self.pushes.append(data)
+
+
+class FakeContext:
+    def __init__(self):
+        self.session = FakeSession()
+
+
+@pytest.fixture
+def room(tmp_path, monkeypatch):
+    """The server module, pointed at an empty database with inline DB access."""
+    pool = ConnectionPool(str(tmp_path / "messages.db"), readers=2)
+    monkeypatch.setattr(server, "_pool", pool)
+    monkeypatch.setattr(server, "_db", DBExecutor(pool, inline=True))
+    monkeypatch.setattr(server, "_agent_sessions", {})
+    monkeypatch.setattr(server, "_session_to_agent", {})
+    monkeypatch.setattr(server, "_session_seen", {})
+    presence = server.PresenceBuffer()
+    monkeypatch.setattr(server, "_presence", presence)
+    monkeypatch.setattr(server, "_presence_flusher", server.PresenceFlusher(pool, presence))
+    # Push inline, so tests see notifications as soon as the tool returns.
+    monkeypatch.setattr(server, "PUSH_COALESCE_MS", 0)
+    server.init_db()
+    yield server
+    pool.close()
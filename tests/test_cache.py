@@ -0,0 +1,43 @@
+"""Tests for dead_drop.cache — bounded LRU with race-free loading."""
+
+from dead_drop.cache import LRUCache
+
+
+def test_hits_and_misses_are_counted():
+    cache = LRUCache(4)
+    hit, token = cache.lookup("a")
+    assert not hit
+    assert cache.put("a", 1, token)
+    assert cache.lookup("a") == (True, 1)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_size_is_bounded_lru():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.lookup("a")  # a is now most recent
+    cache.put("c", 3)
+    assert cache.lookup("b")[0] is False
+    assert cache.lookup("a") == (True, 1)
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_load_racing_an_invalidation_is_discarded():
+    cache = LRUCache(4)
+    _, token = cache.lookup("a")
+    cache.invalidate("a")  # a write lands while the load is in flight
+    assert not cache.put("a", "stale", token)
+    assert cache.lookup("a")[0] is False
+    _, token = cache.lookup("a")
+    assert cache.put("a", "fresh", token)
+
+
+def test_evicted_invalidation_still_rejects_old_tokens():
+    cache = LRUCache(1)
+    _, token = cache.lookup("a")
+    cache.invalidate("a")
+    cache.put("b", 2)  # evicts a's invalidation record
+    assert not cache.put("a", "stale", token)
@@ -0,0 +1,92 @@
+"""Tests for the trigger-maintained inbox_counters table and dead_drop.counters."""
+
+import random
+import sqlite3
+
+from dead_drop.counters import check, stored
+from dead_drop.migrations import migrate
+
+AGENTS = ["lead", "a", "b", "team/c"]
+
+
+def _db(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "messages.db"))
+    migrate(conn)
+    return conn
+
+
+def _send(conn, sender, *to):
+    body_id = conn.execute("INSERT INTO message_bodies (from_agent, content) VALUES (?, 'x')", (sender,)).lastrowid
+    for agent in to:
+        conn.execute("INSERT INTO deliveries (body_id, from_agent, to_agent, read_flag) VALUES (?, ?, ?, 0)", (body_id, sender, agent))
+
+
+def _read_inbox(conn, agent):
+    conn.execute("UPDATE deliveries SET read_flag = 1 WHERE to_agent = ? AND read_flag = 0", (agent,))
+    top = conn.execute("SELECT MAX(id) FROM messages WHERE to_agent = 'all'").fetchone()[0]
+    if top:
+        conn.execute("""
+            INSERT INTO broadcast_watermarks (agent_name, last_read_id) VALUES (?, ?)
+            ON CONFLICT(agent_name) DO UPDATE SET last_read_id = MAX(last_read_id, excluded.last_read_id)
+        """, (agent, top))
+
+
+def test_triggers_track_sends_reads_and_broadcasts(tmp_path):
+    conn = _db(tmp_path)
+    conn.execute("INSERT INTO agents (name) VALUES ('a'), ('b')")
+    _send(conn, "a", "b")
+    _send(conn, "a", "b")
+    _send(conn, "b", "all")
+    assert stored(conn) == {("b", "a"): (2, 0), ("a", "b"): (0, 1)}
+
+    _read_inbox(conn, "b")
+    _read_inbox(conn, "a")
+    assert stored(conn) == {}
+    assert check(conn) == []
+
+
+def test_late_registration_sees_earlier_broadcasts(tmp_path):
+    conn = _db(tmp_path)
+    _send(conn, "lead", "all")
+    _send(conn, "lead", "all")
+    conn.execute("INSERT INTO agents (name) VALUES ('a')")
+    assert stored(conn) == {("a", "lead"): (0, 2)}
+    conn.execute("DELETE FROM agents WHERE name = 'a'")
+    assert stored(conn) == {}
+
+
+def test_random_workload_stays_consistent(tmp_path):
+    conn = _db(tmp_path)
+    rng = random.Random(7)
+    registered = set()
+    for _ in range(2000):
+        op = rng.random()
+        agent = rng.choice(AGENTS)
+        if op < 0.45:
+            _send(conn, agent, *rng.sample(AGENTS + ["all"], rng.randint(1, 3)))
+        elif op < 0.7:
+            _read_inbox(conn, agent)
+        elif op < 0.8 and agent not in registered:
+            conn.execute("INSERT INTO agents (name) VALUES (?)", (agent,))
+            registered.add(agent)
+        elif op < 0.85 and agent in registered:
+            conn.execute("DELETE FROM agents WHERE name = ?", (agent,))
+            registered.discard(agent)
+        elif op < 0.9:
+            conn.execute("UPDATE deliveries SET read_flag = 0 WHERE id = (SELECT MAX(id) FROM deliveries WHERE to_agent != 'all')")
+        else:
+            conn.execute("DELETE FROM deliveries WHERE id = (SELECT MIN(id) FROM deliveries)")
+            conn.execute("DELETE FROM message_bodies WHERE id NOT IN (SELECT body_id FROM deliveries)")
+    assert check(conn) == []
+
+
+def test_repair_rewrites_drifted_counters(tmp_path):
+    conn = _db(tmp_path)
+    conn.execute("INSERT INTO agents (name) VALUES ('a')")
+    _send(conn, "b", "a")
+    conn.execute("UPDATE inbox_counters SET direct_unread = 9")
+    conn.execute("INSERT INTO inbox_counters (agent_name, from_agent, direct_unread) VALUES ('ghost', 'b', 3)")
+
+    mismatches = check(conn, repair=True)
+    assert {(m["agent_name"], m["stored"]["direct_unread"]) for m in mismatches} == {("a", 9), ("ghost", 3)}
+    assert check(conn) == []
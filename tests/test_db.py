@@ -0,0 +1,162 @@
+"""Tests for dead_drop.db — pooled SQLite connections for the room server."""
+
+import asyncio
+import threading
+import time
+
+from dead_drop.db import ConnectionPool, DBExecutor
+
+
+def _pool(tmp_path, **kwargs):
+    pool = ConnectionPool(str(tmp_path / "messages.db"), **kwargs)
+    with pool.writer() as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+        conn.commit()
+    return pool
+
+
+def test_connections_are_reused(tmp_path):
+    pool = _pool(tmp_path, readers=2)
+    for _ in range(10):
+        with pool.reader() as conn:
+            conn.execute("SELECT COUNT(*) FROM t").fetchone()
+        with pool.writer() as conn:
+            conn.execute("INSERT INTO t (v) VALUES ('x')")
+            conn.commit()
+    stats = pool.stats()
+    assert stats["connections_opened"] == 2  # one writer + one reader
+    assert stats["reader_checkouts"] == 10
+    assert stats["writer_checkouts"] == 11
+
+
+def test_uncommitted_write_is_rolled_back_on_release(tmp_path):
+    pool = _pool(tmp_path)
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO t (v) VALUES ('lost')")
+    with pool.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_readers_are_read_only(tmp_path):
+    pool = _pool(tmp_path)
+    with pool.reader() as conn:
+        try:
+            conn.execute("INSERT INTO t (v) VALUES ('nope')")
+        except Exception as e:
+            assert "readonly" in str(e)
+        else:
+            raise AssertionError("reader accepted a write")
+
+
+def test_waits_are_counted_when_pool_is_exhausted(tmp_path):
+    pool = _pool(tmp_path, readers=1)
+    held = threading.Event()
+
+    def hold():
+        with pool.reader():
+            held.set()
+            time.sleep(0.05)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    held.wait()
+    with pool.reader():
+        pass
+    t.join()
+    stats = pool.stats()
+    assert stats["reader_waits"] == 1
+    assert stats["reader_wait_ms"] > 0
+
+
+def test_executor_commits_writes_and_rolls_back_failures(tmp_path):
+    db = DBExecutor(_pool(tmp_path))
+
+    def insert(conn, v, fail=False):
+        conn.execute("INSERT INTO t (v) VALUES (?)", (v,))
+        if fail:
+            raise RuntimeError("boom")
+        return v
+
+    async def run():
+        assert await db.write(insert, "kept") == "kept"
+        try:
+            await db.write(insert, "lost", True)
+        except RuntimeError:
+            pass
+        return await db.read(lambda conn: [r[0] for r in conn.execute("SELECT v FROM t")])
+
+    assert asyncio.run(run()) == ["kept"]
+    db.shutdown()
+
+
+def test_executor_keeps_loop_responsive_while_write_lock_is_held(tmp_path):
+    pool = _pool(tmp_path)
+    db = DBExecutor(pool)
+    outside = ConnectionPool(pool.db_path)
+
+    async def run():
+        with outside.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            write = asyncio.ensure_future(db.write(lambda c: c.execute("INSERT INTO t (v) VALUES ('x')")))
+            started = time.perf_counter()
+            await asyncio.sleep(0.05)
+            ticked = time.perf_counter() - started
+            rows = await db.read(lambda c: c.execute("SELECT COUNT(*) FROM t").fetchone()[0])
+            conn.commit()
+        await write
+        return ticked, rows
+
+    ticked, rows = asyncio.run(run())
+    assert ticked < 0.5
+    assert rows == 0
+    db.shutdown()
+
+
+def test_group_commit_isolates_failing_writes(tmp_path):
+    db = DBExecutor(_pool(tmp_path), batch_window_ms=50, batch_max=16)
+
+    def insert(conn, v):
+        conn.execute("INSERT INTO t (v) VALUES (?)", (v,))
+        if v == "bad":
+            raise ValueError(v)
+        return v
+
+    async def run():
+        results = await asyncio.gather(
+            *(db.write(insert, v) for v in ("a", "bad", "b", "c")),
+            return_exceptions=True,
+        )
+        rows = await db.read(lambda conn: [r[0] for r in conn.execute("SELECT v FROM t ORDER BY id")])
+        return results, rows
+
+    results, rows = asyncio.run(run())
+    assert results[0] == "a" and results[2:] == ["b", "c"]
+    assert isinstance(results[1], ValueError)
+    assert rows == ["a", "b", "c"]
+    stats = db.stats()
+    assert stats["batches"] == 1
+    assert stats["writes"] == 4 and stats["write_errors"] == 1
+    db.shutdown()
+
+
+def test_batch_max_one_commits_each_write(tmp_path):
+    db = DBExecutor(_pool(tmp_path), batch_max=1)
+
+    async def run():
+        await asyncio.gather(*(db.write(lambda c: c.execute("INSERT INTO t (v) VALUES ('x')")) for _ in range(5)))
+
+    asyncio.run(run())
+    assert db.stats()["batches"] == 5
+    db.shutdown()
+
+
+def test_writer_release_hooks_run_after_commit_or_rollback(tmp_path):
+    pool = _pool(tmp_path)
+    seen = []
+    pool.on_writer_release(lambda: seen.append(pool.stats()["writer_checkouts"]))
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO t (v) VALUES ('x')")
+        conn.commit()
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO t (v) VALUES ('y')")  # rolled back on release
+    assert seen == [2, 3]
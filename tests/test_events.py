@@ -0,0 +1,92 @@
+"""Tests for the events log and the GET /agents/{name}/events SSE stream."""
+
+import asyncio
+import json
+
+from starlette.testclient import TestClient
+
+from conftest import FakeContext
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def _room(room):
+    ctx = FakeContext()
+    for name, role in (("lead", "lead"), ("a", "coder"), ("b", "coder")):
+        asyncio.run(room.register(name, ctx, role=role))
+    return ctx
+
+
+def _events(room, audience, after_id=0):
+    return asyncio.run(room._db.read(room._events_after, audience, after_id, 100))
+
+
+def _parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return int(fields["id"]), fields["event"], json.loads(fields["data"])
+
+
+def test_triggers_log_mail_tasks_and_handshakes(room):
+    ctx = _room(room)
+    asyncio.run(room.send("a", "b", "hello", ctx))
+    asyncio.run(room.create_task("lead", "ship it", ctx, assigned_to="a"))
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.update_task("a", "TASK-001", ctx, status="in_progress"))
+    asyncio.run(room.initiate_handshake("lead", "plan", ctx, agents="a"))
+
+    seen = [(kind, payload) for _, kind, payload in _events(room, ["a"])]
+    kinds = [kind for kind, _ in seen]
+    assert kinds.count("task") == 2 and kinds.count("handshake") == 1
+    assert ("task", {"task_id": "TASK-001", "status": "in_progress", "previous": "assigned",
+                     "title": "ship it", "assigned_to": "a"}) in seen
+    # a sees its own task notice and handshake plan, not b's mail.
+    assert [p["content"] for k, p in seen if k == "message" and p["to_agent"] == "a"][0].startswith("[TASK")
+    assert all(p.get("to_agent") != "b" for k, p in seen if k == "message")
+    assert any(k == "message" and p["content"] == "hello" for _, k, p in _events(room, ["b"]))
+
+
+def test_stream_resumes_after_last_event_id_then_follows_live(room):
+    ctx = _room(room)
+    asyncio.run(room.send("a", "b", "one", ctx))
+    asyncio.run(room.send("a", "b", "two", ctx))
+    first = _events(room, ["b"])[0][0]
+
+    async def scenario():
+        stream = room._event_stream(FakeRequest(), ["b"], first)
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        replayed = _parse(await stream.__anext__())
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        assert not pending.done()
+        await room.send("a", "b", "three", ctx)
+        live = _parse(await asyncio.wait_for(pending, 1))
+        await stream.aclose()
+        return replayed, live
+
+    replayed, live = asyncio.run(scenario())
+    assert replayed[1] == "message" and replayed[2]["content"] == "two"
+    assert live[2]["content"] == "three" and live[0] > replayed[0]
+    assert room._event_streams == set()
+
+
+def test_route_checks_the_room_token(room, monkeypatch):
+    monkeypatch.setattr(room, "ROOM_TOKEN", "s3cret")
+    client = TestClient(room.mcp.streamable_http_app())
+    assert client.get("/agents/b/events").status_code == 401
+    assert client.get("/agents/b/events?token=s3cret", headers={"Last-Event-ID": "nope"}).status_code == 400
+
+
+def test_the_log_trims_itself_to_the_replay_window(room):
+    def _tx(conn):
+        conn.executemany("INSERT INTO events (kind, ref, created_at) VALUES ('task', 'TASK-001', ?)",
+                         [("2000-01-01T00:00:00",)] * (room.EVENTS_TRIM_EVERY - 1))
+        old = conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+        conn.execute("INSERT INTO events (kind, ref, created_at) VALUES ('task', 'TASK-002', '2999-01-01T00:00:00')")
+        return old, [tuple(r) for r in conn.execute("SELECT ref FROM events")]
+
+    old, left = asyncio.run(room._db.write(_tx))
+    assert old == room.EVENTS_TRIM_EVERY - 1
+    assert left == [("TASK-002",)]
@@ -0,0 +1,86 @@
+"""Tests for get_history: id cursors in both directions and its filters."""
+
+import asyncio
+import json
+
+from conftest import FakeContext
+
+
+def _history(room, **kwargs):
+    return json.loads(asyncio.run(room.get_history(**kwargs)))
+
+
+def _room(room):
+    """lead, a and b; a and b trade twelve messages, every third on TASK-001."""
+    ctx = FakeContext()
+    for name, role in (("lead", "lead"), ("a", "coder"), ("b", "coder")):
+        asyncio.run(room.register(name, ctx, role=role))
+
+    def _tx(conn):
+        cursor = conn.cursor()
+        for i in range(12):
+            sender, to = ("a", "b") if i % 2 == 0 else ("b", "a")
+            room._insert_message(cursor, sender, [to], f"m{i}", at=f"2026-01-01T00:00:{i:02d}",
+                                 task_id="TASK-001" if i % 3 == 0 else None)
+        room._insert_message(cursor, "lead", ["all"], "standup", at="2026-01-01T00:01:00")
+    asyncio.run(room._db.write(_tx))
+
+
+def _contents(page):
+    return [m["content"] for m in page["messages"]]
+
+
+def test_pages_back_through_everything_once(room):
+    _room(room)
+    page = _history(room, count=5)
+    assert _contents(page) == ["m8", "m9", "m10", "m11", "standup"]
+    seen = _contents(page)
+    while page["has_more"]:
+        page = _history(room, count=5, before_id=page["next_before_id"])
+        seen = _contents(page) + seen
+    assert seen == [f"m{i}" for i in range(12)] + ["standup"]
+    assert page["next_before_id"] is None
+
+
+def test_pages_forward_from_a_cursor(room):
+    _room(room)
+    assert _contents(_history(room, count=1, after_id=0)) == ["standup"]  # after_id=0: no cursor
+    m0 = _history(room, count=20)["messages"][0]["id"]
+    page = _history(room, count=4, after_id=m0)
+    assert _contents(page) == ["m1", "m2", "m3", "m4"]
+    page = _history(room, count=20, after_id=page["next_after_id"])
+    assert _contents(page)[0] == "m5" and not page["has_more"]
+
+
+def test_agent_matches_either_side(room):
+    _room(room)
+    page = _history(room, count=20, agent="lead")
+    assert _contents(page) == ["standup"]
+    page = _history(room, count=3, agent="a")
+    assert _contents(page) == ["m9", "m10", "m11"]
+
+
+def test_task_and_time_filters(room):
+    _room(room)
+    assert _contents(_history(room, count=20, task_id="TASK-001")) == ["m0", "m3", "m6", "m9"]
+    page = _history(room, count=20, since="2026-01-01T00:00:05", until="2026-01-01T00:00:08")
+    assert _contents(page) == ["m5", "m6", "m7"]
+    assert _contents(_history(room, count=20, since="2026-01-01T00:00:30")) == ["standup"]
+    assert _history(room, count=20, since="2027-01-01")["messages"] == []
+
+
+def test_time_bounds_keep_bodies_stamped_out_of_order(room):
+    # A write queued later but committed first used to get the lower id with
+    # the later timestamp; since= then started past it. Stamping on the
+    # writer never lets a newer id carry an older timestamp.
+    ctx = FakeContext()
+    for name, role in (("lead", "lead"), ("a", "coder"), ("b", "coder")):
+        asyncio.run(room.register(name, ctx, role=role))
+    asyncio.run(room._db.write(lambda conn: room._insert_message(conn.cursor(), "a", ["b"], "early id", at="2999-01-01T00:00:00")))
+    asyncio.run(room.check_inbox("b", ctx))
+    asyncio.run(room.send("b", "lead", "late id", ctx))
+
+    page = _history(room, since="2026-01-01T00:00:00")
+    assert _contents(page) == ["early id", "late id"]
+    assert page["messages"][1]["timestamp"] >= "2999-01-01T00:00:00"
+    assert _contents(_history(room, until="2999-01-01T00:00:00")) == []
@@ -0,0 +1,106 @@
+"""Tests for check_inbox paging: bounded pages, cursors, and read marking."""
+
+import asyncio
+import json
+
+from conftest import FakeContext
+
+
+def _inbox(room, agent, ctx, **kwargs):
+    return json.loads(asyncio.run(room.check_inbox(agent, ctx, **kwargs)))
+
+
+def _setup(room, sends):
+    """Register lead, a and b; a sends b `sends` direct messages."""
+    ctx = {name: FakeContext() for name in ("lead", "a", "b")}
+    asyncio.run(room.register("lead", ctx["lead"], role="lead"))
+    asyncio.run(room.register("a", ctx["a"], role="coder"))
+    asyncio.run(room.register("b", ctx["b"], role="tester"))
+    for i in range(sends):
+        asyncio.run(room.send("a", "b", f"m{i}", ctx["a"]))
+    return ctx
+
+
+def _unread(room, agent):
+    return asyncio.run(room._get_unread_info(agent))[0]
+
+
+def test_pages_follow_the_cursor_until_exhausted(room):
+    ctx = _setup(room, 5)
+    seen = []
+    page = _inbox(room, "b", ctx["b"], limit=2)
+    while True:
+        seen += [m["content"] for m in page["messages"]]
+        assert len(page["messages"]) <= 2
+        if not page["has_more"]:
+            assert page["next_after_id"] is None
+            break
+        assert page["next_after_id"] == page["messages"][-1]["id"]
+        page = _inbox(room, "b", ctx["b"], limit=2, after_id=page["next_after_id"])
+    assert seen == [f"m{i}" for i in range(5)]
+    assert _unread(room, "b") == 0
+
+
+def test_only_the_returned_page_is_marked_read(room):
+    ctx = _setup(room, 5)
+    page = _inbox(room, "b", ctx["b"], limit=2)
+    assert [m["content"] for m in page["messages"]] == ["m0", "m1"]
+    assert _unread(room, "b") == 3
+    # Without a cursor the next call starts at the oldest message still unread.
+    page = _inbox(room, "b", ctx["b"], limit=2)
+    assert [m["content"] for m in page["messages"]] == ["m2", "m3"]
+
+
+def test_after_id_skips_without_marking_read(room):
+    ctx = _setup(room, 4)
+    with room._pool.reader() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM messages WHERE to_agent = 'b' ORDER BY id")]
+    _inbox(room, "b", ctx["b"], limit=1)
+    page = _inbox(room, "b", ctx["b"], limit=10, after_id=ids[1])
+    assert [m["content"] for m in page["messages"]] == ["m2", "m3"]
+    assert _inbox(room, "b", ctx["b"])["messages"][0]["content"] == "m1"
+
+
+def test_broadcast_watermark_advances_only_to_the_page(room):
+    ctx = _setup(room, 0)
+    for i in range(3):
+        asyncio.run(room.send("lead", "all", f"b{i}", ctx["lead"]))
+    page = _inbox(room, "a", ctx["a"], limit=2)
+    assert [m["content"] for m in page["messages"]] == ["b0", "b1"]
+    assert page["has_more"]
+    assert _unread(room, "a") == 1
+    page = _inbox(room, "a", ctx["a"], limit=2)
+    assert [m["content"] for m in page["messages"]] == ["b2"]
+    assert not page["has_more"]
+
+
+def test_after_id_never_skips_an_unread_broadcast(room):
+    ctx = _setup(room, 0)
+    asyncio.run(room.send("lead", "all", "standup", ctx["lead"]))
+    asyncio.run(room.send("lead", "b", "m0", ctx["lead"]))
+    asyncio.run(room.send("lead", "all", "retro", ctx["lead"]))
+    with room._pool.reader() as conn:
+        after = conn.execute("SELECT id FROM messages WHERE to_agent = 'b'").fetchone()[0]
+    page = _inbox(room, "b", ctx["b"], limit=10, after_id=after)
+    assert [m["content"] for m in page["messages"]] == ["standup", "retro"]
+    # The skipped direct message is still unread; nothing else is.
+    assert [m["content"] for m in _inbox(room, "b", ctx["b"])["messages"]] == ["m0"]
+
+
+def test_interleaved_mail_pages_one_at_a_time_in_id_order(room):
+    ctx = _setup(room, 0)
+    for i in range(3):
+        asyncio.run(room.send("lead", "all", f"b{i}", ctx["lead"]))
+        asyncio.run(room.send("lead", "b", f"d{i}", ctx["lead"]))
+    seen, ids, after = [], [], 0
+    while True:
+        page = _inbox(room, "b", ctx["b"], limit=1, after_id=after)
+        assert len(page["messages"]) <= 1
+        seen += [m["content"] for m in page["messages"]]
+        ids += [m["id"] for m in page["messages"]]
+        if not page["has_more"]:
+            break
+        after = page["next_after_id"]
+    assert seen == ["b0", "d0", "b1", "d1", "b2", "d2"]
+    assert ids == sorted(ids)
+    assert _unread(room, "b") == 0
@@ -0,0 +1,173 @@
+"""Tests for dead_drop.migrations — PRAGMA user_version schema upgrades."""
+
+import sqlite3
+
+from dead_drop.migrations import MIGRATIONS, SCHEMA_VERSION, migrate, schema_version
+
+
+def _connect(tmp_path):
+    return sqlite3.connect(str(tmp_path / "messages.db"))
+
+
+def _indexes(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+
+
+def test_fresh_database_reaches_current_version(tmp_path):
+    conn = _connect(tmp_path)
+    assert migrate(conn) == list(range(1, SCHEMA_VERSION + 1))
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert {"idx_deliveries_inbox", "idx_tasks_status"} <= _indexes(conn)
+
+
+def test_up_to_date_database_is_skipped(tmp_path):
+    conn = _connect(tmp_path)
+    migrate(conn)
+    assert migrate(_connect(tmp_path)) == []
+
+
+def test_unversioned_legacy_database_is_upgraded(tmp_path):
+    conn = _connect(tmp_path)
+    # A pre-versioning room: old messages columns, tasks without 'verified'.
+    conn.execute("CREATE TABLE agents (name TEXT PRIMARY KEY, registered_at TEXT, last_seen TEXT)")
+    conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, from_agent TEXT, to_agent TEXT, content TEXT, timestamp TEXT, read_flag INTEGER DEFAULT 0)")
+    conn.execute("""CREATE TABLE tasks (id TEXT PRIMARY KEY, project TEXT DEFAULT '', title TEXT NOT NULL,
+        description TEXT DEFAULT '', assigned_to TEXT, created_by TEXT NOT NULL,
+        status TEXT DEFAULT 'pending' CHECK(status IN ('pending','assigned','in_progress','review','completed','failed')),
+        result TEXT DEFAULT '', created_at TEXT NOT NULL, updated_at TEXT NOT NULL, completed_at TEXT)""")
+    conn.execute("INSERT INTO messages (from_agent, to_agent, content, timestamp) VALUES ('a', 'b', 'hi', 't')")
+    conn.execute("INSERT INTO tasks (id, title, created_by, created_at, updated_at) VALUES ('TASK-001', 'x', 'a', 't', 't')")
+    conn.commit()
+
+    migrate(conn)
+
+    assert schema_version(conn) == SCHEMA_VERSION
+    mcols = {r[1] for r in conn.execute("PRAGMA table_info(messages)")}
+    assert {"is_cc", "task_id", "reply_to"} <= mcols
+    conn.execute("UPDATE tasks SET status = 'verified' WHERE id = 'TASK-001'")
+    assert conn.execute("SELECT content FROM messages").fetchone()[0] == "hi"
+
+
+def test_broadcast_reads_become_watermarks(tmp_path):
+    conn = _connect(tmp_path)
+    for m in MIGRATIONS[:2]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 2")
+    for i in range(1, 6):
+        conn.execute("INSERT INTO messages (from_agent, to_agent, content) VALUES ('lead', 'all', ?)", (f"b{i}",))
+    # 'a' has read broadcasts 1-3, 'b' all five, 'c' none.
+    conn.executemany("INSERT INTO broadcast_reads VALUES (?, ?)",
+                     [("a", 1), ("a", 2), ("a", 3)] + [("b", i) for i in range(1, 6)])
+    conn.commit()
+
+    migrate(conn)
+
+    marks = dict(conn.execute("SELECT agent_name, last_read_id FROM broadcast_watermarks"))
+    assert marks == {"a": 3, "b": 5}
+    assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'broadcast_reads'").fetchone()
+
+
+def test_unread_lookup_uses_index(tmp_path):
+    conn = _connect(tmp_path)
+    migrate(conn)
+    plan = " ".join(r[3] for r in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT from_agent FROM messages WHERE to_agent = ? AND read_flag = 0", ("a",)))
+    assert "idx_deliveries_inbox" in plan
+
+
+def test_duplicate_rows_collapse_into_one_body(tmp_path):
+    conn = _connect(tmp_path)
+    for m in MIGRATIONS[:4]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 4")
+    rows = [
+        ("lead", "a", "go", "t1", 0, 0, None, "TASK-001"),
+        ("lead", "b", "go", "t1", 1, 0, None, "TASK-001"),
+        ("lead", "c", "go", "t1", 0, 1, "a", "TASK-001"),
+        ("lead", "a", "go", "t2", 0, 0, None, "TASK-001"),
+        ("a", "all", "hi", "t1", 0, 0, None, None),
+        ("a", "b", "bye", "t3", 0, 0, None, None),
+    ]
+    conn.executemany("""INSERT INTO messages (from_agent, to_agent, content, timestamp, read_flag, is_cc, cc_original_to, task_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+    conn.execute("DELETE FROM messages WHERE id = 6")
+    before = conn.execute("SELECT * FROM messages ORDER BY id").fetchall()
+    counters = conn.execute("SELECT * FROM inbox_counters ORDER BY 1, 2").fetchall()
+    conn.commit()
+
+    migrate(conn)
+
+    assert conn.execute("SELECT * FROM messages ORDER BY id").fetchall() == before
+    assert conn.execute("SELECT * FROM inbox_counters ORDER BY 1, 2").fetchall() == counters
+    assert conn.execute("SELECT COUNT(*) FROM message_bodies").fetchone()[0] == 3
+    senders = conn.execute("SELECT d.from_agent, m.from_agent FROM deliveries d JOIN messages m ON m.id = d.id").fetchall()
+    assert all(copy == sender for copy, sender in senders)
+    body_ids = dict(conn.execute("SELECT id, body_id FROM deliveries"))
+    assert body_ids == {1: 1, 2: 1, 3: 1, 4: 4, 5: 5}
+    # New messages continue after the deleted id 6, never reuse it.
+    conn.execute("INSERT INTO message_bodies (from_agent, content) VALUES ('a', 'next')")
+    new_id = conn.execute("INSERT INTO deliveries (body_id, to_agent) VALUES (last_insert_rowid(), 'b')").lastrowid
+    assert new_id == 7
+
+
+def test_roles_are_split_into_agent_roles(tmp_path):
+    conn = _connect(tmp_path)
+    for m in MIGRATIONS[:8]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 8")
+    conn.execute("INSERT INTO agents (name, role) VALUES ('old', 'lead, tester'), ('none', NULL)")
+    conn.commit()
+
+    migrate(conn)
+
+    def roles():
+        return sorted(conn.execute("SELECT agent, role FROM agent_roles"))
+    assert roles() == [("old", "lead"), ("old", "tester")]
+    conn.execute("INSERT INTO agents (name, role) VALUES ('new', 'coder')")
+    conn.execute("UPDATE agents SET role = 'reviewer' WHERE name = 'old'")
+    conn.execute("DELETE FROM agents WHERE name = 'new'")
+    assert roles() == [("old", "reviewer")]
+    plan = " ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN SELECT agent FROM agent_roles WHERE role = 'lead'"))
+    assert "idx_agent_roles_role" in plan
+
+
+def test_existing_tasks_start_the_task_event_log(tmp_path):
+    conn = _connect(tmp_path)
+    for m in MIGRATIONS[:12]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 12")
+    conn.execute("""INSERT INTO tasks (id, title, created_by, created_at, updated_at, status, project)
+                    VALUES ('TASK-001', 'x', 'a', '2026-01-01T00:00:00', '2026-01-02T00:00:00', 'in_progress', 'web')""")
+    conn.commit()
+
+    migrate(conn)
+
+    assert conn.execute("SELECT task_id, to_status, at FROM task_events").fetchall() == \
+        [("TASK-001", "in_progress", "2026-01-02T00:00:00")]
+    conn.execute("UPDATE tasks SET status = 'review' WHERE id = 'TASK-001'")
+    seconds = conn.execute("SELECT seconds_in_prev FROM task_events WHERE to_status = 'review'").fetchone()[0]
+    assert seconds > 86400
+    assert conn.execute("SELECT entered, exited FROM task_rollups WHERE dim = 'project' AND key = 'web' AND state = 'in_progress'").fetchone() == (1, 1)
+
+
+def test_rollups_count_each_task_once_per_state(tmp_path):
+    conn = _connect(tmp_path)
+    for m in MIGRATIONS[:14]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 14")
+    conn.execute("""INSERT INTO tasks (id, title, created_by, created_at, updated_at, status, project)
+                    VALUES ('TASK-001', 'x', 'a', '2026-01-01T00:00:00', '2026-01-01T00:00:00', 'in_progress', 'web')""")
+    for status in ("completed", "in_progress", "completed"):
+        conn.execute("UPDATE tasks SET status = ? WHERE id = 'TASK-001'", (status,))
+    conn.commit()
+
+    migrate(conn)
+
+    def completed(dim, key):
+        return conn.execute("SELECT entered, tasks FROM task_rollups WHERE dim = ? AND key = ? AND state = 'completed'",
+                            (dim, key)).fetchone()
+
+    assert completed("all", "") == (2, 1) and completed("project", "web") == (2, 1)
+    conn.execute("UPDATE tasks SET status = 'in_progress', project = 'api' WHERE id = 'TASK-001'")
+    conn.execute("UPDATE tasks SET status = 'completed' WHERE id = 'TASK-001'")
+    assert completed("all", "") == (3, 1) and completed("project", "api") == (1, 1)
@@ -0,0 +1,37 @@
+"""Tests for short-name resolution in send: the agent_names index and _name_cache."""
+
+import asyncio
+
+from conftest import FakeContext
+
+
+def _send(room, to_agent, ctx):
+    return asyncio.run(room.send("lead", to_agent, "hi", ctx))
+
+
+def test_short_names_resolve_to_the_one_team_agent(room):
+    ctx = FakeContext()
+    for name in ("lead", "red/scout", "red/medic", "blue/medic", "medic2"):
+        asyncio.run(room.register(name, ctx, role="coder"))
+
+    assert _send(room, "scout", ctx).startswith("Message sent from 'lead' to 'red/scout'")
+    assert _send(room, "medic", ctx).startswith("AMBIGUOUS: Multiple agents named 'medic' across teams: blue/medic, red/medic.")
+
+    asyncio.run(room.deregister("blue/medic"))
+    assert _send(room, "medic", ctx).startswith("Message sent from 'lead' to 'red/medic'")
+    asyncio.run(room.register("medic", ctx, role="coder"))
+    assert _send(room, "medic", ctx).startswith("Message sent from 'lead' to 'medic'")
+
+
+def test_resolution_is_served_from_the_cache(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="coder"))
+    asyncio.run(room.register("red/scout", ctx, role="coder"))
+    _send(room, "scout", ctx)
+    before = room._name_cache.stats()
+    _send(room, "scout", ctx)
+    after = room._name_cache.stats()
+    assert after["hits"] == before["hits"] + 1 and after["misses"] == before["misses"]
+
+    asyncio.run(room.register("blue/scout", ctx, role="coder"))
+    assert _send(room, "scout", ctx).startswith("AMBIGUOUS")
@@ -0,0 +1,80 @@
+"""Tests for dead_drop.presence: write-behind last_seen / heartbeat_at / status."""
+
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from conftest import FakeContext
+from dead_drop.presence import PresenceBuffer
+
+
+def _row(room, name):
+    return asyncio.run(room._db.read(
+        lambda conn: dict(conn.execute("SELECT * FROM agents WHERE name = ?", (name,)).fetchone())))
+
+
+def _who(room):
+    return {a["name"]: a for a in json.loads(asyncio.run(room.who()))}
+
+
+def test_presence_is_read_at_once_and_written_on_flush(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("a", ctx, role="coder"))
+    writes = room._pool.stats()["writer_checkouts"]
+    asyncio.run(room.ping("a", ctx))
+    asyncio.run(room.set_status("a", "working on TASK-001"))
+
+    assert _row(room, "a")["heartbeat_at"] is None
+    assert _who(room)["a"]["status"] == "working on TASK-001"
+    assert _who(room)["a"]["health"] == "healthy"
+    assert room._pool.stats()["writer_checkouts"] == writes
+
+    assert room._presence_flusher.flush_once() == 1
+    row = _row(room, "a")
+    assert row["status"] == "working on TASK-001" and row["heartbeat_at"]
+    assert len(room._presence) == 0
+
+
+def test_register_supersedes_a_pending_status(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.set_status("a", "busy"))
+    asyncio.run(room.register("a", ctx))
+    room._presence_flusher.stop()
+    assert _row(room, "a")["status"] == "waiting for work"
+
+
+def test_dead_agent_warning_reads_buffered_heartbeats(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.create_task("lead", "ship it", ctx, assigned_to="a"))
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.update_task("a", "TASK-001", ctx, status="in_progress"))
+    asyncio.run(room._db.write(lambda conn: conn.execute(
+        "UPDATE agents SET heartbeat_at = '2020-01-01T00:00:00' WHERE name = 'a'")))
+
+    def _warning():
+        return json.loads(asyncio.run(room.list_tasks(status="in_progress")))["tasks"][0].get("warning")
+
+    assert _warning() == "assigned agent appears dead"
+    asyncio.run(room.ping("a", ctx))
+    assert _warning() is None
+
+
+def test_failed_flush_keeps_newer_values():
+    buffer = PresenceBuffer()
+    buffer.update("a", status="old", last_seen="t1")
+
+    class Broken:
+        def executemany(self, *args):
+            buffer.update("a", status="new")  # arrives while the flush is in flight
+            raise sqlite3.OperationalError("database is locked")
+
+    with pytest.raises(sqlite3.OperationalError):
+        buffer.flush(Broken())
+    assert buffer.get("a") == {"status": "new", "last_seen": "t1"}
+    with pytest.raises(ValueError):
+        buffer.update("a", role="lead")
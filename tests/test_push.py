@@ -0,0 +1,139 @@
+"""Tests for the concurrent, deadline-bounded push fan-out in _notify_agents."""
+
+import asyncio
+import json
+
+from conftest import FakeContext, FakeSession
+
+
+class HungSession(FakeSession):
+    """A client that never takes the push off the wire."""
+
+    async def send_tool_list_changed(self):
+        await asyncio.sleep(60)
+
+
+def _room(room, monkeypatch, names):
+    monkeypatch.setattr(room, "_push_stats", dict.fromkeys(room._push_stats, 0))
+    contexts = {name: FakeContext() for name in names}
+    for name, ctx in contexts.items():
+        asyncio.run(room.register(name, ctx, role="coder"))
+    return contexts
+
+
+def test_a_hung_session_does_not_hold_up_the_others(room, monkeypatch):
+    monkeypatch.setattr(room, "PUSH_TIMEOUT", 0.2)
+    contexts = _room(room, monkeypatch, ["a", "b", "c", "d"])
+    contexts["b"].session = room._agent_sessions["b"] = HungSession()
+    asyncio.run(room.check_inbox("a", contexts["a"]))
+
+    asyncio.run(room.send("a", "all", "standup", contexts["a"]))
+
+    assert "tools/list_changed" in contexts["c"].session.pushes
+    assert "tools/list_changed" in contexts["d"].session.pushes
+    stats = json.loads(asyncio.run(room.server_stats()))["push"]
+    assert stats["fanouts"] == 1 and stats["recipients"] == 3
+    assert stats["sent"] == 2 and stats["timed_out"] == 1
+    assert 150 <= stats["fanout_ms_last"] < 1000
+    # A slow push is skipped, not treated as a dead session.
+    assert "b" in room._agent_sessions
+
+
+def test_pushes_run_concurrently_within_the_limit(room, monkeypatch):
+    monkeypatch.setattr(room, "PUSH_CONCURRENCY", 2)
+    _room(room, monkeypatch, ["a", "b", "c", "d"])
+    in_flight = []
+
+    class SlowSession(FakeSession):
+        async def send_tool_list_changed(self):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.pop()
+
+    peak = []
+    for name in ("b", "c", "d"):
+        room._agent_sessions[name] = SlowSession()
+
+    asyncio.run(room._notify_agents(["b", "c", "d", "b"]))
+
+    assert max(peak) == 2
+    assert room._push_stats["recipients"] == 3 and room._push_stats["sent"] == 3
+
+
+def _coalescing(room, monkeypatch):
+    monkeypatch.setattr(room, "PUSH_COALESCE_MS", 50)
+    monkeypatch.setattr(room, "_pending_pushes", set())
+    return _room(room, monkeypatch, ["a", "b", "c", "d"])
+
+
+def test_notifications_inside_the_window_merge_into_one_push(room, monkeypatch):
+    contexts = _coalescing(room, monkeypatch)
+
+    async def scenario():
+        for sender in ("a", "c", "d"):
+            await room.send(sender, "b", f"from {sender}", contexts[sender])
+        before = list(contexts["b"].session.pushes)
+        await asyncio.sleep(0.1)
+        return before
+
+    assert asyncio.run(scenario()) == []
+    pushes = contexts["b"].session.pushes
+    assert pushes.count("tools/list_changed") == 1 and len(pushes) == 2
+    assert pushes[1].startswith("YOU HAVE 3 UNREAD MESSAGE(S) from ")
+    assert all(sender in pushes[1] for sender in ("a", "c", "d"))
+    assert room._push_stats["coalesced"] == 2 and room._push_stats["fanouts"] == 1
+
+
+def test_waiters_do_not_wait_for_the_window(room, monkeypatch):
+    contexts = _coalescing(room, monkeypatch)
+
+    async def scenario():
+        waiter = asyncio.create_task(room.wait_for_messages("b", contexts["b"], timeout=5))
+        await asyncio.sleep(0.01)
+        await room.send("a", "b", "now", contexts["a"])
+        woken = await asyncio.wait_for(waiter, 0.04)
+        await asyncio.sleep(0.1)
+        return woken
+
+    assert [m["content"] for m in json.loads(asyncio.run(scenario()))["messages"]] == ["now"]
+    assert contexts["b"].session.pushes[0] == "tools/list_changed"
+
+
+def test_tool_list_is_shared_and_only_check_inbox_is_annotated(room, monkeypatch):
+    contexts = _room(room, monkeypatch, ["a", "b"])
+    monkeypatch.setattr(room, "_tool_list", None)
+    plain = asyncio.run(room._custom_list_tools())
+    assert asyncio.run(room._custom_list_tools()) is plain
+
+    asyncio.run(room.send("a", "b", "ping", contexts["a"]))
+    monkeypatch.setattr(room, "_calling_agent", lambda: "b")
+    reads = []
+    monkeypatch.setattr(room._db, "read", lambda *args: reads.append(args))
+    tools = asyncio.run(room._custom_list_tools())
+
+    assert reads == []  # the push warmed the unread cache
+    inbox = next(t for t in tools if t.name == "check_inbox")
+    assert inbox.description.startswith("*** YOU HAVE 1 UNREAD MESSAGE(S) from a ***")
+    assert "UNREAD" not in next(t for t in plain if t.name == "check_inbox").description
+    assert all(t is p for t, p in zip(tools, plain) if t.name != "check_inbox")
+
+
+def test_flush_tasks_are_held_until_done_and_failures_logged(room, monkeypatch, caplog):
+    _coalescing(room, monkeypatch)
+    monkeypatch.setattr(room, "_push_flushes", set())
+
+    async def boom(names):
+        raise RuntimeError("fan-out broke")
+
+    monkeypatch.setattr(room, "_fan_out", boom)
+
+    async def scenario():
+        await room._notify_agents(["b"])
+        held = len(room._push_flushes)
+        await asyncio.sleep(0.1)
+        return held
+
+    assert asyncio.run(scenario()) == 1
+    assert room._push_flushes == set()
+    assert "fan-out broke" in caplog.text
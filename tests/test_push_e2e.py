@@ -134,7 +134,7 @@ async def run_test():
     # ── Client B checks inbox ──
     print("[9] Client B checking inbox...")
     inbox = await call_tool(session_b, "check_inbox", {"agent_name": AGENT_B})
-    messages = json.loads(inbox)
+    messages = json.loads(inbox)["messages"]
     found_test_msg = any(TEST_MESSAGE in m.get("content", "") for m in messages)
     check("Test message received in inbox", found_test_msg,
           f"got {len(messages)} message(s)")
@@ -0,0 +1,132 @@
+"""Tests for dead_drop.retention: the cold tier, handshake pruning and incremental vacuum."""
+
+import asyncio
+import json
+
+import pytest
+
+from conftest import FakeContext
+from dead_drop import retention
+from dead_drop.db import ConnectionPool, DBExecutor
+
+OLD = "2020-01-01T00:00:00"
+
+
+@pytest.fixture
+def cold_room(room, tmp_path, monkeypatch):
+    """The room fixture, reopened with a cold tier attached."""
+    room._pool.close()
+    pool = ConnectionPool(str(tmp_path / "messages.db"), readers=2,
+                          attach={retention.COLD: str(tmp_path / "messages.cold.db")})
+    monkeypatch.setattr(room, "_pool", pool)
+    monkeypatch.setattr(room, "_db", DBExecutor(pool, inline=True))
+    room.init_db()
+    yield room
+    pool.close()
+
+
+def _write(room, fn):
+    return asyncio.run(room._db.write(fn))
+
+
+def _old_mail(room):
+    """a, b and c; three old messages to b (two read, one not) and an old broadcast."""
+    ctx = FakeContext()
+    for name in ("a", "b", "c"):
+        asyncio.run(room.register(name, ctx, role="coder"))
+
+    def _tx(conn):
+        cursor = conn.cursor()
+        ids = [room._insert_message(cursor, "a", ["b"], f"old note {i}", at=f"2020-01-01T00:00:0{i}")[0] for i in range(3)]
+        ids += room._insert_message(cursor, "a", ["all"], "old broadcast", at="2020-01-01T00:00:05")
+        conn.execute("UPDATE deliveries SET read_flag = 1 WHERE id IN (?, ?)", ids[:2])
+        return ids
+    return _write(room, _tx)
+
+
+def _run(room):
+    return retention.run(room._pool.writer, days=30)
+
+
+def _tier_ids(room, tier):
+    return asyncio.run(room._db.read(
+        lambda conn: [row[0] for row in conn.execute(f"SELECT id FROM {tier}.deliveries ORDER BY id")]))
+
+
+def _history(room, **kwargs):
+    return json.loads(asyncio.run(room.get_history(**kwargs)))
+
+
+def test_moves_only_old_mail_everyone_has_read(cold_room):
+    ids = _old_mail(cold_room)
+    asyncio.run(cold_room.send("a", "b", "fresh", FakeContext()))
+    done = _run(cold_room)
+
+    assert done["messages_moved"] == 2
+    assert _tier_ids(cold_room, "cold") == ids[:2]
+    # The unread note, the broadcast b and c haven't read, and new mail stay hot.
+    assert ids[2:] == _tier_ids(cold_room, "main")[:2]
+
+    asyncio.run(cold_room.check_inbox("b", FakeContext()))
+    asyncio.run(cold_room.check_inbox("c", FakeContext()))
+    _run(cold_room)
+    assert _tier_ids(cold_room, "cold") == ids
+    assert json.loads(asyncio.run(cold_room.check_inbox("b", FakeContext())))["messages"] == []
+
+
+def test_history_and_search_read_both_tiers(cold_room):
+    ids = _old_mail(cold_room)
+    asyncio.run(cold_room.check_inbox("b", FakeContext()))
+    asyncio.run(cold_room.send("b", "a", "fresh reply", FakeContext(), reply_to=ids[0]))
+    assert _run(cold_room)["messages_moved"] == 3
+
+    page = _history(cold_room, count=3, agent="b")
+    assert [m["content"] for m in page["messages"]] == ["old note 1", "old note 2", "fresh reply"]
+    page = _history(cold_room, count=5, before_id=page["next_before_id"], agent="b")
+    assert [m["content"] for m in page["messages"]] == ["old note 0"] and not page["has_more"]
+    assert [m["content"] for m in _history(cold_room, count=5, until="2020-01-01T00:00:01")["messages"]] == ["old note 0"]
+
+    hits = json.loads(asyncio.run(cold_room.search("note", kinds="messages")))["results"]
+    assert sorted(h["id"] for h in hits) == ids[:3]
+
+
+def test_a_batch_caught_between_copy_and_delete_is_seen_once(cold_room):
+    ids = _old_mail(cold_room)
+
+    def _copy_only(conn):
+        conn.execute("INSERT INTO cold.message_bodies SELECT * FROM main.message_bodies WHERE id = 1")
+        conn.execute("INSERT INTO cold.deliveries (id, body_id, to_agent, read_flag, is_cc, cc_original_to, from_agent) "
+                      "SELECT id, body_id, to_agent, read_flag, is_cc, cc_original_to, from_agent FROM main.deliveries WHERE body_id = 1")
+    _write(cold_room, _copy_only)
+
+    assert [m["id"] for m in _history(cold_room, count=10)["messages"]].count(ids[0]) == 1
+    assert len(json.loads(asyncio.run(cold_room.search("note 0", kinds="messages")))["results"]) == 1
+    _run(cold_room)
+    assert ids[0] not in _tier_ids(cold_room, "main")
+    assert ids[0] in _tier_ids(cold_room, "cold")
+
+
+def test_prunes_old_handshakes_and_reclaims_space(cold_room):
+    ctx = FakeContext()
+    asyncio.run(cold_room.register("lead", ctx, role="lead"))
+    asyncio.run(cold_room.register("a", ctx, role="coder"))
+    asyncio.run(cold_room.initiate_handshake("lead", "plan", ctx))
+    asyncio.run(cold_room.check_inbox("a", ctx))
+
+    def _backdate(conn):
+        conn.execute("UPDATE handshakes SET created_at = ?", (OLD,))
+        cursor = conn.cursor()
+        for i in range(300):
+            room_ids = cold_room._insert_message(cursor, "lead", ["a"], "x" * 2000, at=OLD)
+            conn.execute("UPDATE deliveries SET read_flag = 1 WHERE id = ?", room_ids)
+    _write(cold_room, _backdate)
+
+    worker = retention.RetentionWorker(cold_room._pool, days=30)
+    done = worker.run_once()
+    assert done["handshakes_pruned"] == 1
+    assert done["bytes_reclaimed"] > 300 * 2000 // 2
+    stats = worker.stats()
+    assert stats["bytes_reclaimed"] == done["bytes_reclaimed"] and stats["errors"] == 0
+    server_stats = json.loads(asyncio.run(cold_room.server_stats()))
+    assert server_stats["retention"]["space"]["main"]["free_bytes"] == 0
+    assert asyncio.run(cold_room.handshake_status(1)) == "Handshake #1 not found."
@@ -0,0 +1,43 @@
+"""Tests for the agent_roles-backed lead set and role lookups."""
+
+import asyncio
+import json
+
+from conftest import FakeContext
+
+
+def test_lead_set_follows_register_and_deregister(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("boss", ctx, role="lead,reviewer"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.register("deputy", ctx, role="lead"))
+    assert room._get_leads() == ["boss", "deputy"]
+
+    asyncio.run(room.register("deputy", ctx, role="tester"))
+    asyncio.run(room.register("boss", ctx))  # no role given: keeps lead
+    assert room._get_leads() == ["boss"]
+
+    asyncio.run(room.deregister("boss"))
+    assert room._get_leads() == []
+    assert "Only a lead" not in asyncio.run(room.create_task("a", "x", ctx))
+
+
+def test_lead_set_is_loaded_at_startup(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("boss", ctx, role="lead"))
+    room._leads = ()
+    room.init_db()
+    assert room._get_leads() == ["boss"]
+
+
+def test_who_filters_by_role(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("t1", ctx, role="tester,coder"))
+    asyncio.run(room.register("c1", ctx, role="coder"))
+    names = [a["name"] for a in json.loads(asyncio.run(room.who(role="tester")))]
+    assert names == ["t1"]
+
+    asyncio.run(room.register("boss", ctx, role="lead"))
+    asyncio.run(room.create_task("boss", "x", ctx, assigned_to="c1"))
+    assert asyncio.run(room.assign_role_hat("boss", "TASK-001", "tester")) == \
+        "Role 'tester' is not in c1's registered roles: coder"
@@ -0,0 +1,84 @@
+"""Tests for the search tool and the trigger-maintained FTS5 indexes behind it."""
+
+import asyncio
+import json
+import sqlite3
+
+from conftest import FakeContext
+from dead_drop.migrations import MIGRATIONS, migrate
+
+
+def _search(room, query, **kwargs):
+    return json.loads(asyncio.run(room.search(query, **kwargs)))["results"]
+
+
+def _hits(results):
+    return [(r["kind"], r["id"]) for r in results]
+
+
+def _room(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.create_task("lead", "Migrate auth to OAuth", ctx, description="Use the PKCE flow",
+                                 assigned_to="a", project="web"))
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.send("a", "lead", "Decided on PKCE for TASK-001, see the spec", ctx, task_id="TASK-001"))
+    asyncio.run(room.declare_contract("a", "auth_token", "function", "def auth_token(user) -> str", ctx, project="web"))
+    return ctx
+
+
+def test_search_spans_messages_tasks_and_contracts(room):
+    _room(room)
+    results = _search(room, "pkce")
+    assert {r["kind"] for r in results} == {"message", "task"}
+    assert all("**" in r["snippet"] for r in results)
+    assert _hits(_search(room, "auth_token")) == [("contract", 1)]
+
+
+def test_filters_narrow_each_kind(room):
+    _room(room)
+    assert _hits(_search(room, "pkce", kinds="tasks")) == [("task", "TASK-001")]
+    sent = _search(room, "pkce", kinds="messages", agent="a")
+    assert len(sent) == 2  # the task notice a received and the reply a sent
+    assert _search(room, "pkce", kinds="messages", since="2999-01-01") == []
+    assert _search(room, "auth", project="other") == []
+    assert {r["kind"] for r in _search(room, "auth", task_id="TASK-001")} == {"message", "task"}
+
+
+def test_punctuation_falls_back_to_literal_words(room):
+    _room(room)
+    results = _search(room, "TASK-001", kinds="messages")
+    assert results and all("TASK-001" in r["snippet"] for r in results)
+    assert asyncio.run(room.search("x", kinds="bogus")).startswith("Invalid kinds")
+
+
+def test_triggers_follow_updates_and_deletes(room):
+    ctx = _room(room)
+    asyncio.run(room.declare_contract("a", "auth_token", "function", "def auth_token(user, scope) -> str", ctx, project="web"))
+    assert _hits(_search(room, "scope", kinds="contracts")) == [("contract", 1)]
+    assert len(_search(room, "user", kinds="contracts")) == 1  # the old spec was replaced, not duplicated
+    asyncio.run(room.update_task("a", "TASK-001", ctx, status="in_progress"))
+    asyncio.run(room.submit_for_review("a", "TASK-001", "rotated refresh tokens", ctx))
+    assert ("task", "TASK-001") in _hits(_search(room, "refresh", kinds="tasks"))
+
+    def _delete_messages(conn):
+        conn.execute("DELETE FROM deliveries")
+        conn.execute("DELETE FROM message_bodies")
+    asyncio.run(room._db.write(_delete_messages))
+    assert _search(room, "pkce", kinds="messages") == []
+
+
+def test_migration_indexes_existing_rows(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "messages.db"))
+    for m in MIGRATIONS[:6]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 6")
+    conn.execute("INSERT INTO message_bodies (id, from_agent, content, timestamp) VALUES (1, 'a', 'legacy decision about caching', 't')")
+    conn.execute("INSERT INTO tasks (id, title, created_by, created_at, updated_at) VALUES ('TASK-001', 'caching layer', 'a', 't', 't')")
+    conn.commit()
+
+    migrate(conn)
+
+    assert conn.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'caching'").fetchall() == [(1,)]
+    assert conn.execute("SELECT task_id FROM tasks_fts WHERE tasks_fts MATCH 'caching'").fetchall() == [("TASK-001",)]
@@ -0,0 +1,47 @@
+"""Tests for sequence-backed TASK / GOAL ids (migrations v11)."""
+
+import asyncio
+import sqlite3
+
+from conftest import FakeContext
+from dead_drop.migrations import MIGRATIONS, migrate
+
+
+def _write(room, fn):
+    return asyncio.run(room._db.write(fn))
+
+
+def test_ids_count_up_and_bulk_reservations_are_contiguous(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    assert "TASK-001 created" in asyncio.run(room.create_task("lead", "one", ctx))
+    block = _write(room, lambda conn: room._reserve_ids(conn.cursor(), "task", 5))
+    assert block == range(2, 7)
+    assert "TASK-007 created" in asyncio.run(room.create_task("lead", "two", ctx))
+    assert "GOAL-001" in asyncio.run(room.create_goal("lead", "ship v1", ctx))
+
+
+def test_a_rolled_back_insert_gives_its_id_back(room):
+    def _fail(conn):
+        room._next_task_id(conn.cursor())
+        raise RuntimeError("boom")
+
+    try:
+        _write(room, _fail)
+    except RuntimeError:
+        pass
+    assert _write(room, lambda conn: room._next_task_id(conn.cursor())) == "TASK-001"
+
+
+def test_migration_seeds_from_the_highest_numeric_id(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "messages.db"))
+    for m in MIGRATIONS[:10]:
+        m(conn.cursor())
+    conn.execute("PRAGMA user_version = 10")
+    for task_id in ("TASK-999", "TASK-1000", "TASK-042"):
+        conn.execute("INSERT INTO tasks (id, title, created_by, created_at, updated_at) VALUES (?, 'x', 'a', 't', 't')", (task_id,))
+    conn.commit()
+
+    migrate(conn)
+
+    assert dict(conn.execute("SELECT name, value FROM sequences")) == {"task": 1000, "goal": 0}
@@ -0,0 +1,69 @@
+"""Tests for push-session liveness: close hooks, the eviction sweep and who()'s connected flag."""
+
+import asyncio
+import json
+from contextlib import AsyncExitStack
+
+import anyio
+
+from conftest import FakeContext, FakeSession
+
+
+class TransportSession(FakeSession):
+    """A FakeSession with the exit stack and write stream of a real ServerSession."""
+
+    def __init__(self):
+        super().__init__()
+        self._exit_stack = AsyncExitStack()
+        self._write_stream, self.transport = anyio.create_memory_object_stream(10)
+
+
+def _connected(room):
+    return {a["name"]: a["connected"] for a in json.loads(asyncio.run(room.who()))}
+
+
+def _register(room, name, session):
+    ctx = FakeContext()
+    ctx.session = session
+    asyncio.run(room.register(name, ctx, role="coder"))
+    return ctx
+
+
+def test_closing_the_session_unregisters_the_agent(room):
+    session = TransportSession()
+    _register(room, "a", session)
+    assert _connected(room) == {"a": True}
+
+    asyncio.run(session._exit_stack.aclose())
+
+    assert room._agent_sessions == {} and room._session_to_agent == {}
+    assert _connected(room) == {"a": False}
+
+
+def test_sweep_evicts_dead_transports_and_idle_sessions(room, monkeypatch):
+    dead, idle, live = TransportSession(), TransportSession(), TransportSession()
+    for name, session in (("dead", dead), ("idle", idle), ("live", live)):
+        _register(room, name, session)
+    dead.transport.close()
+    assert _connected(room) == {"dead": False, "idle": True, "live": True}
+
+    monkeypatch.setattr(room, "SESSION_IDLE", 60)
+    room._session_seen["idle"] -= 120
+    before = dict(room._session_stats)
+    asyncio.run(room._sweep_sessions(force=True))
+
+    assert list(room._agent_sessions) == ["live"]
+    assert room._session_stats["evicted_dead"] == before["evicted_dead"] + 1
+    assert room._session_stats["evicted_idle"] == before["evicted_idle"] + 1
+
+
+def test_a_reconnect_replaces_the_old_session(room):
+    old_ctx = _register(room, "a", TransportSession())
+    new_ctx = _register(room, "b", TransportSession())
+    new_ctx.session = TransportSession()
+    asyncio.run(room.check_inbox("b", new_ctx))
+    assert room._agent_sessions["b"] is new_ctx.session
+    assert room._agent_sessions["a"] is old_ctx.session
+
+    asyncio.run(room.send("a", "b", "hi", old_ctx))
+    assert "tools/list_changed" in new_ctx.session.pushes
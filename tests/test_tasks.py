@@ -0,0 +1,158 @@
+"""Tests for list_tasks: keyset pages, filters and the dead-assignee warning."""
+
+import asyncio
+import json
+
+from conftest import FakeContext
+
+
+def _list(room, **kwargs):
+    return json.loads(asyncio.run(room.list_tasks(**kwargs)))
+
+
+def _board(room, n=7):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    for i in range(n):
+        asyncio.run(room.create_task("lead", f"task {i}", ctx, project="web", assigned_to="a" if i % 2 else ""))
+    return ctx
+
+
+def test_pages_follow_the_cursor_in_creation_order(room):
+    _board(room)
+    seen, after = [], ""
+    while True:
+        page = _list(room, project="web", limit=3, after_id=after)
+        seen += [t["id"] for t in page["tasks"]]
+        if not page["has_more"]:
+            assert page["next_after_id"] is None
+            break
+        after = page["next_after_id"]
+    assert seen == [f"TASK-{i:03d}" for i in range(1, 8)]
+    assert [t["id"] for t in _list(room, assigned_to="a")["tasks"]] == ["TASK-002", "TASK-004", "TASK-006"]
+    assert asyncio.run(room.list_tasks(after_id="TASK-999")).startswith("Task TASK-999 not found")
+
+
+def test_dead_assignee_warning_comes_from_the_join(room):
+    ctx = _board(room, 2)
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.update_task("a", "TASK-002", ctx, status="in_progress"))
+    asyncio.run(room._db.write(lambda conn: conn.execute(
+        "UPDATE agents SET heartbeat_at = '2020-01-01T00:00:00' WHERE name = 'a'")))
+
+    tasks = {t["id"]: t for t in _list(room)["tasks"]}
+    assert tasks["TASK-002"]["warning"] == "assigned agent appears dead"
+    assert "warning" not in tasks["TASK-001"] and "assignee_heartbeat_at" not in tasks["TASK-002"]
+
+
+def test_every_filter_pages_from_an_index(room):
+    def plan(where, params):
+        return " ".join(r[3] for r in asyncio.run(room._db.read(lambda conn: conn.execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM tasks t WHERE {where} AND (t.created_at, t.id) > (?, ?) "
+            "ORDER BY t.created_at, t.id LIMIT 10", params + ["", ""]).fetchall())))
+
+    for where, params in (("t.status = ?", ["pending"]), ("t.status != 'completed'", []),
+                          ("t.project = ?", ["web"]), ("t.assigned_to = ?", ["a"])):
+        assert "USING INDEX" in plan(where, params) and "TEMP B-TREE" not in plan(where, params)
+
+
+def _metrics(room, **kwargs):
+    return json.loads(asyncio.run(room.task_metrics(**kwargs)))
+
+
+def test_transitions_are_logged_and_rolled_up(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.create_task("lead", "ship it", ctx, project="web", assigned_to="a", role_hat="coder"))
+    asyncio.run(room.create_task("lead", "other", ctx, project="api"))
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.update_task("a", "TASK-001", ctx, status="in_progress"))
+    asyncio.run(room.submit_for_review("a", "TASK-001", "done", ctx))
+    asyncio.run(room.check_inbox("lead", ctx))
+    asyncio.run(room.reject_task("lead", "TASK-001", "needs tests", ctx))
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.submit_for_review("a", "TASK-001", "tests added", ctx))
+    asyncio.run(room.check_inbox("lead", ctx))
+    asyncio.run(room.approve_task("lead", "TASK-001", ctx))
+
+    log = asyncio.run(room._db.read(lambda conn: [tuple(r) for r in conn.execute(
+        "SELECT from_status, to_status FROM task_events WHERE task_id = 'TASK-001' ORDER BY id")]))
+    assert log == [(None, "assigned"), ("assigned", "in_progress"), ("in_progress", "review"),
+                   ("review", "in_progress"), ("in_progress", "review"), ("review", "completed")]
+
+    web = _metrics(room, project="web")
+    assert web["throughput"] == {"completed": 1, "verified": 0}
+    assert web["rework"] == 1
+    assert web["states"]["in_progress"]["entered"] == 2 and web["states"]["review"]["exited"] == 2
+    assert web["states"]["review"]["p50_s"] is not None and web["cycle_time"]["count"] == 1
+    # The rollup answer matches one computed from the log itself.
+    from_log = _metrics(room, project="web", agent="a")
+    assert from_log["states"].keys() == web["states"].keys()
+    assert all(from_log["states"][s][k] == web["states"][s][k]
+               for s in web["states"] for k in ("entered", "exited", "rework"))
+    assert _metrics(room)["states"]["pending"]["entered"] == 1
+    assert _metrics(room, since="2999-01-01")["states"] == {}
+
+
+def test_cycle_time_counts_a_recompleted_task_once(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.register("v", ctx, role="verifier"))
+    asyncio.run(room.create_task("lead", "ship it", ctx, project="web", assigned_to="a"))
+    asyncio.run(room.update_task("a", "TASK-001", ctx, status="in_progress"))
+    asyncio.run(room.submit_for_review("a", "TASK-001", "done", ctx))
+    asyncio.run(room.approve_task("lead", "TASK-001", ctx))
+    assert "Sent back" in asyncio.run(room.reject_verification("v", "TASK-001", "broken", ctx))
+    asyncio.run(room.submit_for_review("a", "TASK-001", "fixed", ctx))
+    asyncio.run(room.approve_task("lead", "TASK-001", ctx))
+
+    for kwargs in ({}, {"project": "web", "agent": "a"}):
+        metrics = _metrics(room, **kwargs)
+        assert metrics["throughput"]["completed"] == 1
+        assert metrics["states"]["completed"]["entered"] == 2
+        assert metrics["cycle_time"]["count"] == 1
+
+
+def test_filtered_metrics_read_task_events_through_an_index(room, monkeypatch):
+    plans = []
+
+    class Explaining:
+        def __init__(self, conn):
+            self.conn = conn
+
+        def execute(self, sql, params=()):
+            plans.append(" ".join(r[3] for r in self.conn.execute("EXPLAIN QUERY PLAN " + sql, params)))
+            return self.conn.execute(sql, params)
+
+    read = room._db.read
+
+    async def explaining_read(fn, *args):
+        return await read(lambda conn: fn(Explaining(conn), *args))
+
+    monkeypatch.setattr(room._db, "read", explaining_read)
+    for kwargs in ({}, {"project": "web"}, {"agent": "a"}, {"role_hat": "coder"},
+                   {"project": "web", "agent": "a"}, {"since": "2026-01-01"}, {"role_hat": "coder", "since": "2026-01-01"}):
+        plans.clear()
+        _metrics(room, **kwargs)
+        assert len(plans) == 3 and not any("SCAN e" in plan for plan in plans), (kwargs, plans)
+
+
+def test_percentiles_cover_the_recent_window(room, monkeypatch):
+    ctx = FakeContext()
+    asyncio.run(room.register("lead", ctx, role="lead"))
+    asyncio.run(room.register("a", ctx, role="coder"))
+    asyncio.run(room.create_task("lead", "old", ctx, assigned_to="a"))
+    asyncio.run(room.check_inbox("a", ctx))
+    asyncio.run(room.update_task("a", "TASK-001", ctx, status="in_progress"))
+    asyncio.run(room._db.write(lambda conn: conn.execute("UPDATE task_events SET at = '2000-01-01T00:00:00'")))
+
+    metrics = _metrics(room)
+    assert metrics["states"]["assigned"]["exited"] == 1      # totals cover all history
+    assert "p50_s" not in metrics["states"]["assigned"]      # percentiles only the window
+    assert metrics["percentiles_since"] > "2000"
+    monkeypatch.setattr(room, "METRICS_WINDOW_DAYS", 0)
+    metrics = _metrics(room)
+    assert metrics["percentiles_since"] is None and metrics["states"]["assigned"]["p50_s"] is not None
@@ -0,0 +1,67 @@
+"""Tests for wait_for_messages, the long-poll alternative to polling check_inbox."""
+
+import asyncio
+import json
+import time
+
+from conftest import FakeContext
+
+
+def _room(room):
+    ctx = FakeContext()
+    for name in ("a", "b"):
+        asyncio.run(room.register(name, ctx, role="coder"))
+    return ctx
+
+
+def _contents(response):
+    return [m["content"] for m in json.loads(response)["messages"]]
+
+
+def test_returns_waiting_mail_at_once(room):
+    ctx = _room(room)
+    asyncio.run(room.send("a", "b", "already here", ctx))
+    started = time.perf_counter()
+    assert _contents(asyncio.run(room.wait_for_messages("b", ctx, timeout=5))) == ["already here"]
+    assert time.perf_counter() - started < 1
+
+
+def test_times_out_empty(room):
+    ctx = _room(room)
+    assert _contents(asyncio.run(room.wait_for_messages("b", ctx, timeout=0.05))) == []
+    assert room._inbox_waiters == {}
+
+
+def test_wakes_when_mail_is_sent(room):
+    ctx = _room(room)
+
+    async def scenario():
+        waiter = asyncio.create_task(room.wait_for_messages("b", ctx, timeout=5))
+        await asyncio.sleep(0.05)
+        assert "b" in room._inbox_waiters
+        await room.send("a", "b", "direct", ctx)
+        started = time.perf_counter()
+        response = await waiter
+        return response, time.perf_counter() - started
+
+    response, latency = asyncio.run(scenario())
+    assert _contents(response) == ["direct"]
+    assert latency < 0.5
+
+
+def test_broadcasts_wake_every_waiter_but_the_sender(room):
+    ctx = _room(room)
+
+    async def scenario():
+        a_wait = asyncio.create_task(room.wait_for_messages("a", ctx, timeout=5))
+        b_wait = asyncio.create_task(room.wait_for_messages("b", ctx, timeout=5))
+        await asyncio.sleep(0.05)
+        await room.send("a", "all", "standup", ctx)
+        response = await asyncio.wait_for(b_wait, 1)
+        a_still_waiting = not a_wait.done()
+        a_wait.cancel()
+        return response, a_still_waiting
+
+    response, a_still_waiting = asyncio.run(scenario())
+    assert _contents(response) == ["standup"]
+    assert a_still_waiting
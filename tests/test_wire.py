@@ -0,0 +1,44 @@
+"""Tests for dead_drop.wire — compact tool responses and field projection."""
+
+import asyncio
+import json
+
+from dead_drop import wire
+from conftest import FakeContext
+
+ROWS = [
+    {"id": 1, "from_agent": "a", "content": "hi", "task_id": None, "cc_original_to": None},
+    {"id": 2, "from_agent": "b", "content": "yo", "task_id": "TASK-001", "cc_original_to": None},
+]
+
+
+def test_compact_drops_nulls_and_whitespace(monkeypatch):
+    monkeypatch.setattr(wire, "COMPACT", True)
+    text = wire.encode("t", wire.rows(ROWS))
+    assert text == '[{"id":1,"from_agent":"a","content":"hi"},{"id":2,"from_agent":"b","content":"yo","task_id":"TASK-001"}]'
+
+
+def test_pretty_keeps_the_old_output(monkeypatch):
+    monkeypatch.setattr(wire, "COMPACT", False)
+    assert wire.encode("t", wire.rows(ROWS)) == json.dumps(ROWS, indent=2)
+
+
+def test_fields_project_in_the_requested_order(monkeypatch):
+    monkeypatch.setattr(wire, "COMPACT", True)
+    shaped = wire.rows(ROWS, "content, id,nonexistent")
+    assert [list(r) for r in shaped] == [["content", "id"], ["content", "id"]]
+
+
+def test_stats_count_bytes_per_tool():
+    before = wire.stats()["tools"].get("stats-test", {"responses": 0, "bytes": 0})
+    text = wire.encode("stats-test", {"k": "é"})
+    after = wire.stats()["tools"]["stats-test"]
+    assert after["responses"] == before["responses"] + 1
+    assert after["bytes"] - before["bytes"] == len(text.encode("utf-8"))
+
+
+def test_tools_accept_fields(room):
+    ctx = FakeContext()
+    asyncio.run(room.register("a", ctx, role="coder"))
+    agents = json.loads(asyncio.run(room.who(fields="name,role")))
+    assert agents == [{"name": "a", "role": "coder"}]